@@ -0,0 +1,4 @@
+"""Synthetic media trees and timed scenarios for the download processors.
+
+Run from the repository root with ``python -m benchmarks --scale small``.
+"""
@@ -0,0 +1,168 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from completed_downloads_manager import MovieProcessor, TVShowProcessor, delete_expired_downloads  # noqa: E402
+from config_handler import Config  # noqa: E402
+from move_engine import MoveEngine  # noqa: E402
+from operations_journal import OperationsJournal  # noqa: E402
+from purge_engine import PurgeEngine  # noqa: E402
+from run_state import RunState  # noqa: E402
+
+from benchmarks.syscall_counter import SyscallCounter  # noqa: E402
+from benchmarks.tree_generator import MediaTreeGenerator  # noqa: E402
+
+SCALES = {
+    'small': dict(movie_releases=100, tv_releases=200, library_movies=500, library_shows=200,
+                  seasons_per_show=3, episodes_per_season=8),
+    'medium': dict(movie_releases=200, tv_releases=500, library_movies=2000, library_shows=1000,
+                   seasons_per_show=4, episodes_per_season=10),
+    'large': dict(movie_releases=1000, tv_releases=2500, library_movies=10000, library_shows=5000,
+                  seasons_per_show=6, episodes_per_season=12),
+}
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# Slowdowns smaller than this are timer noise, whatever the relative change.
+MIN_SLOWDOWN_SECONDS = 0.005
+
+
+class PhaseTimer:
+    """Record wall time and filesystem calls of a named phase into results."""
+
+    def __init__(self, counter, results):
+        self.counter = counter
+        self.results = results
+
+    def __call__(self, phase):
+        self.phase = phase
+        return self
+
+    def __enter__(self):
+        self.before = self.counter.snapshot()
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.started
+        calls = self.counter.snapshot()
+        calls.subtract(self.before)
+        self.results[self.phase] = (seconds, {name: count for name, count in calls.items() if count})
+
+
+def run_scenario(root, scale, seed):
+    """Generate a tree and run a cold and a warm pass over it, returning {phase: (seconds, call counts)}."""
+    generator = MediaTreeGenerator(root, seed=seed, **SCALES[scale])
+    results = {}
+    with SyscallCounter() as counter:
+        measure = PhaseTimer(counter, results)
+        with measure('generate'):
+            generator.generate()
+        config = Config.from_dict(generator.config())
+        for run in ('cold', 'warm'):
+            move_engine = MoveEngine.from_config(config)
+            journal = OperationsJournal.from_config(config)
+            purge_engine = PurgeEngine.from_config(config)
+            run_state = RunState.from_config(config)
+            movie_processor = MovieProcessor(config, move_engine, journal=journal, purge_engine=purge_engine,
+                                             run_state=run_state)
+            tv_show_processor = TVShowProcessor(config, move_engine=move_engine, journal=journal,
+                                                purge_engine=purge_engine, run_state=run_state)
+            with measure(f'{run}.plan'):
+                movie_processor.process_downloaded_movies(dry_run=True)
+                tv_show_processor.process_downloaded_tv_shows(dry_run=True)
+            with measure(f'{run}.movies'):
+                movie_processor.process_downloaded_movies()
+            with measure(f'{run}.tv_shows'):
+                tv_show_processor.process_downloaded_tv_shows()
+            with measure(f'{run}.retention'):
+                delete_expired_downloads(config, journal=journal, purge_engine=purge_engine, run_state=run_state)
+            with measure(f'{run}.purge'):
+                purge_engine.wait()
+            purge_engine.shutdown()
+            move_engine.shutdown()
+            journal.end_run()
+            run_state.save()
+    return results
+
+
+def summarize(runs):
+    """Combine repeated runs, taking the median wall time and the call counts of the first run."""
+    summary = {}
+    for phase in runs[0]:
+        summary[phase] = {'seconds': round(statistics.median(run[phase][0] for run in runs), 4),
+                          'calls': dict(sorted(runs[0][phase][1].items()))}
+    return summary
+
+
+def compare(summary, baseline, tolerance):
+    """Print each phase next to the baseline and return the phases that regressed."""
+    regressions = []
+    print(f"{'phase':<16} {'seconds':>9} {'baseline':>9} {'change':>8} {'calls':>8} {'baseline':>9}")
+    for phase, result in summary.items():
+        calls = sum(result['calls'].values())
+        base = baseline.get(phase)
+        if not base:
+            print(f"{phase:<16} {result['seconds']:>9.3f} {'-':>9} {'-':>8} {calls:>8} {'-':>9}")
+            continue
+        base_calls = sum(base['calls'].values())
+        change = (result['seconds'] - base['seconds']) / base['seconds'] if base['seconds'] else 0.0
+        flag = ''
+        slower = change > tolerance and result['seconds'] - base['seconds'] > MIN_SLOWDOWN_SECONDS
+        if phase != 'generate' and (slower or calls > base_calls):
+            regressions.append(phase)
+            flag = '  REGRESSION'
+        print(f"{phase:<16} {result['seconds']:>9.3f} {base['seconds']:>9.3f} {change:>+8.0%} {calls:>8} "
+              f"{base_calls:>9}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the processors against a synthetic media tree.')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--root', help='directory to build the tree in, e.g. /dev/shm (default: a temp dir)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per scenario, the median time is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline results to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown against the baseline before a phase counts as a regression')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    runs = []
+    for _ in range(args.repeat):
+        root = tempfile.mkdtemp(prefix='media_bench_', dir=args.root)
+        try:
+            runs.append(run_scenario(root, args.scale, args.seed))
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+    summary = summarize(runs)
+
+    baselines = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baselines = json.load(file)
+    regressions = compare(summary, baselines.get(args.scale, {}), args.tolerance)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(summary, file, indent=2)
+    if args.save_baseline:
+        baselines[args.scale] = summary
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+        print(f"Saved the {args.scale} baseline to {args.baseline}")
+    elif regressions:
+        print(f"Regressions in: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+import os
+import shutil
+import threading
+from collections import Counter
+
+COUNTED_CALLS = {
+    os: ['scandir', 'listdir', 'stat', 'lstat', 'rename', 'replace', 'mkdir', 'rmdir', 'remove', 'unlink', 'link',
+         'utime', 'open'],
+    shutil: ['rmtree', 'move', 'copy2', 'copytree'],
+}
+
+
+class SyscallCounter:
+    """Count filesystem calls made through the os and shutil modules while active.
+
+    This counts the Python level calls rather than the kernel's syscalls, which is what our
+    code controls and is stable between machines. Helpers such as os.path.exists are counted
+    through the os.stat they make. DirEntry.stat from scandir bypasses os.stat and is not
+    counted.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.originals = []
+
+    def __enter__(self):
+        for module, names in COUNTED_CALLS.items():
+            for name in names:
+                original = getattr(module, name)
+                self.originals.append((module, name, original))
+                setattr(module, name, self._wrap(f"{module.__name__}.{name}", original))
+        return self
+
+    def __exit__(self, *exc_info):
+        for module, name, original in reversed(self.originals):
+            setattr(module, name, original)
+        self.originals = []
+
+    def _wrap(self, label, original):
+        def counted(*args, **kwargs):
+            with self.lock:
+                self.counts[label] += 1
+            return original(*args, **kwargs)
+        return counted
+
+    def snapshot(self):
+        with self.lock:
+            return Counter(self.counts)
@@ -0,0 +1,195 @@
+import os
+import random
+import time
+
+TITLE_WORDS = ['The', 'Last', 'Night', 'Dark', 'House', 'River', 'Blue', 'City', 'Secret', 'Lost', 'Star', 'Black',
+               'Summer', 'Winter', 'King', 'Queen', 'Storm', 'Iron', 'Silent', 'Wild', 'Golden', 'Deep', 'Ghost',
+               'Empire', 'Shadow', 'Paradise', 'Hunter', 'Garden', 'Island', 'Mountain', 'Crown', 'Fire', 'Glass']
+QUALITIES = ['720p', '1080p', '2160p', '480p']
+SOURCES = ['WEB-DL', 'WEBRip', 'BluRay', 'HDTV', 'AMZN.WEB-DL', 'NF.WEB-DL', 'DVDRip']
+CODECS = ['x264', 'x265', 'H.264', 'HEVC', 'AV1']
+GROUPS = ['NTb', 'FLUX', 'SPARKS', 'GalaxyTV', 'RARBG', 'EDITH', 'CAKES', 'SuccessfulCrab', 'MiNX']
+COUNTRIES = ['US', 'UK', 'AU']
+
+
+class MediaTreeGenerator:
+    """Build a synthetic download and library tree that looks like a real media server.
+
+    Release folders get scene-style names in the spellings seen in practice (dotted, spaced,
+    bracketed, lower case, country tagged), a share of _FAILED_ and _UNPACK_ folders, and
+    releases that duplicate something already in the library. Everything is derived from
+    the seed so two trees built with the same settings are identical.
+    """
+
+    def __init__(self, root, seed=0, movie_releases=200, tv_releases=500, library_movies=2000,
+                 library_shows=1000, seasons_per_show=4, episodes_per_season=10, failed_ratio=0.05,
+                 unpack_ratio=0.05, duplicate_ratio=0.2, expired_ratio=0.1, file_size=0):
+        self.root = root
+        self.random = random.Random(seed)
+        self.movie_releases = movie_releases
+        self.tv_releases = tv_releases
+        self.library_movies = library_movies
+        self.library_shows = library_shows
+        self.seasons_per_show = seasons_per_show
+        self.episodes_per_season = episodes_per_season
+        self.failed_ratio = failed_ratio
+        self.unpack_ratio = unpack_ratio
+        self.duplicate_ratio = duplicate_ratio
+        self.expired_ratio = expired_ratio
+        self.file_size = file_size
+        self.payload = b'\0' * file_size
+        self.show_titles = []
+        self.movie_titles = []
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def config(self):
+        """Return a config dict for the processors pointing at the generated tree."""
+        return {
+            'download_directories': {
+                'complete': {'movies': self.path('downloads', 'complete', 'movies'),
+                             'tv_shows': self.path('downloads', 'complete', 'tv_shows')},
+                'duplicate': {'movies': self.path('downloads', 'duplicate', 'movies'),
+                              'tv_shows': self.path('downloads', 'duplicate', 'tv_shows')},
+                'incomplete': {'movies': self.path('downloads', 'incomplete', 'movies'),
+                               'tv_shows': self.path('downloads', 'incomplete', 'tv_shows')},
+            },
+            'media_libraries': {
+                'movies': self.path('media', 'movies'),
+                'tv_shows': {'adult': self.path('media', 'tv_shows', 'adult'),
+                             'kids': self.path('media', 'tv_shows', 'kids')},
+            },
+            'logging': {'level': 'WARNING', 'file': self.path('logs', 'app.log')},
+            'settings': {
+                'move_engine': {'max_workers': 4, 'max_concurrent_per_device': 2, 'progress_interval': 10},
+                'duplicates': {'identical_action': 'keep', 'fingerprint_cache': self.path('cache', 'fingerprints.json')},
+                'journal': {'path': self.path('journal', 'operations.jsonl'), 'batch_size': 100},
+                'run_state': {'path': self.path('cache', 'run_state.json')},
+                'movies': {'delete_failed': True, 'delete_unpack': True, 'days_to_keep_completed_downloads': 30,
+                           'days_to_keep_duplicate_downloads': 30, 'days_to_keep_incomplete_downloads': 30,
+                           'move_to_duplicates': True, 'move_to_library': True,
+                           'library_catalog_cache': self.path('cache', 'movie_library_catalog.json')},
+                'tv_shows': {'delete_failed': True, 'delete_unpack': True, 'days_to_keep_unpack': 2,
+                             'days_to_keep_completed_downloads': 30, 'days_to_keep_duplicate_downloads': 30,
+                             'days_to_keep_incomplete_downloads': 30, 'move_to_duplicates': True,
+                             'move_to_library': True, 'library_index_cache': self.path('cache', 'tv_library_index.json')},
+            },
+        }
+
+    def generate(self):
+        """Create the whole tree and return the number of directories and files written."""
+        config = self.config()
+        for directory in [*config['download_directories']['complete'].values(),
+                          *config['download_directories']['duplicate'].values(),
+                          *config['download_directories']['incomplete'].values(),
+                          config['media_libraries']['movies'], *config['media_libraries']['tv_shows'].values()]:
+            os.makedirs(directory, exist_ok=True)
+        self.counts = {'directories': 0, 'files': 0}
+        self._generate_movie_library(config['media_libraries']['movies'])
+        self._generate_show_library(config['media_libraries']['tv_shows'])
+        self._generate_movie_releases(config['download_directories']['complete']['movies'])
+        self._generate_tv_releases(config['download_directories']['complete']['tv_shows'])
+        self._generate_expired(config['download_directories'])
+        return self.counts
+
+    def _title(self, words):
+        return ' '.join(self.random.choice(TITLE_WORDS) for _ in range(words))
+
+    def _unique_titles(self, count, min_words, max_words):
+        titles = set()
+        while len(titles) < count:
+            titles.add(self._title(self.random.randint(min_words, max_words)))
+        return sorted(titles)
+
+    def _make_folder(self, path, files, mtime=None):
+        os.makedirs(path, exist_ok=True)
+        self.counts['directories'] += 1
+        for name in files:
+            with open(os.path.join(path, name), 'wb') as file:
+                file.write(self.payload)
+            self.counts['files'] += 1
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def _generate_movie_library(self, library_path):
+        self.movie_titles = [(title, self.random.randint(1950, 2024))
+                             for title in self._unique_titles(self.library_movies, 1, 4)]
+        for title, year in self.movie_titles:
+            self._make_folder(os.path.join(library_path, f"{title} ({year})"), [f"{title} ({year}).mkv"])
+
+    def _generate_show_library(self, libraries):
+        self.show_titles = self._unique_titles(self.library_shows, 1, 3)
+        for index, title in enumerate(self.show_titles):
+            library_path = libraries['kids'] if index % 5 == 0 else libraries['adult']
+            for season in range(1, self.seasons_per_show + 1):
+                season_path = os.path.join(library_path, title, f"Season {season}")
+                self._make_folder(season_path, [])
+                for episode in range(1, self.episodes_per_season + 1):
+                    name = f"{title} S{season:02d}E{episode:02d}"
+                    self._make_folder(os.path.join(season_path, name), [f"{name}.mkv"])
+
+    def _scene_name(self, title, tag):
+        """Spell a release the way indexers do, in one of the common styles."""
+        quality, source = self.random.choice(QUALITIES), self.random.choice(SOURCES)
+        codec, group = self.random.choice(CODECS), self.random.choice(GROUPS)
+        style = self.random.random()
+        if style < 0.6:
+            return f"{title.replace(' ', '.')}.{tag}.{quality}.{source}.{codec}-{group}"
+        if style < 0.75:
+            return f"{title} {tag} {quality} {source} {codec}-{group}"
+        if style < 0.85:
+            return f"{title.replace(' ', '.').lower()}.{tag.lower()}.{quality}.{codec.lower()}-{group.lower()}"
+        if style < 0.95:
+            return f"[{group}] {title} - {tag} [{quality}]"
+        return f"{title.replace(' ', '.')}.{self.random.choice(COUNTRIES)}.{tag}.{quality}.{source}-{group}"
+
+    def _release_prefix(self):
+        roll = self.random.random()
+        if roll < self.failed_ratio:
+            return '_FAILED_'
+        if roll < self.failed_ratio + self.unpack_ratio:
+            return '_UNPACK_'
+        return ''
+
+    def _generate_movie_releases(self, downloads_path):
+        names = set()
+        while len(names) < self.movie_releases:
+            if self.movie_titles and self.random.random() < self.duplicate_ratio:
+                title, year = self.random.choice(self.movie_titles)
+            else:
+                title, year = self._title(self.random.randint(1, 4)), self.random.randint(1950, 2024)
+            name = self._release_prefix() + self._scene_name(title, str(year))
+            if self.random.random() < 0.1:
+                name = f"{title} ({year}) {self.random.choice(QUALITIES)}"
+            names.add(name)
+        old = time.time() - 3 * 86400
+        for name in sorted(names):
+            self._make_folder(os.path.join(downloads_path, name), ['movie.mkv', 'movie.nfo'],
+                              old if name.startswith('_UNPACK_') else None)
+
+    def _generate_tv_releases(self, downloads_path):
+        names = set()
+        while len(names) < self.tv_releases:
+            if self.show_titles and self.random.random() < 1 - self.duplicate_ratio:
+                title = self.random.choice(self.show_titles)
+            else:
+                title = self._title(self.random.randint(1, 3))
+            season = self.random.randint(1, self.seasons_per_show + 1)
+            episode = self.random.randint(1, self.episodes_per_season + 3)
+            names.add(self._release_prefix() + self._scene_name(title, f"S{season:02d}E{episode:02d}"))
+        old = time.time() - 3 * 86400
+        for name in sorted(names):
+            self._make_folder(os.path.join(downloads_path, name), ['episode.mkv', 'episode.nfo', 'sample.mkv'],
+                              old if name.startswith('_UNPACK_') else None)
+
+    def _generate_expired(self, download_directories):
+        """Leave some releases in the duplicate and incomplete folders past their retention period."""
+        expired = time.time() - 45 * 86400
+        count = int((self.movie_releases + self.tv_releases) * self.expired_ratio)
+        targets = [download_directories['duplicate']['movies'], download_directories['duplicate']['tv_shows'],
+                   download_directories['incomplete']['movies'], download_directories['incomplete']['tv_shows']]
+        for index in range(count):
+            name = self._scene_name(self._title(2), f"S01E{index % 99 + 1:02d}") + f".{index}"
+            self._make_folder(os.path.join(targets[index % len(targets)], name), ['episode.mkv'],
+                              expired if index % 2 == 0 else None)
@@ -1,314 +1,652 @@
+import argparse
 import logging
 import os
-import re
-import shutil
+import sys
 from datetime import datetime, timedelta
-import copy
 import fnmatch
-from config_handler import ConfigHandler, ShowNamesConfigHandler
+from config_handler import ConfigHandler, ConfigReloader, ShowNamesConfigHandler
 from logging_handler import LoggingHandler
 from directory_operations import DirectoryOperations
+from directory_scanner import DirectoryScanner
+from download_watcher import DownloadWatcher
+from library_index import LibraryIndex
+from media_fingerprint import MediaFingerprinter
+from media_prober import MediaProber
+from movie_catalog import MovieCatalog
+from move_engine import MoveEngine
+from operation_plan import Plan, PlanExecutor
+from operations_journal import OperationsJournal
+from pipeline_scheduler import PipelineScheduler
+from plex_notifier import PlexNotifier
+from purge_engine import PurgeEngine
+from release_parser import RELEASE_PARSER
+from run_state import RunState
+from run_metrics import METRICS
+from show_name_normalizer import ShowNameNormalizer
+from sonarr import SonarrSeriesIndex
 
 class MovieProcessor:
-    def __init__(self, config):
+    def __init__(self, config, move_engine=None, fingerprinter=None, journal=None, purge_engine=None,
+                 notifier=None, run_state=None, prober=None):
         self.config = config
-        self.completed_movies_downloads_path = config['download_directories']['complete']['movies']
-        self.duplicate_movies_downloads_path = config['download_directories']['duplicate']['movies']
-        self.incomplete_movie_downloads_path = config['download_directories']['incomplete']['movies']
-        self.days_to_keep_completed_movie_downloads = config['settings']['movies']['days_to_keep_completed_downloads']
-        self.days_to_keep_duplicate_movie_downloads = config['settings']['movies']['days_to_keep_duplicate_downloads']
-        self.days_to_keep_incomplete_movie_downloads = config['settings']['movies']['days_to_keep_incomplete_downloads']
-        self.move_to_duplicates_movies = config['settings']['movies']['move_to_duplicates']
-        self.move_to_library_movies = config['settings']['movies']['move_to_library']
-        self.movie_library = config['media_libraries']['movies']
-        self.delete_unpack_movies = config['settings']['movies']['delete_unpack']
-        self.delete_failed_movies = config['settings']['movies']['delete_failed']
+        self.notifier = notifier
+        self.run_state = run_state
+        self.move_engine = move_engine or MoveEngine.from_config(config)
+        self.journal = journal or OperationsJournal.from_config(config)
+        self.executor = PlanExecutor(self.move_engine, self.journal, purge_engine)
+        self.fingerprinter = fingerprinter or MediaFingerprinter.from_config(config)
+        self.prober = prober or MediaProber.from_config(config)
+        settings = config.settings.movies
+        self.identical_duplicate_action = config.settings.duplicates.identical_action
+        self.upgrade_library = config.settings.duplicates.upgrade_library
+        self.completed_movies_downloads_path = config.download_directories.complete.movies
+        self.duplicate_movies_downloads_path = config.download_directories.duplicate.movies
+        self.incomplete_movie_downloads_path = config.download_directories.incomplete.movies
+        self.days_to_keep_completed_movie_downloads = settings.days_to_keep_completed_downloads
+        self.days_to_keep_duplicate_movie_downloads = settings.days_to_keep_duplicate_downloads
+        self.days_to_keep_incomplete_movie_downloads = settings.days_to_keep_incomplete_downloads
+        self.move_to_duplicates_movies = settings.move_to_duplicates
+        self.move_to_library_movies = settings.move_to_library
+        self.movie_library = config.media_libraries.movies
+        self.delete_unpack_movies = settings.delete_unpack
+        self.delete_failed_movies = settings.delete_failed
+        self.library_catalog_cache = settings.library_catalog_cache
+        self.catalog = None
 
     def clean_movie_directory_name(self, original_directory_path):
         """Clean and format the folder name to 'movie_name (year)' format."""
-        logging.debug(f"Cleaning directory name: {original_directory_path}")
+        logging.debug("Cleaning directory name: %s", original_directory_path)
 
         original_directory_name = os.path.basename(original_directory_path)
-        regex = re.compile(r"^(?P<title>.*?)(?:\s|\.|\()?(?P<year>[12][0-9]{3})(?:\D.*)?$")
-        re_match = regex.match(original_directory_name)
+        release = RELEASE_PARSER.parse(original_directory_name)
 
-        if re_match:
-            title = re_match.group('title').strip().replace(".", " ").replace(")", "").replace("(", "")
-            year = re_match.group('year')
-            cleaned_directory_name = f"{title} ({year})"
-            logging.debug(f"Cleaned directory name: {cleaned_directory_name}")
+        if release is not None and release.year is not None:
+            title = release.title.strip().replace(".", " ").replace(")", "").replace("(", "")
+            cleaned_directory_name = f"{title} ({release.year})"
+            logging.debug("Cleaned directory name: %s", cleaned_directory_name)
 
             if cleaned_directory_name.lower() == original_directory_name.lower():
-                logging.debug(f"Cleaned directory name: {cleaned_directory_name} is the same as: {original_directory_name}")
+                logging.debug("Cleaned directory name: %s is the same as: %s",
+                              cleaned_directory_name, original_directory_name)
             return cleaned_directory_name
 
         else:
-            logging.error(f"Year not found in folder name: {original_directory_path}. Skipping rename.")
+            logging.error("Year not found in folder name: %s. Skipping rename.", original_directory_path)
             return None
 
-    def process_downloaded_movies(self):
-        """Process all movie folders."""
-        logging.info(f"Starting processing completed movies downloads directory")
-        directory_paths = DirectoryOperations.get_directories(self.completed_movies_downloads_path)
-        for directory_path in directory_paths:
+    def process_downloaded_movies(self, dry_run=False):
+        """Process all movie folders, returning the plan that was (or, for a dry run, would be) applied."""
+        logging.info("Starting processing completed movies downloads directory")
+        with METRICS.phase('movies.plan'):
+            plan = self.plan_downloaded_movies(Plan())
+        if not dry_run:
+            with METRICS.phase('movies.execute'):
+                self.execute(plan)
+            if self.catalog:
+                self.catalog.save()
+        elif self.run_state:
+            self.run_state.discard()
+        self.fingerprinter.save()
+        self.prober.save()
+        logging.info("Completed processing completed downloads directory.")
+        return plan
+
+    def execute(self, plan):
+        """Apply a plan and queue Plex refreshes for the movie folders it moved into the library."""
+        failed_paths = self.executor.execute(plan)
+        if self.catalog:
+            self.catalog.sync(failed_paths)
+        if self.run_state:
+            self.run_state.commit()
+        if self.notifier:
+            self.notifier.collect(plan, [self.movie_library], failed_paths)
+
+    def get_catalog(self, refresh=True):
+        """Return the movie library catalog, built anew for a full run and reused between watched folders."""
+        if refresh or self.catalog is None:
+            with METRICS.phase('movies.catalog'):
+                self.catalog = MovieCatalog.load_or_build(self.movie_library, self.library_catalog_cache)
+        else:
+            self.catalog.refresh()
+        return self.catalog
+
+    def plan_downloaded_movies(self, plan):
+        """Add the operations for every movie folder to the plan."""
+        with METRICS.phase('movies.scan'):
+            entries = DirectoryOperations.scan_directories(self.completed_movies_downloads_path)
+        if self.move_to_library_movies and entries:
+            self.get_catalog()
+        for entry in entries:
+            if self.run_state and self.run_state.decision(entry):
+                continue
+            self.record_decision(entry, self.plan_movie_directory(entry, plan))
+        return plan
+
+    def record_decision(self, entry, new_directory_path):
+        """Remember where the plan leaves a movie folder, unless that depends on what the library holds."""
+        if not self.run_state:
+            return
+        release = RELEASE_PARSER.parse(entry.name)
+        if not self.move_to_library_movies or release is None or release.year is None:
+            self.run_state.plan(entry, new_directory_path)
+
+    def process_movie_directory(self, entry):
+        """Process a single movie folder scan entry, returning its new path or None if it was skipped."""
+        plan = Plan()
+        if self.move_to_library_movies:
+            self.get_catalog(refresh=False)
+        new_directory_path = self.plan_movie_directory(entry, plan)
+        self.record_decision(entry, new_directory_path)
+        self.execute(plan)
+        if self.catalog:
+            self.catalog.save()
+        self.fingerprinter.save()
+        self.prober.save()
+        return new_directory_path
+
+    def plan_movie_directory(self, entry, plan):
+        """Add the operations for a single movie folder to the plan, returning its planned path."""
+        directory_path = entry.path
+        with METRICS.phase('movies.clean_names'):
             cleaned_name = self.clean_movie_directory_name(directory_path)
 
-            # Skip processing if cleaned_name is None
-            if cleaned_name is None:
-                logging.info(f"Skipping directory '{directory_path}' due to invalid naming format.")
-                continue
+        # Skip processing if cleaned_name is None
+        if cleaned_name is None:
+            logging.info("Skipping directory '%s' due to invalid naming format.", directory_path)
+            return None
 
-            new_directory_path = None
-            if self.move_to_library_movies:
-                temp_directory_path = os.path.join(self.movie_library, cleaned_name)
-                if not os.path.isdir(temp_directory_path):
-                    new_directory_path = temp_directory_path
-                    logging.info(f"Moving '{cleaned_name}' to '{temp_directory_path}'")
-                    DirectoryOperations.rename_directory(directory_path, new_directory_path)
-                else:
-                    logging.info(f"'{cleaned_name}' already exists in '{self.movie_library}'")
-            if self.move_to_duplicates_movies and new_directory_path is None:
-                temp_directory_path = os.path.join(self.duplicate_movies_downloads_path, cleaned_name)
-                count = 1
-                while os.path.exists(temp_directory_path):
-                    temp_directory_path = os.path.join(self.duplicate_movies_downloads_path,
-                                                       f"{cleaned_name} ({count})")
-                    count += 1
-                new_directory_path = temp_directory_path
-                logging.info(f"Moving '{cleaned_name}' to '{new_directory_path}'")
-                DirectoryOperations.rename_directory(directory_path, new_directory_path)
-            if not self.move_to_library_movies and not self.move_to_duplicates_movies and new_directory_path is None:
-                temp_directory_path = os.path.join(self.completed_movies_downloads_path, cleaned_name)
-                count = 1
-                while os.path.exists(temp_directory_path):
-                    temp_directory_path = os.path.join(self.completed_movies_downloads_path,
-                                                       f"{cleaned_name} ({count})")
-                    count += 1
-                new_directory_path = temp_directory_path
-                logging.info(f"Renaming '{directory_path}' to '{new_directory_path}'")
-                DirectoryOperations.rename_directory(directory_path, new_directory_path)
-        logging.info(f"Completed processing completed downloads directory.")
+        if self.move_to_library_movies:
+            library_name = self.catalog.find(cleaned_name)
+            if library_name is None:
+                new_directory_path = os.path.join(self.movie_library, cleaned_name)
+                plan.add('rename', directory_path, new_directory_path, 'new movie')
+                self.catalog.add(cleaned_name)
+                return new_directory_path
+            if library_name == cleaned_name:
+                logging.info("'%s' already exists in '%s'", cleaned_name, self.movie_library)
+            else:
+                logging.info("'%s' already exists in '%s' as '%s'", cleaned_name, self.movie_library, library_name)
+            library_path = os.path.join(self.movie_library, library_name)
+            new_directory_path = plan_identical_duplicate(plan, self.fingerprinter, self.identical_duplicate_action,
+                                                          directory_path, [library_path],
+                                                          self.duplicate_movies_downloads_path, cleaned_name)
+            if new_directory_path is False and self.upgrade_library:
+                new_directory_path = self.plan_movie_upgrade(directory_path, library_path, cleaned_name, plan)
+            if new_directory_path is not False:
+                return new_directory_path
+        if self.move_to_duplicates_movies:
+            unique_name = plan.snapshot(self.duplicate_movies_downloads_path).unique_name(cleaned_name)
+            new_directory_path = os.path.join(self.duplicate_movies_downloads_path, unique_name)
+            plan.add('rename', directory_path, new_directory_path, 'duplicate movie')
+            return new_directory_path
+        if not self.move_to_library_movies:
+            if cleaned_name == entry.name:
+                return directory_path
+            unique_name = plan.snapshot(self.completed_movies_downloads_path).unique_name(cleaned_name)
+            new_directory_path = os.path.join(self.completed_movies_downloads_path, unique_name)
+            plan.add('rename', directory_path, new_directory_path, 'clean name')
+            return new_directory_path
+        return None
+
+    def plan_movie_upgrade(self, directory_path, library_path, cleaned_name, plan):
+        """Plan replacing the movie file of a library folder with a better release, returning the new path or False.
+
+        Only the movie file is swapped, the subtitles, nfo and artwork of the library folder stay.
+        The replaced file and what is left of the release folder are moved to duplicates.
+        """
+        try:
+            library_file = self.prober.main_file(library_path)
+            release_file = self.prober.main_file(directory_path)
+            if not library_file or not release_file or \
+                    not self.prober.is_upgrade(directory_path, [library_file[0]]):
+                return False
+        except OSError as e:
+            logging.warning("Unable to probe '%s': %s", directory_path, e)
+            return False
+        duplicates = plan.snapshot(self.duplicate_movies_downloads_path)
+        parked_directory = os.path.join(self.duplicate_movies_downloads_path,
+                                        duplicates.unique_name(os.path.basename(library_path)))
+        plan.add('mkdir', parked_directory, reason='replaced by a better release')
+        parked_path = os.path.join(parked_directory, os.path.basename(library_file[0]))
+        plan.add('rename', library_file[0], parked_path, 'replaced by a better release')
+        new_file_path = os.path.join(library_path, os.path.basename(release_file[0]))
+        plan.add('rename', release_file[0], new_file_path, 'better than the library copy', {'after': [parked_path]})
+        new_directory_path = os.path.join(self.duplicate_movies_downloads_path, duplicates.unique_name(cleaned_name))
+        plan.add('rename', directory_path, new_directory_path, 'left over from a library upgrade',
+                 {'after': [new_file_path]})
+        return new_directory_path
 
 
 class TVShowProcessor:
-    def __init__(self, config):
+    def __init__(self, config, show_name_normalizer=None, move_engine=None, fingerprinter=None, journal=None,
+                 purge_engine=None, series_index=None, notifier=None, run_state=None, prober=None):
         self.config = config
-        self.move_to_duplicates_tv = config['settings']['tv_shows']['move_to_duplicates']
-        self.move_to_library_tv = config['settings']['tv_shows']['move_to_library']
-        self.completed_tv_shows_downloads_path = config['download_directories']['complete']['tv_shows']
-        self.duplicate_tv_shows_downloads_path = config['download_directories']['duplicate']['tv_shows']
-        self.kids_tv_shows_library = config['media_libraries']['tv_shows']['kids']
-        self.adult_tv_shows_library = config['media_libraries']['tv_shows']['adult']
-        self.delete_unpack_tv = config['settings']['tv_shows']['delete_unpack']
-        self.delete_failed_tv = config['settings']['tv_shows']['delete_failed']
-        self.days_to_keep_unpack_tv = config['settings']['tv_shows']['days_to_keep_unpack']
+        self.notifier = notifier
+        self.run_state = run_state
+        self.series_index = series_index or SonarrSeriesIndex.from_config(config)
+        self.move_engine = move_engine or MoveEngine.from_config(config)
+        self.journal = journal or OperationsJournal.from_config(config)
+        self.executor = PlanExecutor(self.move_engine, self.journal, purge_engine)
+        self.fingerprinter = fingerprinter or MediaFingerprinter.from_config(config)
+        self.prober = prober or MediaProber.from_config(config)
+        settings = config.settings.tv_shows
+        self.identical_duplicate_action = config.settings.duplicates.identical_action
+        self.upgrade_library = config.settings.duplicates.upgrade_library
+        self.show_name_normalizer = show_name_normalizer or ShowNameNormalizer()
+        self.move_to_duplicates_tv = settings.move_to_duplicates
+        self.move_to_library_tv = settings.move_to_library
+        self.completed_tv_shows_downloads_path = config.download_directories.complete.tv_shows
+        self.duplicate_tv_shows_downloads_path = config.download_directories.duplicate.tv_shows
+        self.kids_tv_shows_library = config.media_libraries.tv_shows.kids
+        self.adult_tv_shows_library = config.media_libraries.tv_shows.adult
+        self.delete_unpack_tv = settings.delete_unpack
+        self.delete_failed_tv = settings.delete_failed
+        self.days_to_keep_unpack_tv = settings.days_to_keep_unpack
+        self.library_index_cache = settings.library_index_cache
+        self.show_match_threshold = settings.show_match_threshold
+        self.library_index = None
+        # Episodes planned into the library by destination path, until the plan ran.
+        self.planned_episodes = {}
+        self.touched_seasons = set()
 
     def clean_tv_show_directory_name(self, original_directory_path):
         """Clean and format the folder name to 'tv show name S00E00' format."""
-        logging.debug(f"Cleaning directory name: {original_directory_path}")
+        logging.debug("Cleaning directory name: %s", original_directory_path)
         original_directory_name = os.path.basename(original_directory_path)
 
-        regex = re.compile(r'^(.*?)(S\d{2})(E\d{2}).*$', re.IGNORECASE)
-
-        re_match = regex.match(original_directory_name)
-
-        # Dictionary containing regex patterns and their corresponding replace characters
-        show_name_replace_patterns = {
-            r'(?<=\w)\.(?=\w)': ' ',  # Replace periods between words with spaces
-            r'\.-\.': '',  # Replace .-. with nothing
-            r'^\s+': '',  # Replace leading spaces with nothing
-            r'\.\s*$': '',  # Replace a trailing period and possible trailing spaces with nothing
-            r'\s*\[.*?\]\s*': '',  # Replace anything inside square brackets with nothing
-            r'The 1 Percent Club': 'The 1% Club',  # Fix the 1% club shows
-            r'John Mulaney Presents Everybodys in L A': 'John Mulaney Presents - Everybody’s in L.A',  # Fix the Everybody’s in L.A show
-            r'C S I $': 'CSI - ',  # Fix CSI shows
-            r' AU$': ' (AU)',  # Replace trailing ' AU' with ' (AU)'
-            r' US$': ' (US)'  # Replace trailing ' US' with ' (US)'
-        }
-
-        if re_match:
-            show_name = re_match.group(1).strip()
-            original_show_name = copy.deepcopy(show_name)
-            season = re_match.group(2)
-            episode = re_match.group(3)
-
-            # Apply each replace pattern to the show name
-            for regex, replace_char in show_name_replace_patterns.items():
-                show_name = re.sub(regex, replace_char, show_name)
-            cleaned_episode_name = f'{show_name} {season}{episode}'
+        release = RELEASE_PARSER.parse(original_directory_name)
+
+        if release is not None and (release.episodes or release.air_date):
+            show_name = self.show_name_normalizer.normalize(release.title)
+            if self.series_index:
+                show_name = self.series_index.resolve(show_name) or show_name
+            cleaned_episode_name = f'{show_name} {RELEASE_PARSER.episode_tag(release)}'
 
             if original_directory_path == os.path.join(os.path.dirname(original_directory_path), cleaned_episode_name):
-                logging.info(f"Original directory name: {original_directory_path} is the same as: {cleaned_episode_name}")
+                logging.info("Original directory name: %s is the same as: %s",
+                             original_directory_path, cleaned_episode_name)
                 return None
 
             return cleaned_episode_name
 
         else:
-            logging.warning(f"No show name found in '{original_directory_path}'. Skipping rename.")
+            logging.warning("No show name found in '%s'. Skipping rename.", original_directory_path)
             return None
 
     def rename_tv_show_files(self, original_directory_path, new_episode_name):
         """Rename all files within the directory to the new episode name, preserving their extensions."""
-        log_entries = []
-
-        try:
-            # Iterate through all files in the directory
-            for filename in os.listdir(original_directory_path):
-                # Skip the .renamed file
-                if filename == '.renamed':
-                    continue
-                old_file_path = os.path.join(original_directory_path, filename)
-                if os.path.isfile(old_file_path):
-                    file_extension = os.path.splitext(filename)[1]
-                    new_file_name = new_episode_name + file_extension
-                    new_file_path = os.path.join(original_directory_path, new_file_name)
-                    DirectoryOperations.rename_file(old_file_path, new_file_path)
-
-                    # Collect log entries
-                    log_entries.append(f"original name: {os.path.basename(old_file_path)}")
-                    log_entries.append(f"new name: {new_file_name}")
-
-            # Write log entries to the .renamed file at the end
-            if log_entries:
-                renamed_file_path = os.path.join(original_directory_path, '.renamed')
-                with open(renamed_file_path, 'a') as f:
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    f.write(f"Timestamp: {timestamp}\n")
-                    for entry in log_entries:
-                        f.write(entry + '\n')
-                    f.write('\n')  # Add an extra newline for separation between different renaming operations
-        except Exception as e:
-            logging.error(f"Error while renaming files: {e}")
-
-    def process_downloaded_tv_shows(self):
-        """Process all tv show folders."""
-        logging.info(f"Starting processing completed tv show downloads directory")
-
-        if self.move_to_library_tv:
-            logging.info(f"Getting all existing tv show folders")
-            adult_shows = os.listdir(self.adult_tv_shows_library)
-            kids_shows = os.listdir(self.kids_tv_shows_library)
-
-        directory_paths = DirectoryOperations.get_directories(self.completed_tv_shows_downloads_path)
-        for directory_path in directory_paths:
-
-            if "_FAILED_" in directory_path:
-                if self.delete_failed_tv:
-                    try:
-                        shutil.rmtree(directory_path)
-                        logging.info(f"Deleted _FAILED_ tv show download: {directory_path}")
-                    except Exception as e:
-                        logging.error(f"Unable to delete _FAILED_ tv show download: {e}", exc_info=True)
-                else:
-                    logging.info(f"Skipping _FAILED_ tv show download: {directory_path}")
-                continue
-
-            if "_UNPACK_" in directory_path:
-                if self.delete_unpack_tv:
-                    cutoff_date = datetime.now() - timedelta(self.days_to_keep_unpack_tv)
-                    item_mod_time = datetime.fromtimestamp(os.path.getmtime(directory_path))
-                    if item_mod_time < cutoff_date:
-                        try:
-                            shutil.rmtree(directory_path)
-                            logging.info(f"Deleted _UNPACK_ tv show download: {directory_path}")
-                        except Exception as e:
-                            logging.error(f"Unable to delete _UNPACK_ tv show download: {e}")
-                else:
-                    logging.info(f"Skipping _UNPACK_ tv show download: {directory_path}")
+        return DirectoryOperations.rename_files(original_directory_path, new_episode_name)
+
+    def process_downloaded_tv_shows(self, dry_run=False):
+        """Process all tv show folders, returning the plan that was (or, for a dry run, would be) applied."""
+        logging.info("Starting processing completed tv show downloads directory")
+        with METRICS.phase('tv_shows.plan'):
+            plan = self.plan_downloaded_tv_shows(Plan())
+        if not dry_run:
+            with METRICS.phase('tv_shows.execute'):
+                self.execute(plan)
+            self.save_library_index()
+        else:
+            self.planned_episodes = {}
+            if self.run_state:
+                self.run_state.discard()
+        self.fingerprinter.save()
+        self.prober.save()
+        return plan
+
+    def execute(self, plan):
+        """Apply a plan and queue Plex refreshes for the season folders it moved episodes into."""
+        failed_paths = self.executor.execute(plan)
+        self.sync_library_index(failed_paths)
+        if self.run_state:
+            self.run_state.commit()
+        if self.notifier:
+            self.notifier.collect(plan, [self.kids_tv_shows_library, self.adult_tv_shows_library], failed_paths)
+
+    def plan_downloaded_tv_shows(self, plan):
+        """Add the operations for every tv show folder to the plan."""
+        remaining_paths = []
+        with METRICS.phase('tv_shows.scan'):
+            entries = DirectoryOperations.scan_directories(self.completed_tv_shows_downloads_path,
+                                                           renamed_lookup=self.journal.is_processed)
+        for entry in entries:
+            if self.run_state and self.run_state.decision(entry):
                 continue
-
-            # Skip renaming folders that have already been renamed
-            if not os.path.isfile(os.path.join(directory_path, '.renamed')):
-
-                cleaned_name = self.clean_tv_show_directory_name(directory_path)
-
-                if cleaned_name:
-                    new_directory_path = None
-                    temp_directory_path = os.path.join(self.completed_tv_shows_downloads_path, cleaned_name)
-
-                    if not os.path.exists(temp_directory_path):
-                        new_directory_path = temp_directory_path
-                        logging.info(f"Moving '{directory_path}' to '{temp_directory_path}'")
-                        DirectoryOperations.rename_directory(directory_path, new_directory_path)
-                        logging.info(f"Renaming TV Show files in {new_directory_path}")
-                        self.rename_tv_show_files(new_directory_path, cleaned_name)
-
-                    elif self.move_to_duplicates_tv:
-                        temp_directory_path = os.path.join(self.duplicate_tv_shows_downloads_path, cleaned_name)
-                        count = 1
-                        while os.path.exists(temp_directory_path):
-                            temp_directory_path = os.path.join(self.duplicate_tv_shows_downloads_path, f"{cleaned_name} ({count})")
-                            count += 1
-                        new_directory_path = temp_directory_path
-                        logging.info(f"Moving '{directory_path}' to '{new_directory_path}'")
-                        DirectoryOperations.rename_directory(directory_path, new_directory_path)
-
-                    if not self.move_to_library_tv and not self.move_to_duplicates_tv and new_directory_path is None:
-                        temp_directory_path = os.path.join(self.completed_tv_shows_downloads_path, cleaned_name)
-                        count = 1
-                        while os.path.exists(temp_directory_path):
-                            temp_directory_path = os.path.join(self.completed_tv_shows_downloads_path, f"{cleaned_name} ({count})")
-                            count += 1
-                        new_directory_path = temp_directory_path
-                        logging.info(f"Renaming '{directory_path}' to '{new_directory_path}'")
-                        DirectoryOperations.rename_directory(directory_path, new_directory_path)
+            new_directory_path = self.plan_tv_show_directory(entry, plan)
+            self.record_decision(entry, new_directory_path)
+            if new_directory_path and os.path.dirname(new_directory_path) == self.completed_tv_shows_downloads_path:
+                remaining_paths.append((new_directory_path, entry.path))
 
         # Process renamed folders to see if they need to be moved to the library
         if self.move_to_library_tv:
-            regex = re.compile(r'^(.*?)(S\d{2})(E\d{2}).*$', re.IGNORECASE)
-            directory_paths = []
-            temp_paths = DirectoryOperations.get_directories(self.completed_tv_shows_downloads_path)
-            for directory_path in temp_paths:
-                if "_FAILED_" not in directory_path and "_UNPACK_" not in directory_path:
-                    directory_paths.append(directory_path)
-            for directory_path in directory_paths:
+            library_index = self.get_library_index()
+            for directory_path, current_path in remaining_paths:
                 folder_name = os.path.basename(directory_path)
-                re_match = regex.match(folder_name)
-                if re_match:
-                    show_name = re_match.group(1).strip()
-                    season_number = re_match.group(2).lstrip('S').lstrip('0')
-                    episode_number = re_match.group(3)
-
-                    base_library_path = None
-                    if show_name in kids_shows:
-                        base_library_path = self.kids_tv_shows_library
-                    elif show_name in adult_shows:
-                        base_library_path = self.adult_tv_shows_library
-                    if base_library_path:
-                        show_path = os.path.join(base_library_path, show_name)
-                        season_path = os.path.join(show_path, f'Season {season_number}')
-                        if os.path.exists(season_path):
-                            existing_episodes = []
-                            for episode in os.listdir(season_path):
-                                re_match = regex.match(episode)
-                                if re_match:
-                                    existing_episode_number = re_match.group(3)
-                                    existing_episodes.append(str(existing_episode_number))
-                            if episode_number not in existing_episodes:
-                                logging.info(f"Moving episode '{folder_name}' to '{season_path}'")
-                                shutil.move(directory_path, season_path)
-                            else:
-                                logging.info(f"Episode '{folder_name}' already exists in '{season_path}', moving to duplicates")
-                                self.move_to_duplicates(directory_path, cleaned_name)
-                        else:
-                            logging.info(f"Season path '{season_path}' does not exist, creating it and moving episode")
-                            os.makedirs(season_path)
-                            shutil.move(directory_path, season_path)
-
-    def move_to_duplicates(self, directory_path, cleaned_name):
-        """Move the given directory to the duplicates folder."""
-        temp_directory_path = os.path.join(self.duplicate_tv_shows_downloads_path, cleaned_name)
-        count = 1
-        while os.path.exists(temp_directory_path):
-            temp_directory_path = os.path.join(self.duplicate_tv_shows_downloads_path, f"{cleaned_name} ({count})")
-            count += 1
-        logging.info(f"Moving '{directory_path}' to '{temp_directory_path}'")
-        DirectoryOperations.rename_directory(directory_path, temp_directory_path)
-
-        logging.info(f"Completed processing completed downloads directory.")
+                if "_FAILED_" not in folder_name and "_UNPACK_" not in folder_name:
+                    self.plan_episode_library_move(directory_path, library_index, plan, current_path)
+        return plan
+
+    def record_decision(self, entry, new_directory_path):
+        """Remember where the plan leaves a tv show folder, unless the outcome can change while the folder does not.
+
+        Unpack folders expire with time, and an episode waiting for its show to appear in the
+        library is evaluated again every run.
+        """
+        if not self.run_state or '_UNPACK_' in entry.name:
+            return
+        if not self.move_to_library_tv or '_FAILED_' in entry.name or \
+                RELEASE_PARSER.parse_episode(os.path.basename(new_directory_path or entry.path)) is None:
+            self.run_state.plan(entry, new_directory_path)
+
+    def process_tv_show_download(self, entry):
+        """Rename a single tv show folder scan entry and move it to the library, returning its new path."""
+        plan = Plan()
+        new_directory_path = self.plan_tv_show_directory(entry, plan)
+        self.record_decision(entry, new_directory_path)
+        if self.move_to_library_tv and new_directory_path and \
+                os.path.dirname(new_directory_path) == self.completed_tv_shows_downloads_path:
+            library_index = self.get_library_index(refresh=False)
+            release = RELEASE_PARSER.parse_episode(os.path.basename(new_directory_path))
+            if release:
+                show_name = release.title.strip()
+                library_index.refresh_show(library_index.resolve_show(show_name) or show_name)
+            new_directory_path = self.plan_episode_library_move(new_directory_path, library_index, plan,
+                                                                entry.path) or new_directory_path
+        self.execute(plan)
+        self.save_library_index()
+        self.fingerprinter.save()
+        self.prober.save()
+        return new_directory_path
+
+    def get_library_index(self, refresh=True):
+        """Return the library index, loading it from the cache and re-validating it when refresh is set."""
+        if refresh or self.library_index is None:
+            logging.info("Indexing existing tv show library folders")
+            with METRICS.phase('tv_shows.library_index'):
+                self.library_index = LibraryIndex.load_or_build(
+                    [self.kids_tv_shows_library, self.adult_tv_shows_library], self.library_index_cache,
+                    self.show_match_threshold)
+        return self.library_index
+
+    def sync_library_index(self, failed_paths=()):
+        """Drop the planned episodes whose move failed from the library index.
+
+        failed_paths are the paths the plan executor reports as failed. The seasons every move
+        went into are refreshed when the index is saved, the others are rescanned next time.
+        """
+        failed_seasons = set()
+        for destination, (show_name, season_number, episode_numbers) in self.planned_episodes.items():
+            if destination in failed_paths:
+                self.library_index.discard_episodes(show_name, season_number, episode_numbers)
+                failed_seasons.add((show_name, season_number))
+            else:
+                self.touched_seasons.add((show_name, season_number))
+        self.touched_seasons -= failed_seasons
+        self.planned_episodes = {}
+
+    def save_library_index(self):
+        """Refresh the mtimes of the seasons episodes were moved into and save the library index."""
+        if self.library_index is None:
+            return
+        for show_name, season_number in self.touched_seasons:
+            self.library_index.refresh_season(show_name, season_number)
+        self.touched_seasons = set()
+        self.library_index.save()
+
+    def plan_tv_show_directory(self, entry, plan):
+        """Add the delete or rename operations for a single tv show folder scan entry to the plan.
+
+        Returns the planned path of the folder, or None if it is going to be deleted.
+        """
+        directory_path = entry.path
+        if "_FAILED_" in directory_path:
+            if self.delete_failed_tv:
+                plan.add('delete', directory_path, reason='failed download')
+                return None
+            logging.info("Skipping _FAILED_ tv show download: %s", directory_path)
+            return directory_path
+
+        if "_UNPACK_" in directory_path:
+            if self.delete_unpack_tv:
+                cutoff_date = datetime.now() - timedelta(self.days_to_keep_unpack_tv)
+                item_mod_time = datetime.fromtimestamp(entry.mtime)
+                if item_mod_time < cutoff_date:
+                    plan.add('delete', directory_path, reason='stale unpack folder')
+                    return None
+            else:
+                logging.info("Skipping _UNPACK_ tv show download: %s", directory_path)
+            return directory_path
+
+        # Skip renaming folders that have already been renamed
+        if entry.renamed:
+            return directory_path
+
+        with METRICS.phase('tv_shows.clean_names'):
+            cleaned_name = self.clean_tv_show_directory_name(directory_path)
+        if not cleaned_name:
+            return directory_path
+
+        completed_snapshot = plan.snapshot(self.completed_tv_shows_downloads_path)
+        # The snapshot compares names case-insensitively, so a folder whose cleaned name only
+        # differs in case ('show s01e03' to 'Show S01E03') would collide with itself.
+        own_name = cleaned_name.casefold() == entry.name.casefold()
+        if own_name or cleaned_name not in completed_snapshot:
+            new_directory_path = os.path.join(self.completed_tv_shows_downloads_path, cleaned_name)
+            if cleaned_name != entry.name:
+                plan.add('rename', directory_path, new_directory_path, 'clean name')
+            plan.add('rename_files', new_directory_path, cleaned_name)
+            return new_directory_path
+
+        if self.move_to_duplicates_tv:
+            unique_name = plan.snapshot(self.duplicate_tv_shows_downloads_path).unique_name(cleaned_name)
+            new_directory_path = os.path.join(self.duplicate_tv_shows_downloads_path, unique_name)
+            plan.add('rename', directory_path, new_directory_path, 'duplicate episode')
+            return new_directory_path
+
+        if not self.move_to_library_tv:
+            new_directory_path = os.path.join(self.completed_tv_shows_downloads_path,
+                                              completed_snapshot.unique_name(cleaned_name))
+            plan.add('rename', directory_path, new_directory_path, 'clean name')
+            return new_directory_path
+        return directory_path
+
+    def plan_episode_library_move(self, directory_path, library_index, plan, current_path=None):
+        """Plan moving a renamed episode folder into its show's season folder, returning the new path.
+
+        directory_path is the planned name of the folder and current_path its name on disk, which
+        differ when a rename was planned before this move.
+        """
+        folder_name = os.path.basename(directory_path)
+        release = RELEASE_PARSER.parse_episode(folder_name)
+        if not release:
+            return None
+        show_name = library_index.resolve_show(release.title.strip())
+        if show_name is None:
+            return None
+        season_number = release.season
+        season_path = library_index.season_path(show_name, season_number)
+        # A multi-episode release is a duplicate only when the library has every one of its episodes.
+        if all(library_index.has_episode(show_name, season_number, episode_number)
+               for episode_number in release.episodes):
+            logging.info("Episode '%s' already exists in '%s'", folder_name, season_path)
+            new_directory_path = plan_identical_duplicate(
+                plan, self.fingerprinter, self.identical_duplicate_action, directory_path,
+                library_index.episode_paths(show_name, season_number, release.episodes[0]),
+                self.duplicate_tv_shows_downloads_path, folder_name, current_path)
+            if new_directory_path is False and self.upgrade_library:
+                new_directory_path = self.plan_episode_upgrade(directory_path, release, show_name, library_index, plan,
+                                                               current_path)
+            if new_directory_path is not False:
+                return new_directory_path
+            logging.info("Moving '%s' to duplicates", folder_name)
+            return self.plan_move_to_duplicates(directory_path, folder_name, plan)
+        if not library_index.has_season(show_name, season_number):
+            plan.add('mkdir', season_path, reason='new season')
+        new_directory_path = os.path.join(season_path, folder_name)
+        plan.add('move', directory_path, new_directory_path, 'new episode')
+        for episode_number in release.episodes:
+            library_index.add_episode(show_name, season_number, episode_number, refresh_mtime=False)
+        self.planned_episodes[new_directory_path] = (show_name, season_number, release.episodes)
+        return new_directory_path
+
+    def plan_episode_upgrade(self, directory_path, release, show_name, library_index, plan, current_path=None):
+        """Plan replacing the library copy of an episode with a better release, returning the new path or False.
+
+        Library files or folders that also hold other episodes are never replaced.
+        """
+        library_paths = sorted({path for episode_number in release.episodes
+                                for path in library_index.episode_paths(show_name, release.season, episode_number)})
+        if not all(set(RELEASE_PARSER.parse(os.path.basename(path)).episodes) <= set(release.episodes)
+                   for path in library_paths):
+            return False
+        season_path = library_index.season_path(show_name, release.season)
+        new_directory_path = plan_library_upgrade(plan, self.prober, directory_path, library_paths,
+                                                  os.path.join(season_path, os.path.basename(directory_path)),
+                                                  self.duplicate_tv_shows_downloads_path, current_path, 'move')
+        if new_directory_path is not False:
+            self.planned_episodes[new_directory_path] = (show_name, release.season, release.episodes)
+        return new_directory_path
+
+    def plan_move_to_duplicates(self, directory_path, cleaned_name, plan):
+        """Plan moving the given directory to the duplicates folder, returning the new path."""
+        unique_name = plan.snapshot(self.duplicate_tv_shows_downloads_path).unique_name(cleaned_name)
+        new_directory_path = os.path.join(self.duplicate_tv_shows_downloads_path, unique_name)
+        plan.add('rename', directory_path, new_directory_path, 'episode already in library')
+        return new_directory_path
+
+
+def plan_identical_duplicate(plan, fingerprinter, action, release_path, library_paths, duplicate_directory, name,
+                             current_path=None):
+    """Plan discarding or hard-linking a release whose media files are identical to the library copy.
+
+    current_path is where the release is on disk when a rename of it to release_path is already planned.
+    Returns the planned path of the release (None when it is deleted), or False when the
+    release is not identical or identical duplicates are kept as ordinary duplicates.
+    """
+    if action not in ('delete', 'hardlink') or not library_paths:
+        return False
+    try:
+        links = fingerprinter.find_identical(current_path or release_path, library_paths)
+    except OSError as e:
+        logging.warning("Unable to fingerprint '%s': %s", release_path, e)
+        return False
+    if links is None:
+        return False
+    if action == 'delete':
+        plan.add('delete', release_path, reason='identical to library copy')
+        return None
+    new_directory_path = os.path.join(duplicate_directory, plan.snapshot(duplicate_directory).unique_name(name))
+    plan.add('hardlink', release_path, new_directory_path, 'identical to library copy', {'links': links})
+    return new_directory_path
+
+
+def plan_library_upgrade(plan, prober, release_path, library_paths, new_path, duplicate_directory, current_path=None,
+                         action='rename'):
+    """Plan replacing library copies with a release of better quality, moving the library copies to duplicates.
+
+    The release is only moved to new_path once every library copy has been moved out.
+    Returns new_path, or False when the release is not better than every library copy.
+    """
+    try:
+        if not prober.is_upgrade(current_path or release_path, library_paths):
+            return False
+    except OSError as e:
+        logging.warning("Unable to probe '%s': %s", release_path, e)
+        return False
+    parked_paths = []
+    for library_path in library_paths:
+        parked_name = plan.snapshot(duplicate_directory).unique_name(os.path.basename(library_path))
+        parked_paths.append(os.path.join(duplicate_directory, parked_name))
+        plan.add('rename', library_path, parked_paths[-1], 'replaced by a better release')
+    plan.add(action, release_path, new_path, 'better than the library copy', {'after': parked_paths})
+    return new_path
+
+
+def retention_periods(config):
+    """Return [(name, download directory, days to keep)] with one entry per download directory.
+
+    Movies and tv shows may share a directory, the shorter retention period wins.
+    """
+    periods = {}
+    for media_type in ('movies', 'tv_shows'):
+        settings = getattr(config.settings, media_type)
+        for kind, days_to_keep in (('complete', settings.days_to_keep_completed_downloads),
+                                   ('duplicate', settings.days_to_keep_duplicate_downloads),
+                                   ('incomplete', settings.days_to_keep_incomplete_downloads)):
+            directory = getattr(getattr(config.download_directories, kind), media_type)
+            name, previous_days_to_keep = periods.get(directory, (f'{kind}.{media_type}', days_to_keep))
+            periods[directory] = (name, min(days_to_keep, previous_days_to_keep))
+    return [(name, directory, days_to_keep) for directory, (name, days_to_keep) in periods.items()]
+
+
+def delete_expired_downloads(config, dry_run=False, journal=None, purge_engine=None, run_state=None,
+                             directories=None):
+    """Delete completed, duplicate and incomplete downloads that are past their retention period.
+
+    With a purge engine the expired folders are only staged here and removed in the background.
+    With a run state only the expiry heap and the directories that changed are looked at.
+    directories limits the sweep to some of the download directories.
+    """
+    retention = [(directory, days_to_keep) for _, directory, days_to_keep in retention_periods(config)
+                 if directories is None or directory in directories]
+    plan = Plan()
+    with METRICS.phase('retention.plan'):
+        for directory, days_to_keep in retention:
+            if run_state is None:
+                DirectoryOperations.plan_delete(plan, directory, days_to_keep)
+            else:
+                run_state.schedule_expiries(directory, days_to_keep)
+        if run_state is not None:
+            for path, days_to_keep in run_state.pop_expired([directory for directory, _ in retention]):
+                plan.add('delete', path, reason=f"older than {days_to_keep} days")
+    if not dry_run:
+        with METRICS.phase('retention.execute'):
+            PlanExecutor(journal=journal, purge_engine=purge_engine).execute(plan)
+    return plan
+
+
+def process_downloads(config, movie_processor, tv_show_processor, dry_run=False, journal=None, purge_engine=None,
+                      run_state=None, scheduler=None):
+    """Run the movie, tv show and retention pipelines, in parallel where they use different devices.
+
+    Each retention sweep waits only for the processor that moves folders into or out of its
+    directory. Returns the combined plan and {pipeline name: exception} for the pipelines that failed.
+    """
+    scheduler = scheduler or PipelineScheduler.from_config(config)
+    download_directories = config.download_directories
+    movie_paths = [download_directories.complete.movies, download_directories.duplicate.movies,
+                   config.media_libraries.movies]
+    tv_show_paths = [download_directories.complete.tv_shows, download_directories.duplicate.tv_shows,
+                     config.media_libraries.tv_shows.adult, config.media_libraries.tv_shows.kids]
+    scheduler.add('movies', lambda: movie_processor.process_downloaded_movies(dry_run=dry_run), movie_paths)
+    scheduler.add('tv_shows', lambda: tv_show_processor.process_downloaded_tv_shows(dry_run=dry_run), tv_show_paths)
+    for name, directory, _ in retention_periods(config):
+        after = [pipeline for pipeline, paths in (('movies', movie_paths), ('tv_shows', tv_show_paths))
+                 if directory in paths]
+        scheduler.add(f'retention.{name}',
+                      lambda directory=directory: delete_expired_downloads(config, dry_run, journal, purge_engine,
+                                                                           run_state, [directory]),
+                      [directory], after)
+    plan = Plan()
+    for result in scheduler.run().values():
+        plan.extend(result)
+    return plan, scheduler.failures
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Rename and organize completed movie and tv show downloads.')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and process release folders as soon as they finish downloading')
+    parser.add_argument('--polling', action='store_true',
+                        help='use the polling watch backend instead of inotify')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='print the planned renames, moves and deletes without applying them')
+    parser.add_argument('--plan-format', choices=['text', 'json'], default='text',
+                        help='output format of the --dry-run plan')
+    parser.add_argument('--undo', metavar='RUN_ID',
+                        help="reverse the renames and moves of a journaled run ('last' for the most recent) and exit")
+    args = parser.parse_args()
+
     config_path = 'config.yml'
     show_names_config_path = 'show_names.yaml'
 
@@ -318,19 +656,132 @@ if __name__ == "__main__":
     if not os.path.exists(show_names_config_path):
         ShowNamesConfigHandler.create_default_show_names_config(show_names_config_path)
 
+    config = None
+    journal = None
+    move_engine = None
+    purge_engine = None
+    notifier = None
+    run_state = None
+    exit_status = 0
     try:
-        config = ConfigHandler.load_config(config_path)
-        show_name_alternates = ShowNamesConfigHandler.load_show_names_config(show_names_config_path)
+        reloader = ConfigReloader(config_path, show_names_config_path)
+        config = reloader.config
         LoggingHandler.setup_logging(config)
-        movie_processor = MovieProcessor(config)
-        tv_show_processor = TVShowProcessor(config)
-        movie_processor.process_downloaded_movies()
-        tv_show_processor.process_downloaded_tv_shows()
-        DirectoryOperations.delete(config['download_directories']['complete']['movies'], config['settings']['movies']['days_to_keep_completed_downloads'])
-        DirectoryOperations.delete(config['download_directories']['duplicate']['movies'], config['settings']['movies']['days_to_keep_duplicate_downloads'])
-        DirectoryOperations.delete(config['download_directories']['incomplete']['movies'], config['settings']['movies']['days_to_keep_incomplete_downloads'])
-        DirectoryOperations.delete(config['download_directories']['complete']['tv_shows'], config['settings']['tv_shows']['days_to_keep_completed_downloads'])
-        DirectoryOperations.delete(config['download_directories']['duplicate']['tv_shows'], config['settings']['tv_shows']['days_to_keep_duplicate_downloads'])
-        DirectoryOperations.delete(config['download_directories']['incomplete']['tv_shows'], config['settings']['tv_shows']['days_to_keep_incomplete_downloads'])
+        show_name_normalizer = ShowNameNormalizer(reloader.show_names)
+        journal = OperationsJournal.from_config(config)
+        journal.migrate_markers(config.download_directories.complete.tv_shows, record=not args.dry_run)
+        if args.undo:
+            runs = journal.runs()
+            run_id = runs[-1] if args.undo == 'last' and runs else args.undo
+            journal.undo_run(run_id)
+            raise SystemExit(0)
+        move_engine = MoveEngine.from_config(config)
+        fingerprinter = MediaFingerprinter.from_config(config)
+        prober = MediaProber.from_config(config)
+        purge_engine = PurgeEngine.from_config(config)
+        notifier = None if args.dry_run else PlexNotifier.from_config(config)
+        run_state = RunState.from_config(config)
+        movie_processor = MovieProcessor(config, move_engine, fingerprinter, journal, purge_engine, notifier,
+                                         run_state, prober)
+        tv_show_processor = TVShowProcessor(config, show_name_normalizer, move_engine, fingerprinter, journal,
+                                            purge_engine, notifier=notifier, run_state=run_state, prober=prober)
+        if not args.dry_run:
+            with METRICS.phase('resume'):
+                PlanExecutor(move_engine, journal, purge_engine).resume()
+            purge_engine.recover({directory for _, directory, _ in retention_periods(config)})
+        plan, failures = process_downloads(config, movie_processor, tv_show_processor, args.dry_run, journal,
+                                           purge_engine, run_state)
+        if failures:
+            logging.error("Failed pipelines: %s", ', '.join(failures))
+            exit_status = 1
+        if args.dry_run:
+            print(plan.to_json() if args.plan_format == 'json' else plan.format_text())
+        elif args.watch:
+            # Every batch of the watcher is a run of its own, the metrics of the first full run
+            # are written before watching and each batch starts from zero.
+            METRICS.write(config)
+
+            def process_movie_download(directory_path):
+                entry = DirectoryScanner.scan_path(directory_path)
+                new_directory_path = movie_processor.process_movie_directory(entry) if entry else None
+                METRICS.write(config)
+                return new_directory_path
+
+            def process_tv_show_download(directory_path):
+                entry = DirectoryScanner.scan_path(directory_path, renamed_lookup=journal.is_processed)
+                new_directory_path = tv_show_processor.process_tv_show_download(entry) if entry else None
+                METRICS.write(config)
+                return new_directory_path
+
+            def expire_downloads():
+                delete_expired_downloads(config, journal=journal, purge_engine=purge_engine, run_state=run_state)
+                if run_state:
+                    run_state.save()
+                METRICS.write(config)
+
+            def start_batch():
+                # Each batch is its own journal run, so it can be undone on its own and old
+                # batches get compacted, and its own metrics run.
+                journal.end_run()
+                METRICS.reset()
+                reload_config()
+
+            def reload_config():
+                # Only the processors and the run state are rebuilt, the engines, logging and the
+                # watched directories keep the settings they were started with.
+                global config, run_state, movie_processor, tv_show_processor
+                if not reloader.check():
+                    return
+                if reloader.config.download_directories.complete != config.download_directories.complete:
+                    logging.warning("The completed download directories changed, restart to watch the new ones")
+                if run_state is not None:
+                    run_state.save()
+                new_run_state = RunState.from_config(reloader.config)
+                new_movie_processor = MovieProcessor(reloader.config, move_engine, fingerprinter, journal,
+                                                     purge_engine, notifier, new_run_state, prober)
+                new_tv_show_processor = TVShowProcessor(reloader.config, ShowNameNormalizer(reloader.show_names),
+                                                        move_engine, fingerprinter, journal, purge_engine,
+                                                        notifier=notifier, run_state=new_run_state, prober=prober)
+                config, run_state = reloader.config, new_run_state
+                movie_processor, tv_show_processor = new_movie_processor, new_tv_show_processor
+
+            watcher = DownloadWatcher.from_config(
+                config,
+                {config.download_directories.complete.movies: process_movie_download,
+                 config.download_directories.complete.tv_shows: process_tv_show_download},
+                force_polling=args.polling,
+                periodic_callback=expire_downloads,
+                batch_callback=start_batch)
+            if notifier:
+                notifier.start()
+            watcher.run()
+        else:
+            # A single run removes what it staged, an interrupted one leaves it to the next start.
+            with METRICS.phase('purge.wait'):
+                purge_engine.wait()
+    except KeyboardInterrupt:
+        logging.info("Stopped watching download directories")
     except Exception as e:
-        logging.critical(f"Critical error in main execution: {e}", exc_info=True)
+        logging.critical("Critical error in main execution: %s", e, exc_info=True)
+        exit_status = 1
+    finally:
+        # Background moves are finished before the journal run ends, also after Ctrl-C. Queued
+        # purges are not, their trees stay staged in the trash and are recovered on the next start.
+        try:
+            if move_engine is not None:
+                move_engine.shutdown()
+            if purge_engine is not None:
+                purge_engine.shutdown()
+        except Exception as e:
+            logging.critical("Unable to finish background moves and deletes: %s", e, exc_info=True)
+            exit_status = 1
+        if notifier is not None:
+            notifier.shutdown()
+        if journal is not None:
+            journal.end_run()
+        if run_state is not None and not args.dry_run:
+            run_state.save()
+        # An undo is not a processing run, its metrics would replace those of the last real run.
+        if config is not None and not args.dry_run and not args.undo:
+            METRICS.write(config)
+    sys.exit(exit_status)
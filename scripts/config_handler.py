@@ -1,13 +1,248 @@
+import dataclasses
 import logging
+import math
+import os
+from dataclasses import dataclass, field
 import yaml
+
+# The libyaml based loader is much faster, PyYAML is not always built with it.
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+TYPE_NAMES = {bool: 'true or false', int: 'a whole number', float: 'a number', str: 'a string', dict: 'a mapping'}
+
+
+class ConfigError(ValueError):
+    """Raised when a config file is missing keys or holds values of the wrong type."""
+
+
+@dataclass(frozen=True, slots=True)
+class MediaPaths:
+    movies: str
+    tv_shows: str
+
+
+@dataclass(frozen=True, slots=True)
+class DownloadDirectories:
+    complete: MediaPaths
+    duplicate: MediaPaths
+    incomplete: MediaPaths
+
+
+@dataclass(frozen=True, slots=True)
+class TvShowLibraries:
+    adult: str
+    kids: str
+
+
+@dataclass(frozen=True, slots=True)
+class MediaLibraries:
+    movies: str
+    tv_shows: TvShowLibraries
+
+
+@dataclass(frozen=True, slots=True)
+class MovieSettings:
+    delete_failed: bool
+    delete_unpack: bool
+    days_to_keep_completed_downloads: int
+    days_to_keep_duplicate_downloads: int
+    days_to_keep_incomplete_downloads: int
+    move_to_duplicates: bool
+    move_to_library: bool
+    library_catalog_cache: str = None
+
+
+@dataclass(frozen=True, slots=True)
+class TvShowSettings:
+    delete_failed: bool
+    delete_unpack: bool
+    days_to_keep_unpack: int
+    days_to_keep_completed_downloads: int
+    days_to_keep_duplicate_downloads: int
+    days_to_keep_incomplete_downloads: int
+    move_to_duplicates: bool
+    move_to_library: bool
+    library_index_cache: str = None
+    show_match_threshold: float = field(default=0.8, metadata={'maximum': 1})
+
+
+@dataclass(frozen=True, slots=True)
+class DuplicateSettings:
+    identical_action: str = field(default='hardlink', metadata={'choices': ('keep', 'hardlink', 'delete')})
+    upgrade_library: bool = False
+    fingerprint_cache: str = None
+    sample_size: int = 1024 * 1024
+    min_media_size: int = 0
+    probe_cache: str = None
+
+
+@dataclass(frozen=True, slots=True)
+class MoveEngineSettings:
+    max_workers: int = 4
+    max_concurrent_per_device: int = 2
+    progress_interval: float = 10.0
+
+
+@dataclass(frozen=True, slots=True)
+class JournalSettings:
+    path: str = None
+    batch_size: int = 100
+    keep_runs: int = 20
+
+
+@dataclass(frozen=True, slots=True)
+class SchedulerSettings:
+    max_workers: int = 4
+    max_per_device: int = 2
+
+
+@dataclass(frozen=True, slots=True)
+class RunStateSettings:
+    path: str = None
+    max_entries: int = 200000
+
+
+@dataclass(frozen=True, slots=True)
+class MetricsSettings:
+    prometheus_textfile: str = None
+    json_summary: str = None
+
+
+@dataclass(frozen=True, slots=True)
+class PurgeSettings:
+    max_workers: int = 2
+    unlinks_per_second: float = None
+
+
+@dataclass(frozen=True, slots=True)
+class WatchSettings:
+    quiet_seconds: float = 30.0
+    poll_interval: float = 30.0
+    force_polling: bool = False
+    retention_interval_hours: float = 24.0
+
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    movies: MovieSettings
+    tv_shows: TvShowSettings
+    duplicates: DuplicateSettings = DuplicateSettings()
+    move_engine: MoveEngineSettings = MoveEngineSettings()
+    journal: JournalSettings = JournalSettings()
+    scheduler: SchedulerSettings = SchedulerSettings()
+    run_state: RunStateSettings = RunStateSettings()
+    metrics: MetricsSettings = MetricsSettings()
+    purge: PurgeSettings = PurgeSettings()
+    watch: WatchSettings = WatchSettings()
+
+
+@dataclass(frozen=True, slots=True)
+class LoggingSettings:
+    level: str = 'DEBUG'
+    file: str = 'rename_completed_downloads.log'
+    format: str = field(default='text', metadata={'choices': ('text', 'json')})
+    max_bytes: int = 10 * 1024 * 1024
+    backup_count: int = 5
+
+
+@dataclass(frozen=True, slots=True)
+class SonarrSettings:
+    enabled: bool = False
+    url: str = None
+    api_key: str = ''
+    timeout: float = 10.0
+    cache_path: str = None
+    cache_ttl_hours: float = 6.0
+
+
+@dataclass(frozen=True, slots=True)
+class PlexSettings:
+    enabled: bool = False
+    config_ini: str = '../config.ini'
+    debounce_seconds: float = 30.0
+    max_concurrent: int = 2
+    path_mappings: dict = None
+
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """The validated contents of config.yml.
+
+    Every section is typed and checked once when the file is loaded, so a missing key or a
+    value of the wrong type is reported before any work starts. Optional sections and keys
+    fall back to the defaults below.
+    """
+
+    download_directories: DownloadDirectories
+    media_libraries: MediaLibraries
+    settings: Settings
+    logging: LoggingSettings = LoggingSettings()
+    sonarr: SonarrSettings = SonarrSettings()
+    plex: PlexSettings = PlexSettings()
+
+    @classmethod
+    def from_dict(cls, data):
+        """Validate a parsed config, raising ConfigError that lists every missing or mistyped key."""
+        errors = []
+        config = _build(cls, data, '', errors)
+        if errors:
+            raise ConfigError("Invalid config:\n  " + "\n  ".join(errors))
+        return config
+
+
+def _build(cls, data, path, errors, **values):
+    """Create the dataclass cls from a dict, adding a message to errors for every key that is missing or wrong."""
+    if not isinstance(data, dict):
+        errors.append(f"{path or 'the config'} should be a mapping")
+        return None
+    error_count = len(errors)
+    for data_field in dataclasses.fields(cls):
+        if data_field.name in values:
+            continue
+        key = f"{path}.{data_field.name}" if path else data_field.name
+        value = data.get(data_field.name)
+        if value is None:
+            if data_field.default is not dataclasses.MISSING:
+                continue
+            if not dataclasses.is_dataclass(data_field.type):
+                errors.append(f"{key} has no value" if data_field.name in data else f"{key} is missing")
+                continue
+            # List the missing keys of the whole section.
+            value = {}
+        if dataclasses.is_dataclass(data_field.type):
+            values[data_field.name] = _build(data_field.type, value, key, errors)
+        elif not _has_type(value, data_field.type):
+            errors.append(f"{key} should be {TYPE_NAMES[data_field.type]}, not {value!r}")
+        elif value not in data_field.metadata.get('choices', (value,)):
+            errors.append(f"{key} should be one of {', '.join(data_field.metadata['choices'])}, not {value!r}")
+        elif data_field.type in (int, float) and not 0 <= value <= data_field.metadata.get('maximum', math.inf):
+            errors.append(f"{key} is out of range: {value!r}")
+        else:
+            values[data_field.name] = value
+    return cls(**values) if len(errors) == error_count else None
+
+
+def _has_type(value, expected_type):
+    if isinstance(value, bool):
+        return expected_type is bool
+    if expected_type is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, expected_type)
+
+
 class ConfigHandler:
     @staticmethod
-    def load_config(config_path):
+    def read_yaml(path):
+        """Parse a YAML file with the C loader when PyYAML was built with it."""
+        with open(path, 'r') as file:
+            return yaml.load(file, Loader=YAML_LOADER)
+
+    @classmethod
+    def load_config(cls, config_path):
+        """Load and validate a config file, raising ConfigError when keys are missing or mistyped."""
         try:
-            with open(config_path, 'r') as file:
-                return yaml.safe_load(file)
+            return Config.from_dict(cls.read_yaml(config_path))
         except Exception as e:
-            logging.error(f"Error loading configuration file: {e}", exc_info=True)
+            logging.error("Error loading configuration file: %s", e, exc_info=not isinstance(e, ConfigError))
             raise
 
     @classmethod
@@ -37,8 +272,64 @@ class ConfigHandler:
             'logging': {
                 'level': 'DEBUG',
                 'file': 'logs/app.log',
+                'format': 'text',
+                'max_bytes': 10485760,
+                'backup_count': 5,
+            },
+            'sonarr': {
+                'enabled': False,
+                'url': 'http://localhost:8989',
+                'api_key': '',
+                'cache_path': 'cache/sonarr_series.json',
+                'cache_ttl_hours': 6,
+            },
+            'plex': {
+                'enabled': False,
+                'config_ini': '../config.ini',
+                'debounce_seconds': 30,
+                'max_concurrent': 2,
+                'path_mappings': {},
             },
             'settings': {
+                'move_engine': {
+                    'max_workers': 4,
+                    'max_concurrent_per_device': 2,
+                    'progress_interval': 10,
+                },
+                'duplicates': {
+                    'identical_action': 'hardlink',
+                    'fingerprint_cache': 'cache/fingerprints.json',
+                    'sample_size': 1048576,
+                    'upgrade_library': False,
+                    'probe_cache': 'cache/media_probes.json',
+                },
+                'journal': {
+                    'path': 'journal/operations.jsonl',
+                    'batch_size': 100,
+                    'keep_runs': 20,
+                },
+                'scheduler': {
+                    'max_workers': 4,
+                    'max_per_device': 2,
+                },
+                'run_state': {
+                    'path': 'cache/run_state.json',
+                    'max_entries': 200000,
+                },
+                'metrics': {
+                    'prometheus_textfile': 'metrics/media_management.prom',
+                    'json_summary': 'metrics/last_run.json',
+                },
+                'purge': {
+                    'max_workers': 2,
+                    'unlinks_per_second': 1000,
+                },
+                'watch': {
+                    'quiet_seconds': 30,
+                    'poll_interval': 30,
+                    'force_polling': False,
+                    'retention_interval_hours': 24,
+                },
                 'movies': {
                     'delete_failed': True,
                     'delete_unpack': True,
@@ -47,6 +338,7 @@ class ConfigHandler:
                     'days_to_keep_incomplete_downloads': 30,
                     'move_to_duplicates': True,
                     'move_to_library': False,
+                    'library_catalog_cache': 'cache/movie_library_catalog.json',
                 },
                 'tv_shows': {
                     'delete_failed': True,
@@ -54,8 +346,11 @@ class ConfigHandler:
                     'days_to_keep_unpack': 2,
                     'days_to_keep_completed_downloads': 30,
                     'days_to_keep_duplicate_downloads': 30,
+                    'days_to_keep_incomplete_downloads': 30,
                     'move_to_duplicates': True,
                     'move_to_library': False,
+                    'library_index_cache': 'cache/tv_library_index.json',
+                    'show_match_threshold': 0.8,
                 },
             }
         }
@@ -63,21 +358,34 @@ class ConfigHandler:
         with open(config_path, 'w') as file:
             file.write('# This is the default config file\n')
             yaml.dump(default_config, file)
-            logging.info(f"Config file created at {config_path}")
+            logging.info("Config file created at %s", config_path)
+
 
 class ShowNamesConfigHandler:
     @staticmethod
     def load_show_names_config(config_path):
+        """Load the canonical name -> alternate names mapping, raising ConfigError when it is malformed."""
         try:
-            with open(config_path, 'r') as file:
-                return yaml.safe_load(file)
+            show_names = ConfigHandler.read_yaml(config_path) or {}
+            if not isinstance(show_names, dict):
+                raise ConfigError("Invalid show names config: it should map canonical names to alternate names")
+            errors = [f"{canonical_name!r} should list alternate names"
+                      for canonical_name, alternate_names in show_names.items()
+                      if not isinstance(canonical_name, str) or not isinstance(alternate_names, (list, type(None)))
+                      or not all(isinstance(alternate_name, str) for alternate_name in alternate_names or [])]
+            if errors:
+                raise ConfigError("Invalid show names config:\n  " + "\n  ".join(errors))
+            return show_names
         except Exception as e:
-            logging.error(f"Error loading show names configuration file: {e}", exc_info=True)
+            logging.error("Error loading show names configuration file: %s", e, exc_info=not isinstance(e, ConfigError))
             raise
 
     @classmethod
     def create_default_show_names_config(cls, config_path='show_names.yaml'):
         default_show_names_config = {
+            'CSI - ': ['C S I '],
+            "John Mulaney Presents - Everybody's in L.A": ['John Mulaney Presents Everybodys in L A'],
+            'The 1% Club': ['The 1 Percent Club'],
             'Nightmares & Dreamscapes - From the Stories of Stephen King': [
                 'Nightmares & Dreamscapes From The Stories Of Stephen King'],
             'Coastguard - Every Second Counts': ['Coastguard Search and Rescue']
@@ -86,4 +394,47 @@ class ShowNamesConfigHandler:
         with open(config_path, 'w') as file:
             file.write('# This is the default show names config file\n')
             yaml.dump(default_show_names_config, file)
-            logging.info(f"Show names config file created at {config_path}")
+            logging.info("Show names config file created at %s", config_path)
+
+
+class ConfigReloader:
+    """Load config.yml and show_names.yaml, and load them again after either file changed.
+
+    check() is meant to be called between batches of work, so a batch always runs with one
+    version of both files. An edit that does not load or validate is logged and the previous
+    version is kept, a half saved file does not stop a resident process.
+    """
+
+    def __init__(self, config_path, show_names_path):
+        self.config_path = config_path
+        self.show_names_path = show_names_path
+        self.signatures = self._signatures()
+        self.config = ConfigHandler.load_config(config_path)
+        self.show_names = ShowNamesConfigHandler.load_show_names_config(show_names_path)
+
+    def _signatures(self):
+        signatures = []
+        for path in (self.config_path, self.show_names_path):
+            try:
+                file_stat = os.stat(path)
+                signatures.append((file_stat.st_mtime_ns, file_stat.st_size))
+            except OSError:
+                signatures.append(None)
+        return signatures
+
+    def check(self):
+        """Reload both files if either changed, returning True when a new version was loaded."""
+        signatures = self._signatures()
+        if signatures == self.signatures:
+            return False
+        # Read before loading, so a change made while loading is picked up by the next check.
+        self.signatures = signatures
+        try:
+            config = ConfigHandler.load_config(self.config_path)
+            show_names = ShowNamesConfigHandler.load_show_names_config(self.show_names_path)
+        except Exception as e:
+            logging.error("Keeping the current configuration, the changed files did not load: %s", e)
+            return False
+        self.config, self.show_names = config, show_names
+        logging.info("Reloaded '%s' and '%s'", self.config_path, self.show_names_path)
+        return True
@@ -1,69 +1,100 @@
 import logging
 import os
-import shutil
 from datetime import datetime, timedelta
+from directory_scanner import DirectoryScanner
+from run_metrics import METRICS
 
 class DirectoryOperations:
     @staticmethod
     def get_directories(path):
         """Gather all folders in the given path."""
-        return [os.path.join(path, item) for item in os.listdir(path) if os.path.isdir(os.path.join(path, item))]
+        return [entry.path for entry in DirectoryScanner.scan(path, directories_only=True)]
 
     @staticmethod
-    def rename_directory(original_directory_path, cleaned_directory_name):
-        """Rename the directory to the cleaned name."""
+    def scan_directories(path, renamed_lookup=None):
+        """Gather a ScanEntry for every folder in the given path."""
+        return list(DirectoryScanner.scan(path, directories_only=True, renamed_lookup=renamed_lookup))
+
+    @staticmethod
+    def rename_directory(original_directory_path, cleaned_directory_name, move_engine=None):
+        """Rename the directory to the cleaned name.
+
+        When a move engine is given the directory is moved through it, which copies in the background when
+        the destination is on another device, and the future of the move is returned.
+        """
         new_directory_path = os.path.join(os.path.dirname(original_directory_path), cleaned_directory_name)
-        log_entries = []
 
         if not original_directory_path == cleaned_directory_name:
-            try:
-                os.rename(original_directory_path, new_directory_path)
-                logging.info(f"Renamed '{original_directory_path}' to '{new_directory_path}'")
+            if move_engine is None:
+                try:
+                    METRICS.count('rename')
+                    os.rename(original_directory_path, new_directory_path)
+                    logging.info("Renamed '%s' to '%s'", original_directory_path, new_directory_path)
+                except Exception as e:
+                    logging.error("Failed to rename '%s' to '%s': %s",
+                                  original_directory_path, cleaned_directory_name, e)
+                    raise
+                return None
 
-                # Collect log entries
-                log_entries.append(f"original name: {os.path.basename(original_directory_path)}")
-                log_entries.append(f"new name: {cleaned_directory_name}")
+            def on_moved(future):
+                if future.exception() is None:
+                    logging.info("Renamed '%s' to '%s'", original_directory_path, new_directory_path)
+                else:
+                    logging.error("Failed to rename '%s' to '%s': %s",
+                                  original_directory_path, cleaned_directory_name, future.exception())
 
-                # Write log entries to the .renamed file at the end
-                if log_entries:
-                    renamed_file_path = os.path.join(new_directory_path, '.renamed')
-                    try:
-                        with open(renamed_file_path, 'a') as f:
-                            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            f.write(f"Timestamp: {timestamp}\n")
-                            for entry in log_entries:
-                                f.write(entry + '\n')
-                            f.write('\n')  # Add an extra newline for separation between different renaming operations
-                    except Exception as e:
-                        logging.warning(f"Unable to create .renamed file in {new_directory_path}: {e}", exc_info=True)
-
-            except Exception as e:
-                logging.error(f"Failed to rename '{original_directory_path}' to '{cleaned_directory_name}': {e}")
+            future = move_engine.move(original_directory_path, new_directory_path)
+            future.add_done_callback(on_moved)
+            return future
         else:
-            logging.info(f"Original directory name: {original_directory_path} is the same as: {cleaned_directory_name}")
+            logging.info("Original directory name: %s is the same as: %s",
+                         original_directory_path, cleaned_directory_name)
 
     @staticmethod
     def rename_file(old_file_path, new_file_path):
         try:
             if not old_file_path == new_file_path:
+                METRICS.count('rename')
                 os.rename(old_file_path, new_file_path)
-                logging.info(f"Renamed '{old_file_path}' to '{new_file_path}'")
+                logging.info("Renamed '%s' to '%s'", old_file_path, new_file_path)
+                return True
             else:
-                logging.info(f"File '{old_file_path}' already renamed to '{new_file_path}'")
+                logging.info("File '%s' already renamed to '%s'", old_file_path, new_file_path)
+        except Exception as e:
+            logging.warning("Failed to rename %s to %s: %s", old_file_path, new_file_path, e, exc_info=True)
+        return False
+
+    @staticmethod
+    def rename_files(directory_path, new_name):
+        """Rename all files within the directory to the new name, preserving their extensions.
+
+        Returns the [original name, new name] pairs of the renamed files so the rename can be journaled.
+        """
+        renamed_files = []
+
+        try:
+            # Iterate through all files in the directory
+            for entry in list(DirectoryScanner.scan(directory_path)):
+                filename = entry.name
+                # Skip the .renamed file left behind by older versions
+                if filename == '.renamed':
+                    continue
+                old_file_path = entry.path
+                if not entry.is_dir:
+                    file_extension = os.path.splitext(filename)[1]
+                    new_file_name = new_name + file_extension
+                    new_file_path = os.path.join(directory_path, new_file_name)
+                    if DirectoryOperations.rename_file(old_file_path, new_file_path):
+                        renamed_files.append([filename, new_file_name])
         except Exception as e:
-            logging.warning(f"Failed to rename {old_file_path} to {new_file_path}: {e}", exc_info=True)
+            logging.error("Error while renaming files: %s", e)
+        return renamed_files
 
     @staticmethod
-    def delete(directory, days_to_keep):
-        logging.info(f"Checking {directory} for directories older than {days_to_keep} days.")
-        cutoff_date = datetime.now() - timedelta(days=days_to_keep)
-        for item in os.listdir(directory):
-            item_path = os.path.join(directory, item)
-            if os.path.isdir(item_path):
-                item_mod_time = datetime.fromtimestamp(os.path.getmtime(item_path))
-                if item_mod_time < cutoff_date:
-                    try:
-                        shutil.rmtree(item_path)
-                        logging.info(f"Deleted: {item}")
-                    except Exception as e:
-                        logging.error(f"Failed to delete '{item_path} with error {e}", exc_info=True)
+    def plan_delete(plan, directory, days_to_keep):
+        """Add a delete operation to the plan for every folder older than days_to_keep."""
+        logging.info("Checking %s for directories older than %s days.", directory, days_to_keep)
+        cutoff_timestamp = (datetime.now() - timedelta(days=days_to_keep)).timestamp()
+        for entry in DirectoryOperations.scan_directories(directory):
+            if entry.mtime < cutoff_timestamp:
+                plan.add('delete', entry.path, reason=f"older than {days_to_keep} days")
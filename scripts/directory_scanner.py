@@ -0,0 +1,67 @@
+import logging
+import os
+import stat
+from purge_engine import TRASH_DIR_NAME
+from run_metrics import METRICS
+
+
+class ScanEntry:
+    """A directory entry captured in a single scandir pass."""
+
+    __slots__ = ('path', 'name', 'is_dir', 'mtime', 'inode', 'device', 'renamed')
+
+    def __init__(self, path, name, is_dir, mtime, inode, device, renamed=False):
+        self.path = path
+        self.name = name
+        self.is_dir = is_dir
+        self.mtime = mtime
+        self.inode = inode
+        self.device = device
+        self.renamed = renamed
+
+    def __repr__(self):
+        return f"ScanEntry({self.path!r}, is_dir={self.is_dir}, mtime={self.mtime}, renamed={self.renamed})"
+
+
+class DirectoryScanner:
+    """Scan directories with os.scandir, collecting type, mtime, inode and the renamed flag per entry."""
+
+    @staticmethod
+    def scan(path, directories_only=False, renamed_lookup=None):
+        """Yield a ScanEntry for every entry in path.
+
+        The entry type comes from scandir itself and mtime, inode and device from a
+        single stat. The renamed flag of a folder is answered by renamed_lookup, usually
+        the in-memory index of the operations journal, so it costs no disk access. The
+        purge engine's trash directory is skipped.
+        """
+        METRICS.count('listdir')
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name == TRASH_DIR_NAME:
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                    if directories_only and not is_dir:
+                        continue
+                    METRICS.count('stat')
+                    entry_stat = entry.stat()
+                except OSError as e:
+                    logging.warning("Unable to stat '%s': %s", entry.path, e)
+                    continue
+                renamed = is_dir and renamed_lookup is not None and renamed_lookup(entry.path)
+                yield ScanEntry(entry.path, entry.name, is_dir, entry_stat.st_mtime, entry_stat.st_ino,
+                                entry_stat.st_dev, renamed)
+
+    @staticmethod
+    def scan_path(path, renamed_lookup=None):
+        """Return a ScanEntry for a single path, or None if it no longer exists."""
+        METRICS.count('stat')
+        try:
+            path_stat = os.stat(path)
+        except OSError:
+            return None
+        is_dir = stat.S_ISDIR(path_stat.st_mode)
+        renamed = is_dir and renamed_lookup is not None and renamed_lookup(path)
+        return ScanEntry(path, os.path.basename(path), is_dir, path_stat.st_mtime, path_stat.st_ino,
+                         path_stat.st_dev, renamed)
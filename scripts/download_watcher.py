@@ -0,0 +1,293 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import time
+from purge_engine import TRASH_DIR_NAME
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyBackend:
+    """Report changed release folders using Linux inotify through libc.
+
+    The purge engine's trash directory is neither watched nor reported, like in PollingBackend.
+    """
+
+    def __init__(self, root_paths):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError(errno.ENOSYS, 'libc not found')
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.root_paths = [os.path.normpath(path) for path in root_paths]
+        self.watches = {}
+        for root_path in self.root_paths:
+            self._watch_tree(root_path)
+
+    def _watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            # The folder may already have been moved away by the time its creation event is read.
+            logging.debug("Unable to watch '%s': %s", path, os.strerror(ctypes.get_errno()))
+            return
+        self.watches[wd] = path
+
+    def _watch_tree(self, path):
+        if os.path.basename(path) == TRASH_DIR_NAME:
+            return
+        self._watch(path)
+        for directory_path, directory_names, _ in os.walk(path):
+            directory_names[:] = [name for name in directory_names if name != TRASH_DIR_NAME]
+            for directory_name in directory_names:
+                self._watch(os.path.join(directory_path, directory_name))
+
+    def release_folder(self, path):
+        """Return (root path, release folder path) for a path below one of the roots, but not in the trash."""
+        for root_path in self.root_paths:
+            if path.startswith(root_path + os.sep):
+                release_name = os.path.relpath(path, root_path).split(os.sep)[0]
+                if release_name == TRASH_DIR_NAME:
+                    break
+                return root_path, os.path.join(root_path, release_name)
+        return None, None
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds and return the set of (root path, release folder path) that changed."""
+        poller = select.poll()
+        poller.register(self.fd, select.POLLIN)
+        if not poller.poll(max(timeout, 0) * 1000):
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    logging.warning("inotify event queue overflowed, rescanning watched directories")
+                    for root_path in self.root_paths:
+                        changed.update((root_path, entry.path) for entry in os.scandir(root_path)
+                                       if entry.is_dir() and entry.name != TRASH_DIR_NAME)
+                    continue
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                directory_path = self.watches.get(wd)
+                if directory_path is None:
+                    continue
+                path = os.path.join(directory_path, os.fsdecode(name)) if name else directory_path
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch_tree(path)
+                root_path, release_path = self.release_folder(path)
+                if release_path:
+                    changed.add((root_path, release_path))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingBackend:
+    """Report changed release folders by comparing scandir snapshots, for systems without inotify.
+
+    Each poll only stats the top-level release folders. A folder is walked when it is new,
+    when its own mtime moved, or while it was still changing at the previous poll, and it
+    settles once a walk finds it as it was. Settled folders cost one stat per poll.
+    """
+
+    def __init__(self, root_paths, interval=30.0):
+        self.root_paths = [os.path.normpath(path) for path in root_paths]
+        self.interval = interval
+        self.snapshots = {root_path: {} for root_path in self.root_paths}
+        self.changing = set()
+        for root_path in self.root_paths:
+            self._poll(root_path)
+
+    @staticmethod
+    def _signature(path):
+        """Return the newest mtime, total size and count of the files in a release folder."""
+        newest_mtime = 0.0
+        total_size = 0
+        count = 0
+        for directory_path, _, filenames in os.walk(path):
+            try:
+                newest_mtime = max(newest_mtime, os.stat(directory_path).st_mtime)
+            except OSError:
+                continue
+            for filename in filenames:
+                try:
+                    stat = os.stat(os.path.join(directory_path, filename))
+                except OSError:
+                    continue
+                newest_mtime = max(newest_mtime, stat.st_mtime)
+                total_size += stat.st_size
+                count += 1
+        return newest_mtime, total_size, count
+
+    def _poll(self, root_path):
+        """Update the snapshot of a root directory and return the release folders that changed in it."""
+        previous = self.snapshots[root_path]
+        snapshot = {}
+        changed = set()
+        try:
+            with os.scandir(root_path) as iterator:
+                entries = list(iterator)
+        except OSError as e:
+            logging.warning("Unable to scan '%s': %s", root_path, e)
+            return changed
+        for entry in entries:
+            try:
+                if entry.name == TRASH_DIR_NAME or not entry.is_dir():
+                    continue
+                folder_mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            known = previous.get(entry.path)
+            if known is not None and known[0] == folder_mtime and entry.path not in self.changing:
+                snapshot[entry.path] = known
+                continue
+            snapshot[entry.path] = (folder_mtime, self._signature(entry.path))
+            if snapshot[entry.path] == known:
+                self.changing.discard(entry.path)
+            else:
+                self.changing.add(entry.path)
+                changed.add(entry.path)
+        self.changing.difference_update(set(previous) - set(snapshot))
+        self.snapshots[root_path] = snapshot
+        return changed
+
+    def wait(self, timeout):
+        time.sleep(max(min(timeout, self.interval), 0))
+        return {(root_path, path) for root_path in self.root_paths for path in self._poll(root_path)}
+
+    def close(self):
+        pass
+
+
+class DownloadWatcher:
+    """Watch the completed download directories and process each release folder once it is quiescent.
+
+    Events are debounced per release folder: a folder is only handed to its handler
+    after no change was seen in it for quiet_seconds. Folders produced by a handler
+    are ignored for the following quiet period so our own renames are not re-processed.
+    batch_callback is called before each batch of quiescent folders and before the
+    periodic callback, for work that must not happen while a folder is being processed.
+    """
+
+    def __init__(self, handlers, quiet_seconds=30.0, poll_interval=30.0, force_polling=False,
+                 periodic_callback=None, periodic_interval=None, batch_callback=None):
+        # handlers maps a watched root directory to a callable taking a release folder path.
+        self.handlers = {os.path.normpath(path): handler for path, handler in handlers.items()}
+        self.quiet_seconds = quiet_seconds
+        self.periodic_callback = periodic_callback
+        self.periodic_interval = periodic_interval
+        self.batch_callback = batch_callback
+        self.pending = {}
+        self.ignored = {}
+        self.running = False
+        self.backend = None
+        if not force_polling:
+            try:
+                self.backend = InotifyBackend(self.handlers)
+                logging.info("Watching %s download directories with inotify", len(self.handlers))
+            except OSError as e:
+                logging.info("inotify unavailable (%s), falling back to polling", e)
+        if self.backend is None:
+            self.backend = PollingBackend(self.handlers, poll_interval)
+            logging.info("Watching %s download directories by polling every %ss", len(self.handlers), poll_interval)
+
+    @classmethod
+    def from_config(cls, config, handlers, force_polling=False, periodic_callback=None, batch_callback=None):
+        settings = config.settings.watch
+        periodic_hours = settings.retention_interval_hours
+        return cls(handlers,
+                   quiet_seconds=settings.quiet_seconds,
+                   poll_interval=settings.poll_interval,
+                   force_polling=force_polling or settings.force_polling,
+                   periodic_callback=periodic_callback,
+                   periodic_interval=periodic_hours * 3600 if periodic_hours else None,
+                   batch_callback=batch_callback)
+
+    def run(self):
+        """Process events until stop() is called."""
+        self.running = True
+        next_periodic = time.monotonic() + self.periodic_interval if self.periodic_interval else None
+        try:
+            while self.running:
+                now = time.monotonic()
+                deadlines = [last_event + self.quiet_seconds for _, last_event in self.pending.values()]
+                if next_periodic:
+                    deadlines.append(next_periodic)
+                timeout = min(deadlines) - now if deadlines else self.quiet_seconds
+                for root_path, release_path in self.backend.wait(timeout):
+                    if self.ignored.get(release_path, 0) > time.monotonic():
+                        continue
+                    self.pending[release_path] = (root_path, time.monotonic())
+                self.dispatch_quiescent()
+                if next_periodic and time.monotonic() >= next_periodic:
+                    next_periodic = time.monotonic() + self.periodic_interval
+                    self._start_batch()
+                    self._call(self.periodic_callback)
+        finally:
+            self.backend.close()
+
+    def stop(self):
+        self.running = False
+
+    def dispatch_quiescent(self):
+        """Hand every release folder that has been quiet for quiet_seconds to its handler."""
+        now = time.monotonic()
+        quiescent = [(release_path, root_path) for release_path, (root_path, last_event) in self.pending.items()
+                     if now - last_event >= self.quiet_seconds]
+        if quiescent:
+            self._start_batch()
+        for release_path, root_path in quiescent:
+            del self.pending[release_path]
+            if not os.path.isdir(release_path):
+                continue
+            logging.info("Release folder '%s' is quiescent, processing it", release_path)
+            result = self._call(self.handlers[root_path], release_path)
+            if result:
+                self.ignored[result] = time.monotonic() + self.quiet_seconds
+        self.ignored = {path: until for path, until in self.ignored.items() if until > now}
+
+    def _start_batch(self):
+        if self.batch_callback:
+            self._call(self.batch_callback)
+
+    @staticmethod
+    def _call(callback, *args):
+        try:
+            return callback(*args)
+        except Exception as e:
+            logging.error("Error while processing %s: %s", args[0] if args else 'periodic task', e, exc_info=True)
+            return None
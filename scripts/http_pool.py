@@ -0,0 +1,54 @@
+import http.client
+import queue
+from urllib.parse import urlsplit
+
+
+class ConnectionPool:
+    """Keep-alive HTTP connections to one host, reused across requests and threads."""
+
+    def __init__(self, base_url, size=2, timeout=10):
+        parsed = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.base_path = parsed.path.rstrip('/')
+        self.timeout = timeout
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def _connection(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return self.connection_class(self.host, self.port, timeout=self.timeout)
+
+    def _release(self, connection, response):
+        if response.will_close:
+            connection.close()
+            return
+        try:
+            self.idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def request(self, method, path, headers=None):
+        """Send a request and return (status, body). A stale keep-alive connection is retried once."""
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(method, self.base_path + path, headers=headers or {})
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                connection.close()
+                if attempt:
+                    raise ConnectionError(f"Request to {self.host} failed: {e}") from e
+                continue
+            self._release(connection, response)
+            return response.status, body
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,258 @@
+import json
+import logging
+import os
+import re
+from release_parser import RELEASE_PARSER
+from run_metrics import METRICS
+from show_index import ShowIndex
+
+SEASON_FOLDER_REGEX = re.compile(r'^Season\s*(\d+)$', re.IGNORECASE)
+
+
+class LibraryIndex:
+    """Index of show -> season -> episode numbers for the tv show libraries.
+
+    The index is built once per run (or loaded from an on-disk cache) and kept up
+    to date as episodes are moved in, so duplicate checks never touch the disk.
+    """
+
+    CACHE_VERSION = 2
+
+    def __init__(self, library_paths, cache_path=None, match_threshold=0.8):
+        # Library paths are listed in priority order, the first library holding a show wins.
+        self.library_paths = list(library_paths)
+        self.cache_path = cache_path
+        self.match_threshold = match_threshold
+        self.libraries = {}
+        self.shows = {}
+        self.show_index = ShowIndex(match_threshold)
+
+    @classmethod
+    def load_or_build(cls, library_paths, cache_path=None, match_threshold=0.8):
+        """Create an index from the cache if possible, rescanning only directories whose mtime changed."""
+        index = cls(library_paths, cache_path, match_threshold)
+        cached = index._read_cache()
+        for library_path in index.library_paths:
+            index._index_library(library_path, cached.get(library_path, {}))
+        index._rebuild_show_lookup()
+        return index
+
+    def _read_cache(self):
+        if not self.cache_path or not os.path.isfile(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except Exception as e:
+            logging.warning("Unable to read library index cache '%s': %s", self.cache_path, e)
+            return {}
+        if data.get('version') != self.CACHE_VERSION:
+            logging.info("Ignoring library index cache '%s' with unknown version", self.cache_path)
+            return {}
+        return data.get('libraries', {})
+
+    def _index_library(self, library_path, cached_library):
+        """Index every show folder of a library, reusing cached seasons when their mtime is unchanged."""
+        shows = {}
+        cached_shows = cached_library.get('shows', {})
+        METRICS.count('listdir')
+        try:
+            entries = list(os.scandir(library_path))
+        except OSError as e:
+            logging.error("Unable to list tv show library '%s': %s", library_path, e)
+            self.libraries[library_path] = {'shows': shows}
+            return
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            METRICS.count('stat')
+            try:
+                show_mtime = entry.stat().st_mtime
+            except OSError as e:
+                logging.warning("Unable to stat show folder '%s': %s", entry.path, e)
+                continue
+            shows[entry.name] = self._index_show(entry.path, show_mtime, cached_shows.get(entry.name))
+        self.libraries[library_path] = {'shows': shows}
+
+    def _index_show(self, show_path, show_mtime, cached_show):
+        cached_seasons = {season['folder']: season for season in cached_show.get('seasons', [])} if cached_show else {}
+        if cached_show and cached_show.get('mtime') == show_mtime:
+            # No season folder was added or removed, only re-check the season folders themselves.
+            season_folders = list(cached_seasons)
+        else:
+            logging.debug("Scanning show folder '%s'", show_path)
+            METRICS.count('listdir')
+            try:
+                season_folders = [entry.name for entry in os.scandir(show_path)
+                                  if SEASON_FOLDER_REGEX.match(entry.name) and entry.is_dir()]
+            except OSError as e:
+                logging.warning("Unable to list show folder '%s': %s", show_path, e)
+                season_folders = []
+
+        seasons = {}
+        for season_folder in season_folders:
+            season_path = os.path.join(show_path, season_folder)
+            METRICS.count('stat')
+            try:
+                season_mtime = os.stat(season_path).st_mtime
+            except OSError:
+                continue
+            cached_season = cached_seasons.get(season_folder)
+            if cached_season and cached_season.get('mtime') == season_mtime:
+                episodes = set(cached_season.get('episodes', []))
+            else:
+                episodes = self._scan_season(season_path)
+            season_number = int(SEASON_FOLDER_REGEX.match(season_folder).group(1))
+            seasons[season_number] = {'folder': season_folder, 'mtime': season_mtime, 'episodes': episodes}
+        return {'mtime': show_mtime, 'seasons': seasons}
+
+    @staticmethod
+    def _scan_season(season_path):
+        """Collect the episode numbers found in a season folder."""
+        logging.debug("Scanning season folder '%s'", season_path)
+        episodes = set()
+        METRICS.count('listdir')
+        try:
+            for release in RELEASE_PARSER.parse_many(os.listdir(season_path)):
+                if release is not None:
+                    episodes.update(release.episodes)
+        except OSError as e:
+            logging.warning("Unable to list season folder '%s': %s", season_path, e)
+        return episodes
+
+    def _rebuild_show_lookup(self):
+        self.shows = {}
+        for library_path in reversed(self.library_paths):
+            for show_name, show in self.libraries.get(library_path, {}).get('shows', {}).items():
+                self.shows[show_name] = (library_path, show)
+        self.show_index = ShowIndex(self.match_threshold)
+        for library_path in self.library_paths:
+            for show_name in self.libraries.get(library_path, {}).get('shows', {}):
+                self.show_index.add(show_name)
+
+    def refresh_show(self, show_name):
+        """Re-validate a single show against the disk, picking it up if it was added to a library since indexing."""
+        for library_path in self.library_paths:
+            show_path = os.path.join(library_path, show_name)
+            METRICS.count('stat')
+            try:
+                show_mtime = os.stat(show_path).st_mtime
+            except OSError:
+                continue
+            shows = self.libraries.setdefault(library_path, {'shows': {}})['shows']
+            cached_show = shows.get(show_name)
+            if cached_show:
+                cached_show = {'mtime': cached_show['mtime'], 'seasons': list(cached_show['seasons'].values())}
+            shows[show_name] = self._index_show(show_path, show_mtime, cached_show)
+            self.shows[show_name] = (library_path, shows[show_name])
+            self.show_index.add(show_name)
+            return library_path
+        self.shows.pop(show_name, None)
+        self.show_index.remove(show_name)
+        return None
+
+    def resolve_show(self, show_name):
+        """Return the library folder name of a show, matching loosely when there is no folder of that exact name."""
+        if show_name in self.shows:
+            return show_name
+        found = self.show_index.find(show_name)
+        return found if found in self.shows else None
+
+    def find_show(self, show_name):
+        """Return the library path that holds the show, or None if the show is not in any library."""
+        found = self.shows.get(show_name)
+        return found[0] if found else None
+
+    def season_path(self, show_name, season_number):
+        """Return the folder path for a season, using the existing folder name when there is one."""
+        library_path, show = self.shows[show_name]
+        season = show['seasons'].get(season_number)
+        season_folder = season['folder'] if season else f'Season {season_number}'
+        return os.path.join(library_path, show_name, season_folder)
+
+    def has_season(self, show_name, season_number):
+        """Return True if the show already has a folder for the season."""
+        found = self.shows.get(show_name)
+        return found is not None and season_number in found[1]['seasons']
+
+    def has_episode(self, show_name, season_number, episode_number):
+        """Return True if the episode already exists in the library."""
+        found = self.shows.get(show_name)
+        if not found:
+            return False
+        season = found[1]['seasons'].get(season_number)
+        return season is not None and episode_number in season['episodes']
+
+    def episode_paths(self, show_name, season_number, episode_number):
+        """List the files or folders of an episode in the library, reading its season folder."""
+        season_path = self.season_path(show_name, season_number)
+        METRICS.count('listdir')
+        try:
+            names = os.listdir(season_path)
+        except OSError:
+            return []
+        episode_paths = []
+        for name, release in zip(names, RELEASE_PARSER.parse_many(names)):
+            if release is not None and episode_number in release.episodes:
+                episode_paths.append(os.path.join(season_path, name))
+        return episode_paths
+
+    def add_episode(self, show_name, season_number, episode_number, refresh_mtime=True):
+        """Record an episode that was (or is about to be) moved into the library."""
+        library_path, show = self.shows[show_name]
+        season_path = self.season_path(show_name, season_number)
+        season = show['seasons'].setdefault(season_number, {'folder': os.path.basename(season_path),
+                                                            'mtime': None, 'episodes': set()})
+        season['episodes'].add(episode_number)
+        if refresh_mtime:
+            self.refresh_season(show_name, season_number)
+
+    def discard_episodes(self, show_name, season_number, episode_numbers):
+        """Forget episodes whose move into the library failed, rescanning their season on the next load."""
+        found = self.shows.get(show_name)
+        season = found[1]['seasons'].get(season_number) if found else None
+        if season is None:
+            return
+        season['episodes'].difference_update(episode_numbers)
+        season['mtime'] = None
+
+    def refresh_season(self, show_name, season_number):
+        """Record the current mtimes of a season and its show after we changed them ourselves.
+
+        This lets the next run reuse the cached episodes instead of rescanning the season.
+        """
+        library_path, show = self.shows[show_name]
+        season_path = self.season_path(show_name, season_number)
+        season = show['seasons'].get(season_number)
+        if season is None:
+            return
+        METRICS.count('stat', 2)
+        try:
+            season['mtime'] = os.stat(season_path).st_mtime
+            show['mtime'] = os.stat(os.path.dirname(season_path)).st_mtime
+        except OSError as e:
+            logging.debug("Unable to refresh mtime of '%s': %s", season_path, e)
+
+    def save(self):
+        """Write the index to the cache file."""
+        if not self.cache_path:
+            return
+        libraries = {}
+        for library_path, library in self.libraries.items():
+            shows = {}
+            for show_name, show in library['shows'].items():
+                seasons = [{'folder': season['folder'], 'mtime': season['mtime'], 'episodes': sorted(season['episodes'])}
+                           for season in show['seasons'].values()]
+                shows[show_name] = {'mtime': show['mtime'], 'seasons': seasons}
+            libraries[library_path] = {'shows': shows}
+        cache_dir = os.path.dirname(self.cache_path)
+        try:
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            temp_path = f"{self.cache_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump({'version': self.CACHE_VERSION, 'libraries': libraries}, file)
+            os.replace(temp_path, self.cache_path)
+            logging.debug("Saved library index cache to '%s'", self.cache_path)
+        except Exception as e:
+            logging.warning("Unable to save library index cache '%s': %s", self.cache_path, e)
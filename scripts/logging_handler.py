@@ -1,21 +1,96 @@
+import atexit
+import copy
+import json
 import os
 import logging
+import logging.handlers
+import queue
 
 
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - [Line:%(lineno)s] - %(message)s'
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format records as one JSON object per line.
+
+    Structured fields passed through extra= (operation, source, destination, bytes, duration)
+    are written as their own keys so the log can be filtered and aggregated.
+    """
+
+    FIELDS = ('operation', 'source', 'destination', 'bytes', 'duration')
+
+    def format(self, record):
+        entry = {'time': self.formatTime(record), 'level': record.levelname, 'module': record.module,
+                 'line': record.lineno, 'message': record.getMessage()}
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records without formatting them, so the listener thread does the formatting.
+
+    The stock QueueHandler formats the record in the calling thread and drops exc_info,
+    which folds tracebacks into the message. Only the message arguments are merged here,
+    they may change once the caller moves on.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
 
 class LoggingHandler:
+    listener = None
+
     @staticmethod
     def setup_logging(config):
-        log_level = config.get('logging', {}).get('level', 'DEBUG')
-        log_file = config.get('logging', {}).get('file', 'rename_completed_downloads.log')
+        """Log through a queue so callers never wait on the log file or console.
+
+        A QueueListener thread writes the records to a size-rotated log file and the console.
+        """
+        logging_config = config.logging
+        log_level = logging_config.level
+        log_file = logging_config.file
         try:
             log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', os.path.dirname(log_file))
             if not os.path.exists(log_dir):
                 os.makedirs(log_dir)
             log_file_path = os.path.join(log_dir, os.path.basename(log_file))
-            logging.basicConfig(level=getattr(logging, log_level.upper(), 'INFO'),
-                                format='%(asctime)s - %(levelname)s - [Line:%(lineno)s] - %(message)s',
-                                handlers=[logging.FileHandler(log_file_path, encoding='utf-8'),
-                                          logging.StreamHandler()])
+
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file_path, maxBytes=logging_config.max_bytes, backupCount=logging_config.backup_count,
+                encoding='utf-8')
+            if logging_config.format == 'json':
+                file_handler.setFormatter(JsonLinesFormatter())
+            else:
+                file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+            stream_handler = logging.StreamHandler()
+            stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+            LoggingHandler.shutdown()
+            log_queue = queue.SimpleQueue()
+            LoggingHandler.listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler)
+            LoggingHandler.listener.start()
+            atexit.register(LoggingHandler.shutdown)
+
+            root_logger = logging.getLogger()
+            for handler in list(root_logger.handlers):
+                root_logger.removeHandler(handler)
+            root_logger.addHandler(DeferredQueueHandler(log_queue))
+            root_logger.setLevel(getattr(logging, log_level.upper(), logging.INFO))
         except Exception as e:
-            raise RuntimeError(f"Error setting up logging: {e}")
\ No newline at end of file
+            raise RuntimeError(f"Error setting up logging: {e}")
+
+    @staticmethod
+    def shutdown():
+        """Stop the listener thread after it has written every queued record."""
+        if LoggingHandler.listener is not None:
+            LoggingHandler.listener.stop()
+            LoggingHandler.listener = None
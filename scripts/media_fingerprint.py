@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+from run_metrics import METRICS
+
+MEDIA_EXTENSIONS = {'.mkv', '.mp4', '.m4v', '.avi', '.mov', '.wmv', '.ts', '.m2ts', '.mpg', '.mpeg', '.webm'}
+
+
+class FingerprintCache:
+    """Persistent fingerprint cache keyed by (device, inode, size, mtime) so unchanged files are never re-read."""
+
+    def __init__(self, cache_path=None, max_entries=200000):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.entries = {}
+        self.dirty = False
+        # The movie and tv show pipelines may share one cache from parallel threads.
+        self.lock = threading.Lock()
+        if cache_path and os.path.isfile(cache_path):
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as file:
+                    self.entries = json.load(file)
+            except Exception as e:
+                logging.warning("Unable to read fingerprint cache '%s': %s", cache_path, e)
+
+    @staticmethod
+    def key(file_stat):
+        return f"{file_stat.st_dev}:{file_stat.st_ino}:{file_stat.st_size}:{file_stat.st_mtime_ns}"
+
+    def get(self, file_stat):
+        return self.entries.get(self.key(file_stat))
+
+    def put(self, file_stat, fingerprint):
+        with self.lock:
+            self.entries[self.key(file_stat)] = fingerprint
+            self.dirty = True
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        if not self.cache_path or not self.dirty:
+            return
+        # Drop the oldest entries first, dicts keep insertion order.
+        while len(self.entries) > self.max_entries:
+            del self.entries[next(iter(self.entries))]
+        cache_dir = os.path.dirname(self.cache_path)
+        try:
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            temp_path = f"{self.cache_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump(self.entries, file)
+            os.replace(temp_path, self.cache_path)
+            self.dirty = False
+        except Exception as e:
+            logging.warning("Unable to save fingerprint cache '%s': %s", self.cache_path, e)
+
+
+class MediaFingerprinter:
+    """Identify identical media files from their size plus sampled head, middle and tail chunks.
+
+    Samples are read through mmap so only the touched pages are fetched, which keeps
+    fingerprinting a multi-GB file to a few MB of I/O.
+    """
+
+    def __init__(self, cache=None, sample_size=1024 * 1024, min_size=0):
+        self.cache = cache or FingerprintCache()
+        self.sample_size = sample_size
+        self.min_size = min_size
+
+    @classmethod
+    def from_config(cls, config):
+        settings = config.settings.duplicates
+        return cls(FingerprintCache(settings.fingerprint_cache), sample_size=settings.sample_size,
+                   min_size=settings.min_media_size)
+
+    def fingerprint(self, path, file_stat=None):
+        """Return the fingerprint of a file, using the cache when the file is unchanged."""
+        file_stat = file_stat or os.stat(path)
+        fingerprint = self.cache.get(file_stat)
+        if fingerprint is None:
+            fingerprint = self._compute(path, file_stat.st_size)
+            self.cache.put(file_stat, fingerprint)
+        return fingerprint
+
+    def _compute(self, path, size):
+        digest = hashlib.blake2b(str(size).encode(), digest_size=20)
+        METRICS.count('fingerprint')
+        if size:
+            with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if size <= 3 * self.sample_size:
+                    digest.update(mapped[:])
+                else:
+                    middle = (size - self.sample_size) // 2
+                    digest.update(mapped[:self.sample_size])
+                    digest.update(mapped[middle:middle + self.sample_size])
+                    digest.update(mapped[size - self.sample_size:])
+        return digest.hexdigest()
+
+    def media_files(self, path):
+        """Return {relative path: stat} for the media files in a folder, or the file itself."""
+        if os.path.isfile(path):
+            return {os.path.basename(path): os.stat(path)} if self._is_media(path) else {}
+        media_files = {}
+        for directory_path, _, filenames in os.walk(path):
+            for filename in filenames:
+                file_path = os.path.join(directory_path, filename)
+                if not self._is_media(file_path):
+                    continue
+                try:
+                    file_stat = os.stat(file_path)
+                except OSError:
+                    continue
+                if file_stat.st_size >= self.min_size:
+                    media_files[os.path.relpath(file_path, path)] = file_stat
+        return media_files
+
+    @staticmethod
+    def _is_media(path):
+        return os.path.splitext(path)[1].lower() in MEDIA_EXTENSIONS
+
+    def find_identical(self, release_path, library_paths):
+        """Match every media file of a release against the media files of existing library paths.
+
+        Returns {file size: identical library file} when every media file of the release has an
+        identical copy in the library, otherwise None. Matches are keyed by size so they still
+        apply after the release files were renamed. Sizes are compared first so fingerprints
+        are only computed for files that could be identical.
+        """
+        release_files = self.media_files(release_path)
+        sizes = [file_stat.st_size for file_stat in release_files.values()]
+        if not release_files or len(set(sizes)) != len(sizes):
+            return None
+        library_files_by_size = {}
+        for library_path in library_paths:
+            for relative_path, file_stat in self.media_files(library_path).items():
+                full_path = library_path if os.path.isfile(library_path) else os.path.join(library_path, relative_path)
+                library_files_by_size.setdefault(file_stat.st_size, []).append((full_path, file_stat))
+
+        matches = {}
+        for relative_path, file_stat in release_files.items():
+            candidates = library_files_by_size.get(file_stat.st_size)
+            if not candidates:
+                return None
+            release_file = release_path if os.path.isfile(release_path) else os.path.join(release_path, relative_path)
+            fingerprint = self.fingerprint(release_file, file_stat)
+            match = next((library_file for library_file, library_stat in candidates
+                          if self.fingerprint(library_file, library_stat) == fingerprint), None)
+            if match is None:
+                return None
+            matches[str(file_stat.st_size)] = match
+        return matches
+
+    def save(self):
+        self.cache.save()
@@ -0,0 +1,307 @@
+import logging
+import mmap
+import os
+import struct
+from collections import namedtuple
+from media_fingerprint import MEDIA_EXTENSIONS, FingerprintCache
+from run_metrics import METRICS
+
+# width and height are in pixels, duration in seconds and bitrate in bits per second. Any of
+# them is None when the container headers do not tell.
+MediaInfo = namedtuple('MediaInfo', 'width height codec duration bitrate')
+
+MATROSKA_EXTENSIONS = {'.mkv', '.webm'}
+MP4_EXTENSIONS = {'.mp4', '.m4v', '.mov'}
+MATROSKA_CODECS = {'V_MPEG4/ISO/AVC': 'h264', 'V_MPEGH/ISO/HEVC': 'hevc', 'V_AV1': 'av1', 'V_VP9': 'vp9',
+                   'V_VP8': 'vp8', 'V_MPEG4/ISO/ASP': 'mpeg4', 'V_MPEG2': 'mpeg2'}
+MP4_CODECS = {b'avc1': 'h264', b'avc3': 'h264', b'hvc1': 'hevc', b'hev1': 'hevc', b'av01': 'av1', b'vp09': 'vp9',
+              b'mp4v': 'mpeg4'}
+# How much picture each codec keeps per bit compared with h264, unknown codecs count as older ones.
+CODEC_EFFICIENCY = {'av1': 2.0, 'hevc': 1.5, 'vp9': 1.5, 'h264': 1.0}
+UNKNOWN_CODEC_EFFICIENCY = 0.75
+# At the same resolution a release replaces a library copy only with this much more codec-weighted bitrate.
+MIN_BITRATE_GAIN = 1.1
+RESOLUTIONS = (2160, 1440, 1080, 720, 576, 480)
+
+# Matroska element IDs, including their length marker bits.
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TIMESTAMP_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+CLUSTER = 0x1F43B675
+
+
+def _read_vint(data, offset, keep_marker=False):
+    """Read an EBML variable length integer, returning (value, offset after it, True when all value bits are set)."""
+    first = data[offset]
+    length = 9 - first.bit_length()
+    if not first or offset + length > len(data):
+        raise ValueError(f"invalid EBML integer at offset {offset}")
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[offset + 1:offset + length]:
+        value = value << 8 | byte
+    return value, offset + length, value == (1 << 7 * length) - 1
+
+
+def _ebml_elements(data, start, end):
+    """Yield (element id, data start, data end) for the elements between start and end, without reading their data."""
+    offset = start
+    while offset < end:
+        element_id, offset, _ = _read_vint(data, offset, keep_marker=True)
+        size, offset, unknown_size = _read_vint(data, offset)
+        data_end = end if unknown_size else min(offset + size, end)
+        yield element_id, offset, data_end
+        offset = data_end
+
+
+def _ebml_uint(data, start, end):
+    return int.from_bytes(data[start:end], 'big')
+
+
+def _probe_matroska(data):
+    elements = _ebml_elements(data, 0, len(data))
+    if next(elements, (None,))[0] != EBML_HEADER:
+        return None
+    segment = next(((start, end) for element_id, start, end in elements if element_id == SEGMENT), None)
+    if segment is None:
+        return None
+    found = {}
+    positions = {}
+    # Info and Tracks come before the first cluster in practically every file, the seek head
+    # finds them when a muxer wrote them elsewhere.
+    for element_id, start, end in _ebml_elements(data, *segment):
+        if element_id in (INFO, TRACKS):
+            found[element_id] = (start, end)
+        elif element_id == SEEK_HEAD:
+            for seek_id, seek_start, seek_end in _ebml_elements(data, start, end):
+                if seek_id != SEEK:
+                    continue
+                seek = {child_id: (child_start, child_end)
+                        for child_id, child_start, child_end in _ebml_elements(data, seek_start, seek_end)}
+                if SEEK_ID in seek and SEEK_POSITION in seek:
+                    positions[_ebml_uint(data, *seek[SEEK_ID])] = segment[0] + _ebml_uint(data, *seek[SEEK_POSITION])
+        if INFO in found and TRACKS in found or element_id == CLUSTER:
+            break
+    for element_id in (INFO, TRACKS):
+        if element_id not in found and segment[0] < positions.get(element_id, 0) < segment[1]:
+            seek_id, start, end = next(_ebml_elements(data, positions[element_id], segment[1]))
+            if seek_id == element_id:
+                found[element_id] = (start, end)
+    if TRACKS not in found:
+        return None
+
+    duration = None
+    if INFO in found:
+        timestamp_scale, raw_duration = 1000000, None
+        for element_id, start, end in _ebml_elements(data, *found[INFO]):
+            if element_id == TIMESTAMP_SCALE:
+                timestamp_scale = _ebml_uint(data, start, end)
+            elif element_id == DURATION and end - start in (4, 8):
+                raw_duration = struct.unpack('>f' if end - start == 4 else '>d', data[start:end])[0]
+        if raw_duration:
+            duration = raw_duration * timestamp_scale / 1e9
+    for entry_id, entry_start, entry_end in _ebml_elements(data, *found[TRACKS]):
+        if entry_id != TRACK_ENTRY:
+            continue
+        track = {element_id: (start, end) for element_id, start, end in _ebml_elements(data, entry_start, entry_end)}
+        if TRACK_TYPE not in track or _ebml_uint(data, *track[TRACK_TYPE]) != 1:
+            continue
+        codec_id = data[slice(*track[CODEC_ID])].decode('ascii', 'replace').rstrip('\x00') if CODEC_ID in track else ''
+        video = {element_id: (start, end) for element_id, start, end in _ebml_elements(data, *track[VIDEO])} \
+            if VIDEO in track else {}
+        width = _ebml_uint(data, *video[PIXEL_WIDTH]) if PIXEL_WIDTH in video else None
+        height = _ebml_uint(data, *video[PIXEL_HEIGHT]) if PIXEL_HEIGHT in video else None
+        return width, height, MATROSKA_CODECS.get(codec_id, codec_id.lower() or None), duration
+    return None
+
+
+def _mp4_boxes(data, start, end):
+    """Yield (box type, data start, data end) for the boxes between start and end, without reading their data."""
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            raise ValueError(f"invalid box size at offset {offset}")
+        yield box_type, offset + header_size, min(offset + size, end)
+        offset += size
+
+
+def _mp4_children(data, box):
+    return {box_type: (start, end) for box_type, start, end in _mp4_boxes(data, *box)}
+
+
+def _probe_mp4(data):
+    moov = None
+    # The top level walk only reads box headers, so a moov box at the end of the file costs a few pages.
+    for index, (box_type, start, end) in enumerate(_mp4_boxes(data, 0, len(data))):
+        if index == 0 and box_type not in (b'ftyp', b'moov', b'free', b'skip', b'wide', b'mdat'):
+            return None
+        if box_type == b'moov':
+            moov = (start, end)
+            break
+    if moov is None:
+        return None
+    duration = video_track = None
+    for box_type, start, end in _mp4_boxes(data, *moov):
+        if box_type == b'mvhd':
+            if data[start] == 1:
+                timescale, length = struct.unpack_from('>IQ', data, start + 20)
+            else:
+                timescale, length = struct.unpack_from('>II', data, start + 12)
+            duration = length / timescale if timescale and length not in (0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF) else None
+        elif box_type == b'trak' and video_track is None:
+            track = _mp4_children(data, (start, end))
+            mdia = _mp4_children(data, track[b'mdia']) if b'mdia' in track else {}
+            if b'hdlr' not in mdia or data[mdia[b'hdlr'][0] + 8:mdia[b'hdlr'][0] + 12] != b'vide':
+                continue
+            stbl = _mp4_children(data, _mp4_children(data, mdia[b'minf'])[b'stbl'])
+            entry = stbl[b'stsd'][0] + 8
+            codec, width, height = data[entry + 4:entry + 8], None, None
+            if entry + 36 <= stbl[b'stsd'][1]:
+                width, height = struct.unpack_from('>HH', data, entry + 32)
+            if not width and b'tkhd' in track:
+                width, height = (value >> 16 for value in struct.unpack_from('>II', data, track[b'tkhd'][1] - 8))
+            video_track = (width or None, height or None, MP4_CODECS.get(codec, codec.decode('ascii', 'replace')))
+    if video_track is None:
+        return None
+    return (*video_track, duration)
+
+
+class MediaProber:
+    """Read the resolution, codec, duration and bitrate of MKV and MP4 files from their container headers.
+
+    Files are read through mmap and only the header elements are parsed, so probing a multi-GB
+    file touches a few pages at its start, plus a few at its end when an MP4 keeps its moov box
+    there. Results are cached by device, inode, size and mtime, like fingerprints.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache or FingerprintCache()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(FingerprintCache(config.settings.duplicates.probe_cache))
+
+    def probe(self, path, file_stat=None):
+        """Return the MediaInfo of a media file, or None when it is not an MKV or MP4 file that could be read."""
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in MATROSKA_EXTENSIONS and extension not in MP4_EXTENSIONS:
+            return None
+        file_stat = file_stat or os.stat(path)
+        cached = self.cache.get(file_stat)
+        if cached is None:
+            cached = self._probe(path, file_stat.st_size, extension)
+            self.cache.put(file_stat, cached)
+        return MediaInfo(*cached) if cached else None
+
+    @staticmethod
+    def _probe(path, size, extension):
+        if not size:
+            return []
+        METRICS.count('probe')
+        try:
+            with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                probed = _probe_matroska(mapped) if extension in MATROSKA_EXTENSIONS else _probe_mp4(mapped)
+        except (ValueError, KeyError, IndexError, struct.error) as e:
+            logging.debug("Unable to parse the headers of '%s': %s", path, e)
+            return []
+        if probed is None:
+            logging.debug("No video track found in '%s'", path)
+            return []
+        width, height, codec, duration = probed
+        return [width, height, codec, duration, round(size * 8 / duration) if duration else None]
+
+    @staticmethod
+    def main_file(path):
+        """Return (path, stat) of the largest media file of a release folder, or of the file itself, or None."""
+        if os.path.isfile(path):
+            return path, os.stat(path)
+        largest = None
+        for directory_path, _, filenames in os.walk(path):
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() not in MEDIA_EXTENSIONS:
+                    continue
+                file_path = os.path.join(directory_path, filename)
+                try:
+                    file_stat = os.stat(file_path)
+                except OSError:
+                    continue
+                if largest is None or file_stat.st_size > largest[1].st_size:
+                    largest = (file_path, file_stat)
+        return largest
+
+    def probe_release(self, path):
+        """Return the MediaInfo of the largest media file of a release folder, or of the file itself."""
+        main_file = self.main_file(path)
+        return self.probe(*main_file) if main_file else None
+
+    @staticmethod
+    def resolution(media_info):
+        """Return the standard resolution of a video, cropped widescreen video counts by its width."""
+        resolution = max(media_info.height or 0, (media_info.width or 0) * 9 // 16)
+        return next((standard for standard in RESOLUTIONS if resolution >= standard * 0.9), 0)
+
+    @staticmethod
+    def weighted_bitrate(media_info):
+        """Return the bitrate scaled by the codec efficiency, or None when the bitrate is not known."""
+        if not media_info.bitrate:
+            return None
+        return media_info.bitrate * CODEC_EFFICIENCY.get(media_info.codec, UNKNOWN_CODEC_EFFICIENCY)
+
+    def is_better(self, release, library):
+        """Return True when a release has a higher resolution, or the same one with clearly more codec-weighted bitrate.
+
+        A better codec alone is not enough, so a small re-encode never replaces a remux.
+        """
+        release_resolution, library_resolution = self.resolution(release), self.resolution(library)
+        if release_resolution != library_resolution:
+            return release_resolution > library_resolution
+        release_bitrate, library_bitrate = self.weighted_bitrate(release), self.weighted_bitrate(library)
+        return release_bitrate is not None and library_bitrate is not None and \
+            release_bitrate >= library_bitrate * MIN_BITRATE_GAIN
+
+    def is_upgrade(self, release_path, library_paths):
+        """Return True when a release is better than every library copy, see is_better().
+
+        The durations have to agree within 10%, so a different cut or an incomplete file never
+        replaces a library copy. A copy that cannot be probed is never replaced. Files next to
+        the copies that are not media, like subtitles, are not compared.
+        """
+        library_paths = [path for path in library_paths
+                         if os.path.isdir(path) or os.path.splitext(path)[1].lower() in MEDIA_EXTENSIONS]
+        release = self.probe_release(release_path) if library_paths else None
+        if release is None:
+            return False
+        for library_path in library_paths:
+            library = self.probe_release(library_path)
+            if library is None or not self.is_better(release, library):
+                return False
+            if release.duration and library.duration and \
+                    abs(release.duration - library.duration) > 0.1 * library.duration:
+                logging.info("Not replacing '%s', its duration differs from '%s'", library_path, release_path)
+                return False
+            logging.info("'%s' (%sx%s %s %s b/s) is better than '%s' (%sx%s %s %s b/s)", release_path, release.width,
+                         release.height, release.codec, release.bitrate, library_path, library.width, library.height,
+                         library.codec, library.bitrate)
+        return True
+
+    def save(self):
+        self.cache.save()
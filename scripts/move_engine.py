@@ -0,0 +1,242 @@
+import errno
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from run_metrics import METRICS
+
+# Errors that mean a kernel-side copy is not available for this pair of files.
+KERNEL_COPY_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSUP}
+
+
+class MoveProgress:
+    """Progress of a single directory move."""
+
+    def __init__(self, source, destination, total_bytes, callback=None, interval=10.0):
+        self.source = source
+        self.destination = destination
+        self.total_bytes = total_bytes
+        self.copied_bytes = 0
+        self.callback = callback
+        self.interval = interval
+        self.started = time.monotonic()
+        self.last_report = self.started
+
+    def update(self, copied_bytes):
+        self.copied_bytes += copied_bytes
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 0.001)
+        percent = 100.0 * self.copied_bytes / self.total_bytes if self.total_bytes else 100.0
+        logging.info("Copying '%s' to '%s': %.1f%% (%.1f MiB/s)",
+                     self.source, self.destination, percent, self.copied_bytes / elapsed / 1048576)
+        if self.callback:
+            self.callback(self.source, self.destination, self.copied_bytes, self.total_bytes)
+
+
+class MoveEngine:
+    """Move directories and files, renaming in place on the same device and copying on a worker pool otherwise.
+
+    Same-device moves are an atomic os.rename. Cross-device moves are copied with
+    copy_file_range/sendfile (falling back to a buffered copy) into a '.partial'
+    path, renamed into place and only then removed from the source. The number of
+    concurrent copies per destination device is capped.
+    """
+
+    def __init__(self, max_workers=4, max_concurrent_per_device=2, chunk_size=8 * 1024 * 1024,
+                 progress_interval=10.0, progress_callback=None):
+        self.max_concurrent_per_device = max_concurrent_per_device
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        self.progress_callback = progress_callback
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='move')
+        self.device_semaphores = {}
+        self.lock = threading.Lock()
+        self.pending = []
+        self.copy_file_range_supported = hasattr(os, 'copy_file_range')
+        self.sendfile_supported = hasattr(os, 'sendfile')
+
+    @classmethod
+    def from_config(cls, config):
+        settings = config.settings.move_engine
+        return cls(max_workers=settings.max_workers, max_concurrent_per_device=settings.max_concurrent_per_device,
+                   progress_interval=settings.progress_interval)
+
+    @staticmethod
+    def same_device(source, destination):
+        """Return True if source and the parent directory of destination are on the same device."""
+        try:
+            return os.stat(source).st_dev == os.stat(os.path.dirname(destination) or '.').st_dev
+        except OSError:
+            return False
+
+    def move(self, source, destination):
+        """Move source to destination, returning a Future that completes when the move is done."""
+        if self.same_device(source, destination):
+            future = Future()
+            try:
+                METRICS.count('rename')
+                os.rename(source, destination)
+                future.set_result(destination)
+                return future
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    future.set_exception(e)
+                    return future
+                # Bind mounts can share a device number but still refuse a rename.
+        future = self.executor.submit(self._copy_and_remove, source, destination)
+        with self.lock:
+            self.pending.append((source, destination, future))
+        return future
+
+    def wait(self, futures=None):
+        """Wait for pending moves, returning a list of (source, destination, exception) for failures.
+
+        Without futures every pending move is waited for. Executors sharing the engine from
+        parallel pipelines pass their own futures, so each waits for and reports only its moves.
+        """
+        with self.lock:
+            if futures is None:
+                pending, self.pending = self.pending, []
+            else:
+                futures = set(futures)
+                pending = [item for item in self.pending if item[2] in futures]
+                self.pending = [item for item in self.pending if item[2] not in futures]
+        failures = []
+        for source, destination, future in pending:
+            exception = future.exception()
+            if exception:
+                logging.error("Failed to move '%s' to '%s': %s", source, destination, exception)
+                failures.append((source, destination, exception))
+        return failures
+
+    def shutdown(self):
+        self.wait()
+        self.executor.shutdown(wait=True)
+
+    def _device_semaphore(self, path):
+        device = os.stat(path).st_dev
+        with self.lock:
+            if device not in self.device_semaphores:
+                self.device_semaphores[device] = threading.Semaphore(self.max_concurrent_per_device)
+            return self.device_semaphores[device]
+
+    def _copy_and_remove(self, source, destination):
+        if os.path.exists(destination):
+            raise FileExistsError(errno.EEXIST, 'Destination already exists', destination)
+        partial_path = f"{destination}.partial"
+        if os.path.lexists(partial_path):
+            # Left behind by a copy that was interrupted by a crash.
+            self._remove(partial_path)
+        with self._device_semaphore(os.path.dirname(destination) or '.'):
+            progress = MoveProgress(source, destination, self._total_size(source), self.progress_callback,
+                                    self.progress_interval)
+            logging.info("Copying '%s' to '%s' across devices (%s bytes)", source, destination, progress.total_bytes)
+            try:
+                if os.path.isdir(source):
+                    self._copy_tree(source, partial_path, progress)
+                else:
+                    self._copy_file(source, partial_path, progress)
+                os.rename(partial_path, destination)
+            except BaseException:
+                self._remove(partial_path)
+                raise
+            progress.report()
+        METRICS.count('copy')
+        METRICS.add('bytes_moved', progress.copied_bytes)
+        try:
+            if os.path.isdir(source):
+                shutil.rmtree(source)
+            else:
+                os.remove(source)
+        except OSError as e:
+            logging.warning("Copied '%s' to '%s' but could not remove the source: %s", source, destination, e)
+        logging.info("Moved '%s' to '%s'", source, destination,
+                     extra={'operation': 'copy', 'source': source, 'destination': destination,
+                            'bytes': progress.copied_bytes, 'duration': round(time.monotonic() - progress.started, 3)})
+        return destination
+
+    @staticmethod
+    def _total_size(path):
+        if not os.path.isdir(path):
+            return os.path.getsize(path)
+        total = 0
+        for directory_path, _, filenames in os.walk(path):
+            for filename in filenames:
+                try:
+                    total += os.lstat(os.path.join(directory_path, filename)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def _copy_tree(self, source, destination, progress):
+        os.makedirs(destination)
+        for entry in os.scandir(source):
+            target = os.path.join(destination, entry.name)
+            if entry.is_symlink():
+                os.symlink(os.readlink(entry.path), target)
+            elif entry.is_dir():
+                self._copy_tree(entry.path, target, progress)
+            else:
+                self._copy_file(entry.path, target, progress)
+        shutil.copystat(source, destination)
+
+    def _copy_file(self, source, destination, progress):
+        with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+            size = os.fstat(source_file.fileno()).st_size
+            copied = self._kernel_copy(source_file.fileno(), destination_file.fileno(), size, progress)
+            if copied < size:
+                source_file.seek(copied)
+                destination_file.seek(copied)
+                while True:
+                    buffer = source_file.read(self.chunk_size)
+                    if not buffer:
+                        break
+                    destination_file.write(buffer)
+                    progress.update(len(buffer))
+        shutil.copystat(source, destination)
+
+    def _kernel_copy(self, source_fd, destination_fd, size, progress):
+        """Copy with copy_file_range or sendfile, returning the number of bytes copied."""
+        copied = 0
+        if self.copy_file_range_supported:
+            try:
+                while copied < size:
+                    count = os.copy_file_range(source_fd, destination_fd, min(self.chunk_size, size - copied))
+                    if count == 0:
+                        break
+                    copied += count
+                    progress.update(count)
+                return copied
+            except OSError as e:
+                if e.errno not in KERNEL_COPY_UNSUPPORTED or copied:
+                    raise
+                if e.errno == errno.ENOSYS:
+                    self.copy_file_range_supported = False
+        if self.sendfile_supported:
+            try:
+                while copied < size:
+                    count = os.sendfile(destination_fd, source_fd, copied, min(self.chunk_size, size - copied))
+                    if count == 0:
+                        break
+                    copied += count
+                    progress.update(count)
+                return copied
+            except OSError as e:
+                if e.errno not in KERNEL_COPY_UNSUPPORTED or copied:
+                    raise
+                self.sendfile_supported = False
+        return copied
+
+    @staticmethod
+    def _remove(path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.lexists(path):
+            os.remove(path)
@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+from release_parser import RELEASE_PARSER, normalize_title
+from run_metrics import METRICS
+
+
+class MovieCatalog:
+    """Index of the movie library folders by normalized title and year.
+
+    The library is listed once per run with scandir, or not at all when its mtime still
+    matches the snapshot saved by the previous run. Folders are added as moves into the
+    library are planned, so every release of a run is checked in memory. Titles match
+    regardless of case, punctuation and where the article is ('The Matrix (1999)' and
+    'Matrix, The (1999)'), and a release also matches a folder without a year or one
+    whose year is off by one, as long as only one folder does.
+    """
+
+    CACHE_VERSION = 1
+
+    def __init__(self, library_path, cache_path=None):
+        self.library_path = library_path
+        self.cache_path = cache_path
+        self.mtime = None
+        self.folders = set()
+        # normalized title -> {year or None: folder name}
+        self.titles = {}
+        self.unconfirmed = set()
+
+    @classmethod
+    def load_or_build(cls, library_path, cache_path=None):
+        """Create a catalog from the cache if the library did not change since it was saved, or by listing it."""
+        catalog = cls(library_path, cache_path)
+        catalog.refresh()
+        return catalog
+
+    @staticmethod
+    def key(name):
+        """Return (normalized title, year) for a movie folder name, the year is None when it has none."""
+        release = RELEASE_PARSER.parse(name)
+        if release is not None and release.year is not None and release.season is None:
+            return normalize_title(release.title), release.year
+        return normalize_title(name), None
+
+    def _read_cache(self, mtime):
+        if not self.cache_path or not os.path.isfile(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except Exception as e:
+            logging.warning("Unable to read movie catalog cache '%s': %s", self.cache_path, e)
+            return None
+        if data.get('version') != self.CACHE_VERSION or data.get('library_path') != self.library_path or \
+                data.get('mtime') != mtime:
+            return None
+        return data.get('folders', [])
+
+    def refresh(self):
+        """Read the library again if its mtime changed since it was last read."""
+        METRICS.count('stat')
+        try:
+            mtime = os.stat(self.library_path).st_mtime
+        except OSError as e:
+            logging.error("Unable to read movie library '%s': %s", self.library_path, e)
+            return
+        if mtime == self.mtime:
+            return
+        folders = self._read_cache(mtime) if self.mtime is None else None
+        if folders is None:
+            logging.info("Indexing movie library '%s'", self.library_path)
+            METRICS.count('listdir')
+            try:
+                with os.scandir(self.library_path) as entries:
+                    folders = [entry.name for entry in entries if entry.is_dir()]
+            except OSError as e:
+                logging.error("Unable to list movie library '%s': %s", self.library_path, e)
+                return
+        self.folders = set()
+        self.titles = {}
+        self.unconfirmed = set()
+        # Sorted so the folder that wins between two with the same key does not depend on listing order.
+        for folder in sorted(folders):
+            self.add(folder, confirmed=True)
+        self.mtime = mtime
+
+    def add(self, folder, confirmed=False):
+        """Record a library folder, one that is only planned is confirmed by sync() once the plan ran."""
+        self.folders.add(folder)
+        title, year = self.key(folder)
+        if title:
+            self.titles.setdefault(title, {}).setdefault(year, folder)
+        if not confirmed:
+            self.unconfirmed.add(folder)
+
+    def remove(self, folder):
+        self.folders.discard(folder)
+        self.unconfirmed.discard(folder)
+        title, year = self.key(folder)
+        years = self.titles.get(title, {})
+        if years.get(year) == folder:
+            del years[year]
+            # Another folder with the same key takes its place.
+            for other in sorted(self.folders):
+                if self.key(other) == (title, year):
+                    years[year] = other
+                    break
+            if not years:
+                del self.titles[title]
+
+    def find(self, name):
+        """Return the library folder holding the movie of a cleaned 'Title (year)' name, or None."""
+        title, year = self.key(name)
+        years = self.titles.get(title)
+        if not years:
+            return None
+        if year in years:
+            return years[year]
+        if year is None:
+            return years[next(iter(years))] if len(years) == 1 else None
+        if None in years:
+            return years[None]
+        close = [years[other] for other in (year - 1, year + 1) if other in years]
+        return close[0] if len(close) == 1 else None
+
+    def sync(self, failed_paths=()):
+        """Drop the planned folders whose move failed and record the library mtime after a plan ran.
+
+        failed_paths are the paths the plan executor reports as failed. The mtime is taken to
+        include only our own moves, so the next run can reuse the catalog instead of listing
+        the library.
+        """
+        for folder in list(self.unconfirmed):
+            if os.path.join(self.library_path, folder) in failed_paths:
+                self.remove(folder)
+        self.unconfirmed = set()
+        METRICS.count('stat')
+        try:
+            self.mtime = os.stat(self.library_path).st_mtime
+        except OSError as e:
+            logging.debug("Unable to refresh mtime of '%s': %s", self.library_path, e)
+
+    def save(self):
+        """Write the library snapshot to the cache file."""
+        if not self.cache_path or self.mtime is None:
+            return
+        cache_dir = os.path.dirname(self.cache_path)
+        try:
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            temp_path = f"{self.cache_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump({'version': self.CACHE_VERSION, 'library_path': self.library_path, 'mtime': self.mtime,
+                           'folders': sorted(self.folders)}, file)
+            os.replace(temp_path, self.cache_path)
+            logging.debug("Saved movie catalog cache to '%s'", self.cache_path)
+        except Exception as e:
+            logging.warning("Unable to save movie catalog cache '%s': %s", self.cache_path, e)
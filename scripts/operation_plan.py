@@ -0,0 +1,293 @@
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import Future, wait
+from directory_operations import DirectoryOperations
+from run_metrics import METRICS
+
+
+class Operation:
+    """A single planned filesystem change.
+
+    Actions:
+        rename        rename or move a download folder
+        move          move a folder into the library
+        rename_files  rename the files inside a folder to the given base name
+        hardlink      rebuild a folder at the destination, hard-linking the files whose size is listed
+                      in details['links'] to their identical library copies, then remove the source
+        mkdir         create a directory
+        delete        remove a folder tree
+
+    A rename or move with details['after'] waits for the moves to those paths first and is
+    skipped when one of them failed. It never replaces an existing destination, it is used
+    to move a better release into the place of a library copy that is moved out first.
+    """
+
+    __slots__ = ('action', 'source', 'destination', 'reason', 'details')
+
+    def __init__(self, action, source, destination=None, reason='', details=None):
+        self.action = action
+        self.source = source
+        self.destination = destination
+        self.reason = reason
+        self.details = details
+
+    def to_dict(self):
+        operation = {'action': self.action, 'source': self.source, 'destination': self.destination,
+                     'reason': self.reason}
+        if self.details:
+            operation['details'] = self.details
+        return operation
+
+    def __str__(self):
+        target = f" -> {self.destination}" if self.destination else ''
+        reason = f" ({self.reason})" if self.reason else ''
+        return f"{self.action.upper():<12} {self.source}{target}{reason}"
+
+
+class DirectorySnapshot:
+    """The entry names of one directory, read once and updated as operations are planned.
+
+    Names are compared case-insensitively so collisions are also avoided on SMB shares.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        METRICS.count('listdir')
+        try:
+            with os.scandir(path) as entries:
+                self.names = {entry.name.casefold() for entry in entries}
+        except OSError as e:
+            logging.warning("Unable to list '%s': %s", path, e)
+            self.names = set()
+
+    def __contains__(self, name):
+        return name.casefold() in self.names
+
+    def add(self, name):
+        self.names.add(name.casefold())
+
+    def discard(self, name):
+        self.names.discard(name.casefold())
+
+    def unique_name(self, name):
+        """Return name, or 'name (n)' with the lowest free n, without touching the disk."""
+        candidate = name
+        count = 1
+        while candidate.casefold() in self.names:
+            candidate = f"{name} ({count})"
+            count += 1
+        return candidate
+
+
+class Plan:
+    """An ordered list of operations plus the directory snapshots they were planned against."""
+
+    def __init__(self):
+        self.operations = []
+        self.snapshots = {}
+
+    def snapshot(self, path):
+        """Return the snapshot of a directory, reading it on first use."""
+        path = os.path.normpath(path)
+        if path not in self.snapshots:
+            self.snapshots[path] = DirectorySnapshot(path)
+        return self.snapshots[path]
+
+    def add(self, action, source, destination=None, reason='', details=None):
+        """Append an operation and apply its effect to the loaded snapshots."""
+        operation = Operation(action, source, destination, reason, details)
+        self.operations.append(operation)
+        if action in ('rename', 'move', 'hardlink', 'delete'):
+            self._update_snapshot(source, removed=True)
+        if action in ('rename', 'move', 'hardlink', 'mkdir'):
+            self._update_snapshot(destination if action != 'mkdir' else source, removed=False)
+        return operation
+
+    def _update_snapshot(self, path, removed):
+        snapshot = self.snapshots.get(os.path.normpath(os.path.dirname(path)))
+        if snapshot is not None:
+            if removed:
+                snapshot.discard(os.path.basename(path))
+            else:
+                snapshot.add(os.path.basename(path))
+
+    def extend(self, other):
+        self.operations.extend(other.operations)
+
+    def __len__(self):
+        return len(self.operations)
+
+    def to_json(self):
+        return json.dumps([operation.to_dict() for operation in self.operations], indent=2)
+
+    def format_text(self):
+        if not self.operations:
+            return 'Nothing to do.'
+        return '\n'.join(str(operation) for operation in self.operations)
+
+
+class PlanExecutor:
+    """Apply the operations of a plan in order.
+
+    An operation whose source is the destination of a failed operation is skipped. When a
+    journal is given every operation is recorded in it, with the intents of the whole plan
+    made durable before the first one is applied. When a purge engine is given deletes only
+    stage the folder for removal in the background.
+    """
+
+    def __init__(self, move_engine=None, journal=None, purge_engine=None):
+        self.move_engine = move_engine
+        self.journal = journal
+        self.purge_engine = purge_engine
+
+    def execute(self, plan):
+        if self.journal:
+            keys = [self.journal.record_intent(operation) for operation in plan.operations]
+            self.journal.flush()
+        failed_paths = set()
+        futures = []
+        moves = {}
+        for index, operation in enumerate(plan.operations):
+            key = keys[index] if self.journal else None
+            after = (operation.details or {}).get('after', []) if operation.action in ('rename', 'move') else []
+            if after:
+                wait([moves[path] for path in after if path in moves])
+            if operation.source in failed_paths or \
+                    any(path in failed_paths or path in moves and moves[path].exception() for path in after):
+                logging.warning("Skipping '%s' because an earlier operation on it failed", operation)
+                failed_paths.add(self.result_path(operation))
+                self._record(key, operation, error='skipped after an earlier failure')
+                continue
+            started = time.monotonic()
+            try:
+                result = self.apply(operation)
+            except Exception as e:
+                logging.error("Failed to %s '%s': %s", operation.action, operation.source, e, exc_info=True)
+                failed_paths.add(self.result_path(operation))
+                self._record(key, operation, error=e)
+                continue
+            if isinstance(result, Future):
+                futures.append(result)
+                moves[operation.destination] = result
+                result.add_done_callback(lambda future, key=key, operation=operation:
+                                         self._record(key, operation, error=future.exception()))
+            else:
+                self._record(key, operation, details=result)
+            logging.debug("Applied %s", operation,
+                          extra={'operation': operation.action, 'source': operation.source,
+                                 'destination': operation.destination,
+                                 'duration': round(time.monotonic() - started, 3)})
+        if self.move_engine:
+            with METRICS.phase('move_engine.wait'):
+                failed_paths.update(destination for _, destination, _ in self.move_engine.wait(futures))
+        if self.journal:
+            self.journal.flush()
+        return failed_paths
+
+    @staticmethod
+    def result_path(operation):
+        """Return the path an operation leaves its result at, rename_files keeps its folder in place."""
+        if operation.action == 'rename_files':
+            return operation.source
+        return operation.destination or operation.source
+
+    def _record(self, key, operation, error=None, details=None):
+        if self.journal:
+            self.journal.record_result(key, operation, error, details)
+
+    def resume(self):
+        """Finish the operations a previous run recorded as started but never completed.
+
+        Operations whose effect is already on disk are marked done, operations whose source is
+        still in place are applied again and anything else is left for a manual look.
+        """
+        unfinished = self.journal.unfinished_operations() if self.journal else []
+        if not unfinished:
+            return set()
+        logging.warning("Resuming %s operations left unfinished by an earlier run", len(unfinished))
+        plan = Plan()
+        for record in unfinished:
+            operation = Operation(record['action'], record['source'], record.get('destination'),
+                                  record.get('reason', ''), record.get('details'))
+            source_exists = os.path.exists(operation.source)
+            destination_exists = operation.destination is not None and os.path.exists(operation.destination)
+            if operation.action in ('rename', 'move', 'hardlink'):
+                if source_exists and not destination_exists:
+                    plan.operations.append(operation)
+                elif not source_exists and destination_exists:
+                    self.journal.mark_resumed(record, completed=True)
+                    continue
+                else:
+                    logging.error("Unable to resume '%s', both or neither of its paths exist", operation)
+            elif operation.action == 'delete' and not source_exists:
+                self.journal.mark_resumed(record, completed=True)
+                continue
+            elif source_exists or operation.action == 'mkdir':
+                plan.operations.append(operation)
+            self.journal.mark_resumed(record)
+        return self.execute(plan)
+
+    def apply(self, operation):
+        """Apply one operation, returning the future of a background move or the details to journal."""
+        if operation.action in ('rename', 'move') and (operation.details or {}).get('after') and \
+                os.path.exists(operation.destination):
+            raise FileExistsError(f"'{operation.destination}' still exists")
+        if operation.action == 'rename':
+            logging.info("Moving '%s' to '%s'", operation.source, operation.destination)
+            future = DirectoryOperations.rename_directory(operation.source, operation.destination, self.move_engine)
+            if future is not None and future.done() and future.exception():
+                raise future.exception()
+            return future
+        elif operation.action == 'move':
+            logging.info("Moving '%s' to '%s'", operation.source, operation.destination)
+            if self.move_engine:
+                future = self.move_engine.move(operation.source, operation.destination)
+                if future.done() and future.exception():
+                    raise future.exception()
+                return future
+            METRICS.count('rename')
+            shutil.move(operation.source, operation.destination)
+        elif operation.action == 'rename_files':
+            logging.info("Renaming files in %s", operation.source)
+            return {'files': DirectoryOperations.rename_files(operation.source, operation.destination)}
+        elif operation.action == 'hardlink':
+            self.link_directory(operation.source, operation.destination, operation.details['links'])
+        elif operation.action == 'mkdir':
+            METRICS.count('mkdir')
+            os.makedirs(operation.source, exist_ok=True)
+        elif operation.action == 'delete':
+            if self.purge_engine:
+                self.purge_engine.stage(operation.source)
+            else:
+                METRICS.count('rmtree')
+                shutil.rmtree(operation.source)
+                logging.info("Deleted: %s", operation.source)
+        else:
+            raise ValueError(f"Unknown operation '{operation.action}'")
+        return None
+
+    @staticmethod
+    def link_directory(source, destination, links):
+        """Recreate source at destination with the files matching links by size pointing at their library copies."""
+        logging.info("Replacing identical files of '%s' with hard links in '%s'", source, destination)
+        for directory_path, _, filenames in os.walk(source):
+            target_directory = os.path.join(destination, os.path.relpath(directory_path, source))
+            os.makedirs(target_directory, exist_ok=True)
+            for filename in filenames:
+                source_file = os.path.join(directory_path, filename)
+                target_file = os.path.join(target_directory, filename)
+                library_file = links.get(str(os.path.getsize(source_file)))
+                if library_file:
+                    try:
+                        METRICS.count('link')
+                        os.link(library_file, target_file)
+                        continue
+                    except OSError as e:
+                        logging.warning("Unable to hard link '%s', moving the file instead: %s", library_file, e)
+                METRICS.count('rename')
+                shutil.move(source_file, target_file)
+        METRICS.count('rmtree')
+        shutil.rmtree(source)
@@ -0,0 +1,297 @@
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime
+
+# Written into each renamed episode folder before the journal existed.
+RENAMED_MARKER = '.renamed'
+
+
+class OperationsJournal:
+    """Append-only JSON lines journal of every rename, move and delete.
+
+    Each applied operation is written as an 'intent' record before it runs and a
+    'done' or 'failed' record after it. Records are buffered and written with one
+    fsync per batch, and the intents of a plan are flushed before any of it is
+    applied, so after a crash the unfinished operations can be resumed.
+
+    An in-memory index of the folders we produced answers "already processed?"
+    without touching the folders themselves. Once the journal holds more than twice
+    keep_runs runs, every run but the last keep_runs is folded into a single 'snapshot'
+    record of that index, so the file and the startup replay stay small. Only the kept
+    runs can be undone.
+    """
+
+    def __init__(self, journal_path=None, batch_size=100, keep_runs=20):
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.keep_runs = keep_runs
+        self.buffer = []
+        self.lock = threading.RLock()
+        self.processed = set()
+        self.pending = {}
+        # run id -> True once the run completed an operation, in journal order.
+        self.run_ids = {}
+        self.migrated = set()
+        self.run_id = None
+        self.sequence = 0
+        if journal_path and os.path.isfile(journal_path):
+            self._load()
+
+    @classmethod
+    def from_config(cls, config):
+        settings = config.settings.journal
+        return cls(settings.path, settings.batch_size, settings.keep_runs)
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.normpath(path))
+
+    def _load(self):
+        """Rebuild the processed index and the unfinished operations from the journal file."""
+        for record in self.read_records():
+            self._index(record)
+        if self.pending:
+            logging.warning("Journal '%s' has %s unfinished operations", self.journal_path, len(self.pending))
+
+    def read_records(self, run_id=None):
+        if not self.journal_path or not os.path.isfile(self.journal_path):
+            return
+        with open(self.journal_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write.
+                    continue
+                if run_id is None or record.get('run') == run_id:
+                    yield record
+
+    def _index(self, record):
+        event = record.get('event')
+        key = (record.get('run'), record.get('seq'))
+        if record.get('run') is not None:
+            self.run_ids[record['run']] = self.run_ids.get(record['run'], False) or event == 'done'
+        if event == 'snapshot':
+            self.processed.update(record.get('processed', []))
+            self.migrated.update(record.get('migrated', []))
+        elif event == 'migrated':
+            self.processed.update(self._key(path) for path in record.get('paths', []))
+            self.migrated.add(self._key(record['directory']))
+        if event == 'intent':
+            self.pending[key] = record
+        elif event in ('done', 'failed', 'resumed'):
+            self.pending.pop(key, None)
+        if event == 'done':
+            self._apply_to_index(record['action'], record['source'], record.get('destination'))
+        elif event == 'undone':
+            self._undo_in_index(record['action'], record['source'], record.get('destination'))
+
+    def _apply_to_index(self, action, source, destination):
+        if action in ('rename', 'move', 'hardlink'):
+            self.processed.discard(self._key(source))
+            self.processed.add(self._key(destination))
+        elif action == 'rename_files':
+            self.processed.add(self._key(source))
+        elif action == 'delete':
+            self.processed.discard(self._key(source))
+
+    def _undo_in_index(self, action, source, destination):
+        if action in ('rename', 'move', 'hardlink'):
+            self.processed.discard(self._key(destination))
+
+    def is_processed(self, path):
+        """Return True if the folder at path was produced by an earlier rename."""
+        return self._key(path) in self.processed
+
+    def begin_run(self):
+        """Start a new run. Every operation recorded until end_run belongs to it and is undone together."""
+        with self.lock:
+            self.run_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}"
+            self.sequence = 0
+            self._write({'event': 'begin'})
+            return self.run_id
+
+    def end_run(self):
+        with self.lock:
+            if self.run_id is None:
+                return
+            self._write({'event': 'end'})
+            self.flush()
+            self.run_id = None
+            if self.keep_runs and len(self.run_ids) > 2 * self.keep_runs:
+                self.compact()
+
+    def compact(self):
+        """Fold every run but the last keep_runs into one snapshot of the processed index.
+
+        Unfinished operations of the folded runs are kept so they can still be resumed, and
+        folders that no longer exist are dropped from the index. The file is replaced atomically.
+        """
+        with self.lock:
+            self.flush()
+            if not self.journal_path or not os.path.isfile(self.journal_path):
+                return
+            kept_runs = set(list(self.run_ids)[-self.keep_runs:]) if self.keep_runs else set()
+            if self.run_id is not None:
+                kept_runs.add(self.run_id)
+            folded = OperationsJournal()
+            kept = []
+            for record in self.read_records():
+                if record.get('run') in kept_runs and record.get('event') != 'snapshot':
+                    kept.append(record)
+                else:
+                    folded._index(record)
+            snapshot = {'run': None, 'event': 'snapshot',
+                        'processed': sorted(key for key in folded.processed if os.path.exists(key)),
+                        'migrated': sorted(folded.migrated), 'time': datetime.now().isoformat(timespec='seconds')}
+            records = [snapshot, *folded.unfinished_operations(), *kept]
+            temp_path = f"{self.journal_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                file.write(''.join(json.dumps(record) + '\n' for record in records))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self.journal_path)
+            logging.info("Compacted journal '%s', %s runs folded into a snapshot", self.journal_path,
+                         len(folded.run_ids))
+            self.processed, self.pending, self.run_ids, self.migrated = set(), {}, {}, set()
+            self._load()
+
+    def migrate_markers(self, directory, record=True):
+        """Add the folders of a directory holding a '.renamed' marker to the processed index.
+
+        The markers were written before the journal existed. A directory is only listed for
+        them once, a 'migrated' record keeps later runs from listing it again. Without record
+        the folders are only added in memory, for dry runs.
+        """
+        if not directory or self._key(directory) in self.migrated:
+            return 0
+        paths = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir() and os.path.isfile(os.path.join(entry.path, RENAMED_MARKER)):
+                        paths.append(entry.path)
+        except OSError as e:
+            logging.warning("Unable to look for '%s' markers in '%s': %s", RENAMED_MARKER, directory, e)
+            return 0
+        migrated = {'run': None, 'event': 'migrated', 'directory': directory, 'paths': paths}
+        with self.lock:
+            if record and self.journal_path:
+                self.buffer.append(json.dumps({**migrated, 'time': datetime.now().isoformat(timespec='seconds')}))
+                self.flush()
+            self._index(migrated)
+        if paths:
+            logging.info("Marked %s folders renamed before the journal existed in '%s' as processed", len(paths),
+                         directory)
+        return len(paths)
+
+    def record_intent(self, operation):
+        """Record that an operation is about to be applied, returning the (run, sequence) key of the record."""
+        with self.lock:
+            if self.run_id is None:
+                self.begin_run()
+            self.sequence += 1
+            record = self._write({'event': 'intent', 'seq': self.sequence, **operation.to_dict()})
+            self.pending[(self.run_id, self.sequence)] = record
+            return self.run_id, self.sequence
+
+    def record_result(self, key, operation, error=None, details=None):
+        """Record the outcome of an operation, which may arrive from a move engine worker thread."""
+        with self.lock:
+            run_id, sequence = key
+            record = {'run': run_id, 'event': 'failed' if error else 'done', 'seq': sequence, **operation.to_dict()}
+            if error:
+                record['error'] = str(error)
+            if details:
+                record['details'] = {**(record.get('details') or {}), **details}
+            self._write(record)
+            self._index(record)
+
+    def _write(self, record):
+        record = {'run': self.run_id, **record, 'time': datetime.now().isoformat(timespec='seconds')}
+        if self.journal_path:
+            self.buffer.append(json.dumps(record))
+            if len(self.buffer) >= self.batch_size:
+                self.flush()
+        return record
+
+    def flush(self):
+        """Write the buffered records and fsync the journal."""
+        with self.lock:
+            if not self.buffer or not self.journal_path:
+                return
+            journal_dir = os.path.dirname(self.journal_path)
+            if journal_dir and not os.path.exists(journal_dir):
+                os.makedirs(journal_dir)
+            with open(self.journal_path, 'a', encoding='utf-8') as file:
+                file.write('\n'.join(self.buffer) + '\n')
+                file.flush()
+                os.fsync(file.fileno())
+            self.buffer = []
+
+    def unfinished_operations(self):
+        """Return the intent records of operations that never completed, oldest first."""
+        return sorted(self.pending.values(), key=lambda record: (record['run'], record['seq']))
+
+    def mark_resumed(self, record, completed=False):
+        """Close an unfinished operation, as done when it turned out to have completed before the crash."""
+        with self.lock:
+            closing = {**record, 'event': 'done' if completed else 'resumed'}
+            self._write(closing)
+            self._index(closing)
+
+    def runs(self):
+        """Return the ids of the runs that completed at least one operation, oldest first."""
+        with self.lock:
+            return [run_id for run_id, completed in self.run_ids.items() if completed]
+
+    def undo_run(self, run_id):
+        """Reverse the completed operations of a run, newest first. Deletes cannot be undone."""
+        self.flush()
+        done = [record for record in self.read_records(run_id) if record.get('event') == 'done']
+        undone = {record['seq'] for record in self.read_records(run_id) if record.get('event') == 'undone'}
+        if not done:
+            logging.warning("No completed operations found for run %s", run_id)
+            return 0
+        count = 0
+        for record in reversed(done):
+            if record['seq'] in undone:
+                continue
+            try:
+                if not self._undo(record):
+                    continue
+            except Exception as e:
+                logging.error("Unable to undo %s of '%s': %s", record['action'], record['source'], e)
+                continue
+            with self.lock:
+                self._write({**record, 'event': 'undone', 'run': run_id})
+                self._undo_in_index(record['action'], record['source'], record.get('destination'))
+            count += 1
+        self.flush()
+        logging.info("Undid %s operations of run %s", count, run_id)
+        return count
+
+    @staticmethod
+    def _undo(record):
+        action, source, destination = record['action'], record['source'], record.get('destination')
+        if action in ('rename', 'move', 'hardlink'):
+            if os.path.exists(source):
+                raise FileExistsError(f"'{source}' already exists")
+            logging.info("Moving '%s' back to '%s'", destination, source)
+            shutil.move(destination, source)
+        elif action == 'rename_files':
+            for old_name, new_name in reversed((record.get('details') or {}).get('files', [])):
+                os.rename(os.path.join(source, new_name), os.path.join(source, old_name))
+        elif action == 'mkdir':
+            try:
+                os.rmdir(source)
+            except OSError:
+                logging.info("Leaving '%s' in place, it is not empty", source)
+                return False
+        else:
+            logging.warning("Cannot undo %s of '%s'", action, source)
+            return False
+        return True
@@ -0,0 +1,98 @@
+import logging
+import os
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from run_metrics import METRICS
+
+
+class Pipeline:
+    """A named piece of work, the paths it reads and writes, and the pipelines it has to run after."""
+
+    __slots__ = ('name', 'function', 'paths', 'after', 'devices')
+
+    def __init__(self, name, function, paths, after=()):
+        self.name = name
+        self.function = function
+        self.paths = list(paths)
+        self.after = set(after)
+        self.devices = set()
+
+    def __repr__(self):
+        return f"Pipeline({self.name!r}, devices={sorted(self.devices)}, after={sorted(self.after)})"
+
+
+class PipelineScheduler:
+    """Run independent pipelines in parallel, grouped by the devices their paths live on.
+
+    A pipeline starts once every pipeline it runs after has finished and each device under its
+    paths has fewer than max_per_device pipelines running, so work on one slow volume does not
+    hold up work on another. A pipeline that raises is logged and counted as failed without
+    stopping the others, and the pipelines after it still run.
+    """
+
+    def __init__(self, max_workers=4, max_per_device=2):
+        self.max_workers = max_workers
+        self.max_per_device = max_per_device
+        self.pipelines = {}
+        self.results = {}
+        self.failures = {}
+
+    @classmethod
+    def from_config(cls, config):
+        settings = config.settings.scheduler
+        return cls(max_workers=settings.max_workers, max_per_device=settings.max_per_device)
+
+    def add(self, name, function, paths, after=()):
+        """Add a pipeline calling function() that works on paths, to start once the pipelines in after finished."""
+        self.pipelines[name] = Pipeline(name, function, paths, after)
+
+    @staticmethod
+    def device(path):
+        """Return the device of path, or of its closest existing parent when it does not exist yet."""
+        while True:
+            METRICS.count('stat')
+            try:
+                return os.stat(path).st_dev
+            except OSError:
+                parent = os.path.dirname(path)
+                if not parent or parent == path:
+                    return None
+                path = parent
+
+    def run(self):
+        """Run every pipeline, returning {name: result} for those that succeeded."""
+        for pipeline in self.pipelines.values():
+            pipeline.devices = {device for device in map(self.device, pipeline.paths) if device is not None}
+            pipeline.after &= set(self.pipelines)
+            logging.debug("Scheduling %r", pipeline)
+        waiting = dict(self.pipelines)
+        running = {}
+        finished = set()
+        busy_devices = Counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pipeline') as executor:
+            while waiting or running:
+                for name, pipeline in list(waiting.items()):
+                    if len(running) >= self.max_workers:
+                        break
+                    if not pipeline.after <= finished or \
+                            any(busy_devices[device] >= self.max_per_device for device in pipeline.devices):
+                        continue
+                    busy_devices.update(pipeline.devices)
+                    running[executor.submit(self._run, pipeline)] = pipeline
+                    del waiting[name]
+                if not running:
+                    raise ValueError(f"Pipelines {', '.join(waiting)} wait for each other")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pipeline = running.pop(future)
+                    busy_devices.subtract(pipeline.devices)
+                    finished.add(pipeline.name)
+        return {name: self.results[name] for name in self.pipelines if name in self.results}
+
+    def _run(self, pipeline):
+        try:
+            with METRICS.phase(f'pipeline.{pipeline.name}'):
+                self.results[pipeline.name] = pipeline.function()
+        except Exception as e:
+            logging.error("Pipeline '%s' failed: %s", pipeline.name, e, exc_info=True)
+            self.failures[pipeline.name] = e
@@ -0,0 +1,173 @@
+import configparser
+import logging
+import os
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from http_pool import ConnectionPool
+
+
+class PlexNotifier:
+    """Ask Plex to rescan only the folders a run changed.
+
+    Touched folders are collected until no new folder has arrived for debounce_seconds,
+    then folders inside another touched folder are dropped and each remaining folder is
+    sent to its library section as a partial refresh (?path=...). At most max_concurrent
+    refresh requests are in flight at once.
+    """
+
+    def __init__(self, base_url, token, debounce_seconds=30, max_concurrent=2, path_mappings=None, timeout=10):
+        self.token = token
+        self.debounce_seconds = debounce_seconds
+        self.pool = ConnectionPool(base_url, max_concurrent, timeout)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='plex')
+        # Local path prefix -> the same folder as Plex sees it, when Plex runs on another machine.
+        self.path_mappings = sorted((path_mappings or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.sections = None
+        self.pending = set()
+        self.last_touch = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a notifier from the plex section of the config and the server details in config.ini.
+
+        Returns None when Plex notifications are disabled or config.ini has no server details.
+        """
+        settings = config.plex
+        if not settings.enabled:
+            return None
+        parser = configparser.ConfigParser(interpolation=None)
+        if not parser.read(settings.config_ini):
+            logging.warning("Plex notifications are enabled but '%s' was not found", settings.config_ini)
+            return None
+        try:
+            base_url = f"http://{parser['Network']['ip']}:{parser['Network'].get('port', '32400')}"
+            token = parser['Credentials']['token']
+        except KeyError as e:
+            logging.warning("Missing %s in the Plex config.ini, Plex notifications are disabled", e)
+            return None
+        return cls(base_url, token, settings.debounce_seconds, settings.max_concurrent, settings.path_mappings)
+
+    def _get(self, path):
+        separator = '&' if '?' in path else '?'
+        status, body = self.pool.request('GET', f"{path}{separator}X-Plex-Token={quote(self.token)}",
+                                         {'Accept': 'application/xml'})
+        if status != 200:
+            raise ConnectionError(f"Plex returned HTTP {status} for {path.split('?')[0]}")
+        return body
+
+    def load_sections(self):
+        """Fetch the library sections and their folders, returning [(folder, section key)], longest folder first."""
+        container = ElementTree.fromstring(self._get('/library/sections'))
+        sections = []
+        for directory in container.iter('Directory'):
+            for location in directory.iter('Location'):
+                sections.append((location.get('path').rstrip('/\\'), directory.get('key')))
+        self.sections = sorted(sections, key=lambda section: len(section[0]), reverse=True)
+        return self.sections
+
+    def plex_path(self, path):
+        """Translate a local path to the path Plex sees."""
+        for local_prefix, plex_prefix in self.path_mappings:
+            if path.startswith(local_prefix):
+                path = plex_prefix + path[len(local_prefix):]
+                if plex_prefix.startswith('/'):
+                    path = path.replace('\\', '/')
+                break
+        return path
+
+    def section_for(self, plex_path):
+        for folder, key in self.sections:
+            if plex_path == folder or plex_path.startswith(folder + '/') or plex_path.startswith(folder + '\\'):
+                return key
+        return None
+
+    def touch(self, path):
+        with self.lock:
+            self.pending.add(path)
+            self.last_touch = time.monotonic()
+
+    def collect(self, plan, library_paths, failed_paths=()):
+        """Touch the season or movie folders that the moves of a plan put into a library.
+
+        failed_paths are the paths the plan executor reports as failed; their folders did not change.
+        """
+        library_paths = [os.path.normpath(path) for path in library_paths]
+        for operation in plan.operations:
+            if operation.action not in ('rename', 'move', 'hardlink') or not operation.destination:
+                continue
+            if operation.destination in failed_paths:
+                continue
+            destination = os.path.normpath(operation.destination)
+            parent = os.path.dirname(destination)
+            for library_path in library_paths:
+                if destination.startswith(library_path + os.sep):
+                    # A movie folder sits directly in its library, an episode folder in a season folder.
+                    self.touch(destination if parent == library_path else parent)
+                    break
+
+    @staticmethod
+    def coalesce(paths):
+        """Drop every path that lies inside another path of the set."""
+        kept = []
+        for path in sorted(paths):
+            if kept and (path == kept[-1] or path.startswith(kept[-1].rstrip('/\\') + os.sep)):
+                continue
+            kept.append(path)
+        return kept
+
+    def flush(self, force=False):
+        """Send the refreshes for the collected folders once they have been quiet for the debounce period."""
+        with self.lock:
+            if not self.pending or (not force and time.monotonic() - self.last_touch < self.debounce_seconds):
+                return 0
+            paths, self.pending = self.pending, set()
+        try:
+            if self.sections is None:
+                self.load_sections()
+        except (ConnectionError, ElementTree.ParseError) as e:
+            logging.warning("Unable to list Plex library sections: %s", e)
+            return 0
+        by_section = {}
+        for path in self.coalesce(paths):
+            plex_path = self.plex_path(path)
+            key = self.section_for(plex_path)
+            if key is None:
+                logging.debug("No Plex library section holds '%s'", plex_path)
+                continue
+            by_section.setdefault(key, []).append(plex_path)
+        futures = [self.executor.submit(self._refresh, key, plex_path)
+                   for key, plex_paths in by_section.items() for plex_path in plex_paths]
+        return sum(1 for future in futures if future.result())
+
+    def _refresh(self, key, plex_path):
+        try:
+            self._get(f"/library/sections/{key}/refresh?path={quote(plex_path)}")
+            logging.info("Asked Plex to refresh '%s' in section %s", plex_path, key)
+            return True
+        except ConnectionError as e:
+            logging.warning("Unable to refresh '%s' in Plex: %s", plex_path, e)
+            return False
+
+    def start(self):
+        """Flush in the background whenever the debounce period has passed, for watch mode."""
+        def run():
+            while not self.stopped.wait(1):
+                self.flush()
+
+        self.thread = threading.Thread(target=run, name='plex-notifier', daemon=True)
+        self.thread.start()
+
+    def shutdown(self):
+        """Send whatever is still pending and stop."""
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        self.flush(force=True)
+        self.executor.shutdown(wait=True)
+        self.pool.close()
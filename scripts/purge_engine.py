@@ -0,0 +1,174 @@
+import errno
+import logging
+import os
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from run_metrics import METRICS
+
+TRASH_DIR_NAME = '.media_management_trash'
+
+
+class RateLimiter:
+    """Token bucket shared by the purge workers, allowing rate units per second with one second of burst."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.allowance = rate or 0
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            self.allowance -= amount
+            delay = -self.allowance / self.rate if self.allowance < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+class PurgeEngine:
+    """Delete folder trees without blocking the run that expired them.
+
+    An item is first renamed into a trash directory on the same volume, which is
+    instant and takes it out of the download folders. A small worker pool then
+    removes the staged trees with fd-relative os.fwalk traversal. Removing a file only
+    changes metadata, so the workers are throttled by the rate of unlink and rmdir calls.
+    Trees that are not removed when the engine shuts down stay in the trash until recover.
+    """
+
+    def __init__(self, max_workers=2, unlinks_per_second=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='purge')
+        self.unlink_limiter = RateLimiter(unlinks_per_second)
+        self.trash_dirs = {}
+        self.lock = threading.Lock()
+        self.pending = []
+        self.stopping = threading.Event()
+
+    @classmethod
+    def from_config(cls, config):
+        settings = config.settings.purge
+        return cls(max_workers=settings.max_workers, unlinks_per_second=settings.unlinks_per_second)
+
+    def _trash_dir(self, path, device):
+        """Return the trash directory for the volume of path, creating it next to path on first use."""
+        with self.lock:
+            trash_dir = self.trash_dirs.get(device)
+            if trash_dir is None:
+                trash_dir = os.path.join(os.path.dirname(path), TRASH_DIR_NAME)
+                os.makedirs(trash_dir, exist_ok=True)
+                self.trash_dirs[device] = trash_dir
+            return trash_dir
+
+    def stage(self, path):
+        """Rename path into the trash of its volume and queue it for removal, returning the staged path."""
+        device = os.lstat(path).st_dev
+        trash_dir = self._trash_dir(path, device)
+        staged_path = os.path.join(trash_dir, f"{os.path.basename(path)}.{time.time_ns()}")
+        METRICS.count('rename')
+        try:
+            os.rename(path, staged_path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # A bind mount can share the device number but not allow renames across it.
+            trash_dir = os.path.join(os.path.dirname(path), TRASH_DIR_NAME)
+            os.makedirs(trash_dir, exist_ok=True)
+            staged_path = os.path.join(trash_dir, os.path.basename(staged_path))
+            os.rename(path, staged_path)
+        logging.info("Staged '%s' for deletion", path)
+        self.submit(staged_path)
+        return staged_path
+
+    def submit(self, staged_path):
+        future = self.executor.submit(self._remove_tree, staged_path)
+        with self.lock:
+            self.pending.append(future)
+        return future
+
+    def recover(self, directories):
+        """Queue the trees left in the trash directories of the given folders by an earlier run."""
+        for directory in directories:
+            trash_dir = os.path.join(directory, TRASH_DIR_NAME)
+            METRICS.count('listdir')
+            try:
+                names = os.listdir(trash_dir)
+            except OSError:
+                continue
+            try:
+                self.trash_dirs.setdefault(os.stat(trash_dir).st_dev, trash_dir)
+            except OSError:
+                pass
+            for name in names:
+                logging.info("Resuming removal of '%s'", os.path.join(trash_dir, name))
+                self.submit(os.path.join(trash_dir, name))
+
+    def _remove_tree(self, path):
+        """Remove a staged tree bottom up through directory file descriptors, returning the bytes freed."""
+        freed = 0
+        try:
+            if not stat.S_ISDIR(os.lstat(path).st_mode):
+                freed = os.lstat(path).st_size
+                self.unlink_limiter.consume(1)
+                os.unlink(path)
+                METRICS.count('unlink')
+            else:
+                for _, dirs, files, root_fd in os.fwalk(path, topdown=False):
+                    for name in files:
+                        if self.stopping.is_set():
+                            return self._stopped(path, freed)
+                        try:
+                            size = os.stat(name, dir_fd=root_fd, follow_symlinks=False).st_size
+                        except FileNotFoundError:
+                            continue
+                        self.unlink_limiter.consume(1)
+                        os.unlink(name, dir_fd=root_fd)
+                        METRICS.count('unlink')
+                        freed += size
+                    for name in dirs:
+                        self.unlink_limiter.consume(1)
+                        try:
+                            os.rmdir(name, dir_fd=root_fd)
+                        except NotADirectoryError:
+                            # fwalk lists symlinks to directories as directories.
+                            os.unlink(name, dir_fd=root_fd)
+                        METRICS.count('rmdir')
+                self.unlink_limiter.consume(1)
+                os.rmdir(path)
+                METRICS.count('rmdir')
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.error("Failed to remove staged '%s': %s", path, e)
+            raise
+        METRICS.add('bytes_purged', freed)
+        logging.debug("Removed staged '%s' (%s bytes)", path, freed)
+        return freed
+
+    def _stopped(self, path, freed):
+        METRICS.add('bytes_purged', freed)
+        logging.info("Left the rest of staged '%s' for the next start", path)
+        return freed
+
+    def wait(self):
+        """Wait for every queued removal, returning the number that failed."""
+        with self.lock:
+            pending, self.pending = self.pending, []
+        return sum(1 for future in pending if future.exception() is not None)
+
+    def shutdown(self):
+        """Stop purging without waiting for the queued trees, recover removes them on the next start."""
+        self.stopping.set()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        with self.lock:
+            pending, self.pending = self.pending, []
+        failed = sum(1 for future in pending if not future.cancelled() and future.exception() is not None)
+        left = sum(1 for future in pending if future.cancelled())
+        if left:
+            logging.info("Left %s staged trees in the trash for the next start", left)
+        return failed
@@ -0,0 +1,112 @@
+import functools
+import re
+from collections import namedtuple
+
+# title is the text before the episode, date or year marker exactly as it appears in the
+# name, so callers can clean it their own way. episodes is a tuple, empty for movies and
+# date-based episodes, and air_date is 'YYYY-MM-DD' for date-based episodes.
+ParsedRelease = namedtuple('ParsedRelease', 'title year season episodes air_date quality group')
+
+EPISODE_REGEX = re.compile(
+    r'^(?P<title>.*?)(?:'
+    r'S(?P<season>\d{1,2})(?P<episodes>(?:[ ._-]?E\d{2,3})+)'  # S01E01, S01E01E02, S01E01-E02
+    r'|(?<![\dx])(?P<x_season>\d{1,2})x(?P<x_episodes>\d{2}(?:-?x\d{2})*)(?![\dp])'  # 1x02, 1x02x03
+    r')', re.IGNORECASE)
+DATE_REGEX = re.compile(
+    r'^(?P<title>.*?)(?<!\d)(?P<year>(?:19|20)\d{2})[ ._-](?P<month>0[1-9]|1[0-2])[ ._-](?P<day>0[1-9]|[12]\d|3[01])'
+    r'(?!\d)')
+YEAR_REGEX = re.compile(r'^(?P<title>.*?)(?:\s|\.|\()?(?P<year>[12][0-9]{3})(?:\D.*)?$')
+QUALITY_REGEX = re.compile(r'(?<![a-z0-9])(2160p|1080[pi]|720p|576p|480p|4k|uhd)(?![a-z0-9])', re.IGNORECASE)
+GROUP_REGEX = re.compile(r'(?<!WEB)(?<!DTS)-(?P<group>[a-z0-9]+)(?:\.[a-z0-9]{2,4})?$', re.IGNORECASE)
+EPISODE_NUMBER_REGEX = re.compile(r'\d+')
+YEAR_SUFFIX_REGEX = re.compile(r'\s*\(?(19|20)\d{2}\)?$')
+# A trailing year or country that tells apart shows of the same name, like 'Doctor Who (2005)' or 'Shameless US'.
+QUALIFIER_SUFFIX_REGEX = re.compile(
+    r'[\s._]*(?:\((?P<enclosed>(?:19|20)\d{2}|[A-Za-z]{2})\)|(?<=[\s._])(?P<bare>(?:19|20)\d{2}|US|UK|AU|NZ|CA))$')
+LEADING_ARTICLE_REGEX = re.compile(r'^(?:the|a|an)[\s._]+(?=\w)')
+TRAILING_ARTICLE_REGEX = re.compile(r',\s*(?:the|a|an)\s*$')
+NON_ALPHANUMERIC_REGEX = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_title(title):
+    """Reduce a title to a lookup key: case folded, '&' as 'and', no article, only letters and digits.
+
+    The article is dropped from the start ('The Office') and from the end ('Office, The').
+    """
+    title = TRAILING_ARTICLE_REGEX.sub('', LEADING_ARTICLE_REGEX.sub('', title.casefold().replace('&', 'and')))
+    return NON_ALPHANUMERIC_REGEX.sub('', title)
+
+
+def split_qualifiers(title):
+    """Split the trailing years and countries off a show name.
+
+    'Shameless (US)' gives ('Shameless', {'us'}) and 'Doctor Who 2005' gives ('Doctor Who', {'2005'}).
+    """
+    qualifiers = set()
+    match = QUALIFIER_SUFFIX_REGEX.search(title)
+    while match and match.start() > 0:
+        qualifiers.add((match.group('enclosed') or match.group('bare')).casefold())
+        title = title[:match.start()]
+        match = QUALIFIER_SUFFIX_REGEX.search(title)
+    return title, frozenset(qualifiers)
+
+
+class ReleaseParser:
+    """Parse release, folder and file names into title, year, season, episodes, quality and group.
+
+    Every pattern is compiled once and results are kept in an LRU cache, so a name that is
+    looked at by several phases of a run (renaming, the library move, the library scan) is
+    only matched once.
+    """
+
+    def __init__(self, cache_size=16384):
+        self.parse = functools.lru_cache(maxsize=cache_size)(self._parse)
+
+    @staticmethod
+    def _parse(name):
+        """Return the ParsedRelease for a name, or None if it has no episode marker, air date or year."""
+        re_match = EPISODE_REGEX.match(name)
+        if re_match:
+            if re_match.group('season') is not None:
+                season, episodes = re_match.group('season'), re_match.group('episodes')
+            else:
+                season, episodes = re_match.group('x_season'), re_match.group('x_episodes')
+            title, year, air_date, end = re_match.group('title'), None, None, re_match.end()
+            season, episodes = int(season), tuple(int(episode) for episode in EPISODE_NUMBER_REGEX.findall(episodes))
+        else:
+            re_match = DATE_REGEX.match(name)
+            if re_match:
+                title, year, season, episodes = re_match.group('title'), int(re_match.group('year')), None, ()
+                air_date = f"{re_match.group('year')}-{re_match.group('month')}-{re_match.group('day')}"
+                end = re_match.end()
+            else:
+                re_match = YEAR_REGEX.match(name)
+                if not re_match:
+                    return None
+                title, year, end = re_match.group('title'), int(re_match.group('year')), re_match.end('year')
+                season, episodes, air_date = None, (), None
+        quality = QUALITY_REGEX.search(name, end)
+        group = GROUP_REGEX.search(name, end)
+        return ParsedRelease(title, year, season, episodes, air_date,
+                             quality.group(1).lower() if quality else None, group.group('group') if group else None)
+
+    def parse_many(self, names):
+        """Parse a batch of names, returning a list of ParsedRelease or None in the same order."""
+        parse = self.parse
+        return [parse(name) for name in names]
+
+    def parse_episode(self, name):
+        """Return the ParsedRelease for a name with a season and episode number, or None."""
+        release = self.parse(name)
+        return release if release is not None and release.episodes else None
+
+    @staticmethod
+    def episode_tag(release):
+        """Format the episode part of a clean name, 'S01E02', 'S01E02E03' or '2024-03-15' for daily shows."""
+        if release.episodes:
+            return f"S{release.season:02d}" + ''.join(f"E{episode:02d}" for episode in release.episodes)
+        return release.air_date
+
+
+# The parser shared by the processors and the library index, so they share one cache.
+RELEASE_PARSER = ReleaseParser()
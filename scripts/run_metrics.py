@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class RunMetrics:
+    """Named phase timers and filesystem call counters for one run.
+
+    Phases accumulate, so a phase entered once per folder reports its total time, and
+    phases may nest (movies.plan includes movies.scan). Counters are safe to update from
+    the move engine's worker threads.
+    """
+
+    PREFIX = 'media_management'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.phases = Counter()
+            self.phase_counts = Counter()
+            self.calls = Counter()
+            self.totals = Counter({'bytes_moved': 0})
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.phases[name] += elapsed
+                self.phase_counts[name] += 1
+
+    def count(self, call, amount=1):
+        """Count filesystem calls such as listdir, stat, rename, rmtree, mkdir or link."""
+        with self.lock:
+            self.calls[call] += amount
+
+    def add(self, total, amount):
+        """Add to a running total such as bytes_moved."""
+        with self.lock:
+            self.totals[total] += amount
+
+    def to_dict(self):
+        with self.lock:
+            return {'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                    'duration': round(time.time() - self.started, 3),
+                    'phases': {name: {'seconds': round(seconds, 6), 'count': self.phase_counts[name]}
+                               for name, seconds in sorted(self.phases.items())},
+                    'calls': dict(sorted(self.calls.items())),
+                    'totals': dict(sorted(self.totals.items()))}
+
+    def format_prometheus(self):
+        """Render the metrics in the Prometheus text exposition format."""
+        summary = self.to_dict()
+        prefix = self.PREFIX
+        lines = [f'# HELP {prefix}_phase_seconds Wall time spent in each phase of the last run.',
+                 f'# TYPE {prefix}_phase_seconds gauge']
+        lines += [f'{prefix}_phase_seconds{{phase="{name}"}} {phase["seconds"]}'
+                  for name, phase in summary['phases'].items()]
+        lines += [f'# HELP {prefix}_filesystem_calls Filesystem calls made by the last run.',
+                  f'# TYPE {prefix}_filesystem_calls gauge']
+        lines += [f'{prefix}_filesystem_calls{{call="{name}"}} {count}' for name, count in summary['calls'].items()]
+        for name, value in summary['totals'].items():
+            lines += [f'# HELP {prefix}_{name} Total {name.replace("_", " ")} in the last run.',
+                      f'# TYPE {prefix}_{name} gauge', f'{prefix}_{name} {value}']
+        lines += [f'# HELP {prefix}_run_duration_seconds Wall time of the last run.',
+                  f'# TYPE {prefix}_run_duration_seconds gauge',
+                  f'{prefix}_run_duration_seconds {summary["duration"]}',
+                  f'# HELP {prefix}_last_run_timestamp_seconds Unix time the last run finished.',
+                  f'# TYPE {prefix}_last_run_timestamp_seconds gauge',
+                  f'{prefix}_last_run_timestamp_seconds {int(time.time())}']
+        return '\n'.join(lines) + '\n'
+
+    def write(self, config):
+        """Write the Prometheus textfile and JSON summary configured under settings.metrics."""
+        settings = config.settings.metrics
+        outputs = [(settings.prometheus_textfile, self.format_prometheus),
+                   (settings.json_summary, lambda: json.dumps(self.to_dict(), indent=2))]
+        for path, render in outputs:
+            if not path:
+                continue
+            try:
+                directory = os.path.dirname(path)
+                if directory and not os.path.exists(directory):
+                    os.makedirs(directory)
+                # node_exporter may read the file at any time, so replace it atomically.
+                temp_path = f"{path}.tmp"
+                with open(temp_path, 'w', encoding='utf-8') as file:
+                    file.write(render())
+                os.replace(temp_path, path)
+            except Exception as e:
+                logging.warning("Unable to write metrics to '%s': %s", path, e)
+
+
+# The metrics of the running process, updated by the scanners, executors and processors.
+METRICS = RunMetrics()
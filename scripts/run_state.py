@@ -0,0 +1,232 @@
+import dataclasses
+import hashlib
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from directory_scanner import DirectoryScanner
+from purge_engine import TRASH_DIR_NAME
+from run_metrics import METRICS
+
+SECONDS_PER_DAY = 86400
+
+
+class RunState:
+    """What earlier runs decided about each download folder, so a run only evaluates what changed.
+
+    Folders are keyed by device and inode, and a recorded decision ('skipped', 'kept' or
+    'renamed') stands while the folder keeps its path and mtime. Retention expiries are
+    kept in a heap per download directory, ordered by expiry time. A download directory is only listed again when
+    its own mtime changed, and then only its new names are stat'ed. An expired folder is
+    stat'ed once more before it is deleted, so a folder that changed in the meantime gets
+    a new expiry instead.
+
+    The state is discarded whenever the directories, libraries or processing settings in
+    the config change, because the recorded decisions depend on them. Pending decisions are
+    kept per thread, so processors running in parallel pipelines each commit only their own.
+    """
+
+    VERSION = 1
+
+    def __init__(self, state_path=None, config_key='', max_entries=200000):
+        self.state_path = state_path
+        self.config_key = config_key
+        self.max_entries = max_entries
+        self.decisions = {}
+        self.local = threading.local()
+        self.directories = {}
+        self.expiries = {}
+        self.expiry_paths = {}
+        self.heaps = {}
+        self.lock = threading.RLock()
+        self.dirty = False
+        self._load()
+
+    @classmethod
+    def from_config(cls, config):
+        """Create the state from settings.run_state, or return None when it has no path."""
+        settings = config.settings.run_state
+        if not settings.path:
+            return None
+        relevant = {'download_directories': dataclasses.asdict(config.download_directories),
+                    'media_libraries': dataclasses.asdict(config.media_libraries),
+                    'settings': {name: dataclasses.asdict(getattr(config.settings, name))
+                                 for name in ('movies', 'tv_shows', 'duplicates')}}
+        config_key = hashlib.sha1(json.dumps(relevant, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return cls(settings.path, config_key, settings.max_entries)
+
+    def _load(self):
+        if not self.state_path or not os.path.isfile(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except Exception as e:
+            logging.warning("Unable to read run state '%s': %s", self.state_path, e)
+            return
+        if data.get('version') != self.VERSION or data.get('config') != self.config_key:
+            logging.info("The config changed since the last run, evaluating every download folder again")
+            return
+        self.decisions = data.get('decisions', {})
+        self.directories = data.get('directories', {})
+        for key, (path, mtime, days_to_keep) in data.get('expiries', {}).items():
+            self.expiries[key] = [path, mtime, days_to_keep]
+            self.expiry_paths[path] = key
+            self.heaps.setdefault(os.path.normpath(os.path.dirname(path)), []).append(
+                (mtime + days_to_keep * SECONDS_PER_DAY, key, path))
+        for heap in self.heaps.values():
+            heapq.heapify(heap)
+
+    @staticmethod
+    def key(entry):
+        return f"{entry.device}:{entry.inode}"
+
+    def decision(self, entry):
+        """Return the decision recorded for a folder scan entry, or None if the folder is new or changed since."""
+        recorded = self.decisions.get(self.key(entry))
+        if recorded and recorded[0] == entry.path and recorded[1] == entry.mtime:
+            return recorded[2]
+        return None
+
+    def plan(self, entry, new_path):
+        """Remember where a plan leaves a folder, to be recorded once the plan has run.
+
+        new_path is None when the folder is left where it is. Folders the plan moves to another
+        directory are not recorded, the directory they were scanned in will not see them again.
+        """
+        if new_path is None or new_path == entry.path:
+            decision, new_path = ('kept' if new_path else 'skipped'), entry.path
+        elif os.path.dirname(new_path) == os.path.dirname(entry.path):
+            decision = 'renamed'
+        else:
+            return
+        self._pending()[self.key(entry)] = (new_path, decision)
+
+    def _pending(self):
+        if not hasattr(self.local, 'pending'):
+            self.local.pending = {}
+        return self.local.pending
+
+    def commit(self):
+        """Record the pending decisions against the mtime each folder has after the plan ran."""
+        pending, self.local.pending = self._pending(), {}
+        for key, (path, decision) in pending.items():
+            entry = DirectoryScanner.scan_path(path)
+            with self.lock:
+                self.decisions.pop(key, None)
+                if entry is not None:
+                    self.decisions[self.key(entry)] = [entry.path, entry.mtime, decision]
+                self.dirty = True
+
+    def discard(self):
+        """Forget the pending decisions of a plan that was not applied."""
+        self.local.pending = {}
+
+    def schedule_expiries(self, directory, days_to_keep):
+        """Add the new folders of a download directory to the expiry heap, if the directory changed at all."""
+        # Heaps are keyed by normalized directory, so 'downloads/movies/' from a config finds them too.
+        directory = os.path.normpath(directory)
+        METRICS.count('stat')
+        try:
+            directory_mtime = os.stat(directory).st_mtime
+        except OSError as e:
+            logging.error("Unable to read download directory '%s': %s", directory, e)
+            return
+        if self.directories.get(directory) == [directory_mtime, days_to_keep]:
+            return
+        METRICS.count('listdir')
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    with self.lock:
+                        scheduled = self.expiries.get(self.expiry_paths.get(entry.path))
+                    if entry.name == TRASH_DIR_NAME or (scheduled and scheduled[2] == days_to_keep):
+                        continue
+                    try:
+                        if not entry.is_dir():
+                            continue
+                        METRICS.count('stat')
+                        entry_stat = entry.stat()
+                    except OSError:
+                        continue
+                    with self.lock:
+                        self._schedule(f"{entry_stat.st_dev}:{entry_stat.st_ino}", entry.path, entry_stat.st_mtime,
+                                       days_to_keep)
+        except OSError as e:
+            logging.error("Unable to list download directory '%s': %s", directory, e)
+            return
+        # The mtime was read before listing, so a folder added meanwhile makes the next run list again.
+        with self.lock:
+            self.directories[directory] = [directory_mtime, days_to_keep]
+            self.dirty = True
+
+    def _schedule(self, key, path, mtime, days_to_keep):
+        previous = self.expiries.get(key)
+        if previous and self.expiry_paths.get(previous[0]) == key:
+            del self.expiry_paths[previous[0]]
+        self.expiries[key] = [path, mtime, days_to_keep]
+        self.expiry_paths[path] = key
+        heapq.heappush(self.heaps.setdefault(os.path.normpath(os.path.dirname(path)), []),
+                       (mtime + days_to_keep * SECONDS_PER_DAY, key, path))
+        self.dirty = True
+
+    def _forget(self, key):
+        path = self.expiries.pop(key)[0]
+        if self.expiry_paths.get(path) == key:
+            del self.expiry_paths[path]
+        self.dirty = True
+
+    def pop_expired(self, directories=None, now=None):
+        """Return [(path, days_to_keep)] for the folders whose retention period has passed.
+
+        Only the heaps of the given download directories are looked at, or all of them by default.
+        """
+        now = now or time.time()
+        expired = []
+        with self.lock:
+            for directory in list(self.heaps) if directories is None else map(os.path.normpath, directories):
+                heap = self.heaps.get(directory, [])
+                while heap and heap[0][0] <= now:
+                    expires, key, path = heapq.heappop(heap)
+                    scheduled = self.expiries.get(key)
+                    if not scheduled or scheduled[0] != path or \
+                            scheduled[1] + scheduled[2] * SECONDS_PER_DAY != expires:
+                        # Superseded by a later schedule of the same folder.
+                        continue
+                    entry = DirectoryScanner.scan_path(path)
+                    if entry is not None and self.key(entry) == key and entry.mtime != scheduled[1]:
+                        self._schedule(key, path, entry.mtime, scheduled[2])
+                        continue
+                    self._forget(key)
+                    # List the directory again next time, to pick up a folder that took this name or a
+                    # delete that did not go through.
+                    self.directories.pop(directory, None)
+                    if entry is not None and self.key(entry) == key:
+                        expired.append((path, scheduled[2]))
+        return expired
+
+    def save(self):
+        """Write the state file if anything changed."""
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        if not self.state_path or not self.dirty:
+            return
+        # Drop the oldest decisions first, dicts keep insertion order.
+        while len(self.decisions) > self.max_entries:
+            del self.decisions[next(iter(self.decisions))]
+        state_dir = os.path.dirname(self.state_path)
+        try:
+            if state_dir and not os.path.exists(state_dir):
+                os.makedirs(state_dir)
+            temp_path = f"{self.state_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump({'version': self.VERSION, 'config': self.config_key, 'decisions': self.decisions,
+                           'directories': self.directories, 'expiries': self.expiries}, file)
+            os.replace(temp_path, self.state_path)
+            self.dirty = False
+        except Exception as e:
+            logging.warning("Unable to save run state '%s': %s", self.state_path, e)
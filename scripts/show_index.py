@@ -0,0 +1,123 @@
+import logging
+from collections import Counter
+from release_parser import normalize_title, split_qualifiers
+
+
+class ShowIndex:
+    """Find library show folders by name, tolerating case, punctuation, articles and small spelling differences.
+
+    Exact lookups are a single dict access on the normalized name (see normalize_title).
+    Otherwise the name is looked up without its trailing year or country ('Shameless (US)'
+    without '(US)'), which only matches when a single folder has that name, with the same
+    country and not another year. Names matching neither are only compared with the
+    folders that share a trigram with them, scored by the Dice coefficient of the two trigram
+    sets, and the best folder wins when it scores at least threshold under the same rules.
+    """
+
+    MIN_FUZZY_KEY_LENGTH = 4
+
+    def __init__(self, threshold=0.8):
+        # A threshold of 1 (or none) turns fuzzy matching off.
+        self.threshold = threshold if threshold and threshold < 1 else None
+        self.keys = {}
+        # normalized name without qualifiers -> {show folder name: qualifiers}
+        self.bases = {}
+        self.trigrams = {}
+        self.trigram_counts = {}
+        self.fuzzy_matches = {}
+
+    @staticmethod
+    def _base_key(show_name):
+        base, qualifiers = split_qualifiers(show_name)
+        return normalize_title(base), qualifiers
+
+    @staticmethod
+    def _trigrams(key):
+        padded = f"  {key} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def add(self, show_name):
+        """Index a show folder name, an exact key already held by an earlier folder stays with that folder."""
+        key = normalize_title(show_name)
+        if key:
+            self.keys.setdefault(key, show_name)
+        base_key, qualifiers = self._base_key(show_name)
+        if base_key:
+            if base_key not in self.bases:
+                self.bases[base_key] = {}
+                trigrams = self._trigrams(base_key)
+                self.trigram_counts[base_key] = len(trigrams)
+                for trigram in trigrams:
+                    self.trigrams.setdefault(trigram, set()).add(base_key)
+            self.bases[base_key][show_name] = qualifiers
+        self.fuzzy_matches = {}
+
+    def remove(self, show_name):
+        key = normalize_title(show_name)
+        if self.keys.get(key) == show_name:
+            del self.keys[key]
+        base_key, _ = self._base_key(show_name)
+        shows = self.bases.get(base_key)
+        if shows is not None and shows.pop(show_name, None) is not None and not shows:
+            del self.bases[base_key]
+            del self.trigram_counts[base_key]
+            for trigram in self._trigrams(base_key):
+                keys = self.trigrams[trigram]
+                keys.discard(base_key)
+                if not keys:
+                    del self.trigrams[trigram]
+        self.fuzzy_matches = {}
+
+    def _base_match(self, base_key, qualifiers):
+        """Return the only folder of a base key, or None when several share it or its qualifiers differ."""
+        shows = self.bases.get(base_key)
+        if not shows or len(shows) > 1:
+            return None
+        show_name, show_qualifiers = next(iter(shows.items()))
+        # 'Doctor Who' may be 'Doctor Who (2005)', but 'Doctor Who 2005' is not 'Doctor Who (1963)' and
+        # 'Shameless (US)' is neither 'Shameless (UK)' nor 'Shameless'.
+        countries, show_countries = (set(filter(str.isalpha, names)) for names in (qualifiers, show_qualifiers))
+        years, show_years = qualifiers - countries, show_qualifiers - show_countries
+        if countries == show_countries and (not years or not show_years or years == show_years):
+            return show_name
+        return None
+
+    def find(self, show_name):
+        """Return the indexed folder name for a show name, or None when no folder is close enough."""
+        found = self.keys.get(normalize_title(show_name))
+        if found:
+            return found
+        base_key, qualifiers = self._base_key(show_name)
+        if base_key in self.bases:
+            shows = self.bases[base_key]
+            if len(shows) > 1:
+                logging.info("'%s' may be any of the library shows %s, not guessing", show_name,
+                             ', '.join(f"'{name}'" for name in sorted(shows)))
+            return self._base_match(base_key, qualifiers)
+        if self.threshold is None or len(base_key) < self.MIN_FUZZY_KEY_LENGTH:
+            return None
+        if (base_key, qualifiers) not in self.fuzzy_matches:
+            self.fuzzy_matches[(base_key, qualifiers)] = self._fuzzy_find(base_key, qualifiers, show_name)
+        return self.fuzzy_matches[(base_key, qualifiers)]
+
+    def _fuzzy_find(self, base_key, qualifiers, show_name):
+        trigrams = self._trigrams(base_key)
+        overlaps = Counter()
+        for trigram in trigrams:
+            overlaps.update(self.trigrams.get(trigram, ()))
+        best_key, best_score, ambiguous = None, self.threshold, False
+        for candidate, overlap in overlaps.items():
+            score = 2 * overlap / (len(trigrams) + self.trigram_counts[candidate])
+            if score > best_score:
+                best_key, best_score, ambiguous = candidate, score, False
+            elif score == best_score and best_key is not None:
+                ambiguous = True
+        if best_key is None:
+            return None
+        found = self._base_match(best_key, qualifiers)
+        if ambiguous or found is None:
+            logging.info("'%s' is close to several library shows or to a show of another year or country, "
+                         "not guessing", show_name)
+            return None
+        logging.info("Matched '%s' to library show '%s' (similarity %.2f)", show_name, found, best_score)
+        return found
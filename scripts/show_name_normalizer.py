@@ -0,0 +1,72 @@
+import functools
+import logging
+import re
+
+
+class ShowNameNormalizer:
+    """Clean raw show names and map known alternate names to their canonical name.
+
+    The cleanup rules are compiled into a single regex so a name is rewritten in one
+    pass, and the alternates from show_names.yaml are turned into a hash lookup.
+    Alternates ending in a space (for example 'C S I ') are treated as prefixes, so
+    'C S I Vegas' becomes 'CSI - Vegas'.
+    """
+
+    # Each rule is (group name, pattern, replacement). Order matters, the first rule
+    # that matches at a position wins.
+    CLEANUP_RULES = (
+        ('country', r'[ .](?P<country_code>AU|US)(?=\.?\s*$)', None),  # Replace trailing ' AU'/' US' with ' (AU)'/' (US)'
+        ('brackets', r'\s*\[.*?\]\s*', ''),  # Remove anything inside square brackets
+        ('dash', r'\.-\.', ''),  # Remove .-.
+        ('period', r'(?<=\w)\.(?=\w)', ' '),  # Replace periods between words with spaces
+        ('leading', r'^\s+', ''),  # Remove leading spaces
+        ('trailing', r'\.\s*$', ''),  # Remove a trailing period and possible trailing spaces
+    )
+
+    def __init__(self, show_name_alternates=None, cache_size=4096):
+        self.cleanup_regex = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern, _ in self.CLEANUP_RULES))
+        self.replacements = {name: replacement for name, _, replacement in self.CLEANUP_RULES}
+        self.alternates = {}
+        self.prefix_alternates = {}
+        self.prefix_regex = None
+        self.load_alternates(show_name_alternates or {})
+        self.normalize = functools.lru_cache(maxsize=cache_size)(self._normalize)
+
+    def load_alternates(self, show_name_alternates):
+        """Build the alternate name -> canonical name lookups from the show names config."""
+        self.alternates = {}
+        self.prefix_alternates = {}
+        for canonical_name, alternate_names in show_name_alternates.items():
+            self.alternates[self._key(canonical_name)] = canonical_name
+            for alternate_name in alternate_names or []:
+                if alternate_name.endswith(' '):
+                    self.prefix_alternates[alternate_name.casefold()] = canonical_name
+                else:
+                    self.alternates[self._key(alternate_name)] = canonical_name
+        if self.prefix_alternates:
+            # Longest prefixes first so the most specific alternate wins.
+            prefixes = sorted(self.prefix_alternates, key=len, reverse=True)
+            self.prefix_regex = re.compile('|'.join(re.escape(prefix) for prefix in prefixes), re.IGNORECASE)
+        else:
+            self.prefix_regex = None
+        logging.debug("Loaded %s show name alternates and %s prefixes", len(self.alternates), len(self.prefix_alternates))
+
+    @staticmethod
+    def _key(show_name):
+        return ' '.join(show_name.split()).casefold()
+
+    def _replace(self, re_match):
+        if re_match.lastgroup == 'country':
+            return f" ({re_match.group('country_code')})"
+        return self.replacements[re_match.lastgroup]
+
+    def _normalize(self, show_name):
+        show_name = self.cleanup_regex.sub(self._replace, show_name.strip())
+        canonical_name = self.alternates.get(self._key(show_name))
+        if canonical_name is not None:
+            return canonical_name
+        if self.prefix_regex:
+            re_match = self.prefix_regex.match(show_name)
+            if re_match:
+                return self.prefix_alternates[re_match.group(0).casefold()] + show_name[re_match.end():]
+        return show_name
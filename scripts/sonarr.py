@@ -1,19 +1,151 @@
-# Import SonarrAPI Class
-from pyarr import SonarrAPI
-
+import json
+import logging
+import os
+import re
 import sys
-from pprint import pprint
+import threading
+import time
+from http_pool import ConnectionPool
+from release_parser import YEAR_SUFFIX_REGEX, normalize_title
+
+
+class SonarrError(Exception):
+    pass
+
+
+class SonarrClient:
+    """Minimal Sonarr v3 API client."""
+
+    def __init__(self, base_url, api_key, timeout=10, pool_size=2):
+        self.api_key = api_key
+        self.pool = ConnectionPool(base_url, pool_size, timeout)
+
+    def get(self, path):
+        status, body = self.pool.request('GET', path, {'X-Api-Key': self.api_key, 'Accept': 'application/json'})
+        if status != 200:
+            raise SonarrError(f"GET {path} returned HTTP {status}")
+        return json.loads(body)
+
+    def get_series(self):
+        """Return every series Sonarr manages in one request."""
+        return self.get('/api/v3/series')
+
+
+class SonarrSeriesIndex:
+    """Map release show names to Sonarr's canonical series folder names.
+
+    The series list is fetched with one bulk request and cached on disk for ttl seconds,
+    then every title, alternate title and title without its year is indexed by its
+    normalized form, so each lookup is a single dict access. Exact titles win over titles
+    without their year.
+    """
+
+    def __init__(self, client, cache_path=None, ttl=6 * 3600):
+        self.client = client
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.titles = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Create the index from the sonarr section of the config, or return None when it is disabled."""
+        settings = config.sonarr
+        if not settings.enabled or not settings.url:
+            return None
+        client = SonarrClient(settings.url, settings.api_key, settings.timeout)
+        return cls(client, settings.cache_path, settings.cache_ttl_hours * 3600)
+
+    def _read_cache(self, allow_stale=False):
+        if not self.cache_path or not os.path.isfile(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as file:
+                cached = json.load(file)
+        except Exception as e:
+            logging.warning("Unable to read Sonarr cache '%s': %s", self.cache_path, e)
+            return None
+        if not allow_stale and time.time() - cached.get('fetched', 0) > self.ttl:
+            return None
+        return cached.get('series')
+
+    def _write_cache(self, series):
+        if not self.cache_path:
+            return
+        cache_dir = os.path.dirname(self.cache_path)
+        try:
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            temp_path = f"{self.cache_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump({'fetched': time.time(), 'series': series}, file)
+            os.replace(temp_path, self.cache_path)
+        except Exception as e:
+            logging.warning("Unable to save Sonarr cache '%s': %s", self.cache_path, e)
+
+    @staticmethod
+    def _slim(series):
+        """Keep only the fields the index needs, so the cache stays small."""
+        return [{'title': item.get('title', ''), 'path': item.get('path', ''),
+                 'alternateTitles': [alternate.get('title', '') for alternate in item.get('alternateTitles', [])]}
+                for item in series]
+
+    def load(self):
+        """Build the index from the cache, fetching the series list when the cache has expired."""
+        series = self._read_cache()
+        if series is None:
+            try:
+                series = self._slim(self.client.get_series())
+                self._write_cache(series)
+                logging.info("Fetched %s series from Sonarr", len(series))
+            except (SonarrError, ConnectionError, ValueError) as e:
+                series = self._read_cache(allow_stale=True)
+                logging.warning("Unable to fetch series from Sonarr, %s: %s",
+                                'using the expired cache' if series is not None else 'skipping lookups', e)
+                series = series or []
+        self.titles = self._index(series)
+        return self
+
+    @staticmethod
+    def _index(series):
+        """Map normalized titles to folders: titles first, then alternate titles, then titles without their year.
+
+        A title without its year is left out when it belongs to several series, so 'Doctor Who'
+        never stands for one of 'Doctor Who (1963)' and 'Doctor Who (2005)' by API order.
+        """
+        # The library folder is the last part of Sonarr's path, whichever OS Sonarr runs on.
+        folders = [re.split(r'[\\/]', item['path'].rstrip('\\/'))[-1] if item['path'] else item['title']
+                   for item in series]
+        titles = {}
+        for folder, item in zip(folders, series):
+            titles.setdefault(normalize_title(item['title']), folder)
+        for folder, item in zip(folders, series):
+            for title in item['alternateTitles']:
+                titles.setdefault(normalize_title(title), folder)
+        stripped = {}
+        for folder, item in zip(folders, series):
+            for title in [item['title'], *item['alternateTitles']]:
+                stripped.setdefault(normalize_title(YEAR_SUFFIX_REGEX.sub('', title)), set()).add(folder)
+        for key, stripped_folders in stripped.items():
+            if key not in titles and len(stripped_folders) == 1:
+                titles[key] = next(iter(stripped_folders))
+        return titles
 
-# Set Host URL and API-Key
-host_url = 'http://192.168.1.15:8989'
+    def resolve(self, show_name):
+        """Return the canonical folder name for a show name, or None when Sonarr does not know it."""
+        if self.titles is None:
+            with self.lock:
+                if self.titles is None:
+                    self.load()
+        return self.titles.get(normalize_title(show_name))
 
-# You can find your API key in Settings > General.
-api_key = '1111'
 
-# Instantiate SonarrAPI Object
-sonarr = SonarrAPI(host_url, api_key)
-pprint(dir(sonarr.lookup_series()))
-sys.exit(0)
+if __name__ == "__main__":
+    from config_handler import ConfigHandler
 
-# Get and print TV Shows
-print(sonarr.get_series())
\ No newline at end of file
+    series_index = SonarrSeriesIndex.from_config(ConfigHandler.load_config('config.yml'))
+    if series_index is None:
+        print("Sonarr is not enabled in config.yml")
+        sys.exit(1)
+    for name in sys.argv[1:]:
+        print(f"{name} -> {series_index.resolve(name)}")
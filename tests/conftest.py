@@ -0,0 +1,76 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# The scripts import each other as top-level modules, the way completed_downloads_manager.py runs them.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+
+class FakeServer:
+    """A local HTTP server answering from routes and recording every request it gets.
+
+    routes maps (method, path without query) to (status, body), a body that is not bytes is sent as JSON.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _answer(self):
+                path = self.path.split('?')[0]
+                fake.requests.append((self.command, self.path, dict(self.headers)))
+                status, body = fake.routes.get((self.command, path), (404, b''))
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_PUT = do_POST = _answer
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.01,), daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_server():
+    server = FakeServer()
+    yield server
+    server.close()
+
+
+MEDIA_SETTINGS = {'delete_failed': False, 'delete_unpack': False, 'days_to_keep_completed_downloads': 30,
+                  'days_to_keep_duplicate_downloads': 30, 'days_to_keep_incomplete_downloads': 30,
+                  'move_to_duplicates': True, 'move_to_library': False}
+
+
+@pytest.fixture
+def config_data(tmp_path):
+    """A valid config.yml as parsed YAML, with its download folders and libraries created under tmp_path."""
+    download_directories = {kind: {'movies': str(tmp_path / kind / 'movies'), 'tv_shows': str(tmp_path / kind / 'tv')}
+                            for kind in ('complete', 'duplicate', 'incomplete')}
+    media_libraries = {'movies': str(tmp_path / 'library' / 'movies'),
+                       'tv_shows': {'adult': str(tmp_path / 'library' / 'adult'),
+                                    'kids': str(tmp_path / 'library' / 'kids')}}
+    for path in [*(path for paths in download_directories.values() for path in paths.values()),
+                 media_libraries['movies'], *media_libraries['tv_shows'].values()]:
+        os.makedirs(path)
+    return {'download_directories': download_directories, 'media_libraries': media_libraries,
+            'settings': {'movies': dict(MEDIA_SETTINGS),
+                         'tv_shows': {**MEDIA_SETTINGS, 'days_to_keep_unpack': 7}}}
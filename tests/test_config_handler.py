@@ -0,0 +1,46 @@
+import os
+import pytest
+from config_handler import Config, ConfigError, ConfigHandler
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+
+
+@pytest.mark.parametrize('name', ['config.yml', 'config.yaml'])
+def test_shipped_configs_are_valid(name):
+    Config.from_dict(ConfigHandler.read_yaml(os.path.join(SCRIPTS, name)))
+
+
+def test_generated_default_config_is_valid(tmp_path):
+    ConfigHandler.create_default_config(str(tmp_path / 'config.yml'))
+    config = Config.from_dict(ConfigHandler.read_yaml(str(tmp_path / 'config.yml')))
+    assert config.settings.duplicates == type(config.settings.duplicates)(
+        fingerprint_cache='cache/fingerprints.json', probe_cache='cache/media_probes.json')
+
+
+def test_missing_sections_fall_back_to_defaults(config_data):
+    config = Config.from_dict(config_data)
+    assert config.settings.move_engine.max_workers == 4
+    assert config.settings.watch.retention_interval_hours == 24
+    assert config.sonarr.enabled is False and config.plex.path_mappings is None
+    assert config.logging.format == 'text'
+
+
+def test_every_mistyped_key_is_reported(config_data):
+    config_data['settings'].update(move_engine={'max_workers': 'four'}, journal={'keep_runs': -1},
+                                   purge={'unlinks_per_second': 'fast'}, watch={'force_polling': 'yes'})
+    config_data['settings']['tv_shows']['days_to_keep_unpack'] = '7'
+    config_data['sonarr'] = {'enabled': 'true', 'cache_ttl_hours': 6}
+    config_data['plex'] = {'path_mappings': ['/mnt/media:/data']}
+    config_data['logging'] = {'format': 'xml'}
+    with pytest.raises(ConfigError) as raised:
+        Config.from_dict(config_data)
+    assert str(raised.value).splitlines()[1:] == [
+        "  settings.tv_shows.days_to_keep_unpack should be a whole number, not '7'",
+        "  settings.move_engine.max_workers should be a whole number, not 'four'",
+        "  settings.journal.keep_runs is out of range: -1",
+        "  settings.purge.unlinks_per_second should be a number, not 'fast'",
+        "  settings.watch.force_polling should be true or false, not 'yes'",
+        "  logging.format should be one of text, json, not 'xml'",
+        "  sonarr.enabled should be true or false, not 'true'",
+        "  plex.path_mappings should be a mapping, not ['/mnt/media:/data']",
+    ]
@@ -0,0 +1,53 @@
+import os
+from download_watcher import PollingBackend
+from purge_engine import TRASH_DIR_NAME
+
+
+def make_backend(root, monkeypatch):
+    """Return a polling backend over root and the list of folders it walked."""
+    walked = []
+    signature = PollingBackend._signature
+
+    def recording_signature(path):
+        walked.append(os.path.basename(path))
+        return signature(path)
+
+    monkeypatch.setattr(PollingBackend, '_signature', staticmethod(recording_signature))
+    return PollingBackend([str(root)], interval=0), walked
+
+
+def test_new_and_growing_folders_are_reported(tmp_path, monkeypatch):
+    (tmp_path / 'Old.Release').mkdir()
+    backend, _ = make_backend(tmp_path, monkeypatch)
+    assert backend.wait(0) == set()
+    (tmp_path / 'New.Release').mkdir()
+    (tmp_path / 'New.Release' / 'part.mkv').write_bytes(b'a')
+    assert backend.wait(0) == {(str(tmp_path), str(tmp_path / 'New.Release'))}
+    (tmp_path / 'New.Release' / 'part.mkv').write_bytes(b'abc')
+    assert backend.wait(0) == {(str(tmp_path), str(tmp_path / 'New.Release'))}
+    assert backend.wait(0) == set()
+
+
+def test_settled_folders_are_not_walked(tmp_path, monkeypatch):
+    (tmp_path / 'Release' / 'Subs').mkdir(parents=True)
+    (tmp_path / TRASH_DIR_NAME).mkdir()
+    backend, walked = make_backend(tmp_path, monkeypatch)
+    backend.wait(0)
+    walked.clear()
+    for _ in range(3):
+        assert backend.wait(0) == set()
+    assert walked == []
+    (tmp_path / 'Release' / 'Sample').mkdir()
+    assert backend.wait(0) == {(str(tmp_path), str(tmp_path / 'Release'))}
+    assert walked == ['Release']
+
+
+def test_vanished_folders_do_not_abort_the_poll(tmp_path, monkeypatch):
+    (tmp_path / 'Gone').mkdir()
+    (tmp_path / 'Kept').mkdir()
+    backend, _ = make_backend(tmp_path, monkeypatch)
+    os.rmdir(tmp_path / 'Gone')
+    (tmp_path / 'Kept' / 'movie.mkv').write_bytes(b'a')
+    assert backend.wait(0) == {(str(tmp_path), str(tmp_path / 'Kept'))}
+    assert backend.changing == {str(tmp_path / 'Kept')}
+    assert PollingBackend._signature(str(tmp_path / 'Gone')) == (0.0, 0, 0)
@@ -0,0 +1,99 @@
+import os
+import pytest
+from library_index import LibraryIndex
+
+
+def age(*paths):
+    """Move the mtime of folders into the past, file system timestamps are too coarse to tell apart quick changes."""
+    for path in paths:
+        os.utime(path, (os.stat(path).st_atime, os.stat(path).st_mtime - 100))
+
+
+@pytest.fixture
+def library(tmp_path):
+    season = tmp_path / 'library' / 'Lost' / 'Season 1'
+    for episode in (1, 2):
+        (season / f'Lost S01E0{episode}').mkdir(parents=True)
+    (tmp_path / 'library' / 'Lost' / 'Season 2').mkdir()
+    (tmp_path / 'library' / 'Lost' / 'Season 2' / 'Lost S02E01.mkv').write_bytes(b'')
+    age(season, season.parent / 'Season 2', season.parent)
+    return tmp_path / 'library'
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    """Record the season folders the index lists."""
+    scanned = []
+    scan_season = LibraryIndex._scan_season
+
+    def recording_scan_season(season_path):
+        scanned.append(os.path.basename(season_path))
+        return scan_season(season_path)
+
+    monkeypatch.setattr(LibraryIndex, '_scan_season', staticmethod(recording_scan_season))
+    return scanned
+
+
+def load(library, tmp_path):
+    return LibraryIndex.load_or_build([str(library)], str(tmp_path / 'cache' / 'library_index.json'))
+
+
+def test_unchanged_seasons_come_from_the_cache(library, tmp_path, scans):
+    load(library, tmp_path).save()
+    assert sorted(scans) == ['Season 1', 'Season 2']
+    scans.clear()
+    index = load(library, tmp_path)
+    assert scans == []
+    assert index.has_episode('Lost', 1, 2) and index.has_episode('Lost', 2, 1)
+
+
+def test_changed_season_is_rescanned(library, tmp_path, scans):
+    load(library, tmp_path).save()
+    scans.clear()
+    os.rmdir(library / 'Lost' / 'Season 1' / 'Lost S01E02')
+    (library / 'Lost' / 'Season 1' / 'Lost S01E03').mkdir()
+    index = load(library, tmp_path)
+    assert scans == ['Season 1']
+    assert index.has_episode('Lost', 1, 3)
+    assert not index.has_episode('Lost', 1, 2)
+
+
+def test_new_season_and_show_are_found(library, tmp_path, scans):
+    load(library, tmp_path).save()
+    (library / 'Lost' / 'Season 3').mkdir()
+    (library / 'Lost' / 'Season 3' / 'Lost S03E01').mkdir()
+    (library / 'Heroes' / 'Season 1' / 'Heroes S01E01').mkdir(parents=True)
+    scans.clear()
+    index = load(library, tmp_path)
+    assert sorted(scans) == ['Season 1', 'Season 3']
+    assert index.has_episode('Lost', 3, 1) and index.has_episode('Heroes', 1, 1)
+
+
+def test_refreshed_season_is_not_rescanned_after_our_own_move(library, tmp_path, scans):
+    index = load(library, tmp_path)
+    (library / 'Lost' / 'Season 1' / 'Lost S01E03').mkdir()
+    index.add_episode('Lost', 1, 3)
+    index.save()
+    scans.clear()
+    assert load(library, tmp_path).has_episode('Lost', 1, 3)
+    assert scans == []
+
+
+def test_discarded_episodes_are_rescanned(library, tmp_path, scans):
+    index = load(library, tmp_path)
+    index.add_episode('Lost', 1, 3, refresh_mtime=False)
+    index.refresh_season('Lost', 1)
+    index.discard_episodes('Lost', 1, (3,))
+    index.save()
+    scans.clear()
+    index = load(library, tmp_path)
+    assert scans == ['Season 1']
+    assert not index.has_episode('Lost', 1, 3) and index.has_episode('Lost', 1, 2)
+
+
+def test_cache_of_another_version_is_ignored(library, tmp_path, scans, monkeypatch):
+    load(library, tmp_path).save()
+    monkeypatch.setattr(LibraryIndex, 'CACHE_VERSION', LibraryIndex.CACHE_VERSION + 1)
+    scans.clear()
+    load(library, tmp_path)
+    assert sorted(scans) == ['Season 1', 'Season 2']
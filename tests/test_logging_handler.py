@@ -0,0 +1,45 @@
+import json
+import logging
+import pytest
+from config_handler import Config
+from logging_handler import LoggingHandler
+
+
+@pytest.fixture
+def root_logger():
+    logger = logging.getLogger()
+    handlers, level = list(logger.handlers), logger.level
+    yield logger
+    LoggingHandler.shutdown()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    for handler in handlers:
+        logger.addHandler(handler)
+    logger.setLevel(level)
+
+
+def read_log(config_data, tmp_path, log_format):
+    config_data['logging'] = {'level': 'INFO', 'file': str(tmp_path / 'app.log'), 'format': log_format}
+    LoggingHandler.setup_logging(Config.from_dict(config_data))
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logging.exception("Failed to move '%s'", '/downloads/Heat.1995')
+    logging.info("Moved", extra={'operation': 'move', 'source': '/a', 'destination': '/b'})
+    LoggingHandler.shutdown()
+    return (tmp_path / 'app.log').read_text(encoding='utf-8')
+
+
+def test_json_lines_keep_the_exception_apart_from_the_message(root_logger, config_data, tmp_path):
+    failed, moved = map(json.loads, read_log(config_data, tmp_path, 'json').splitlines())
+    assert failed['message'] == "Failed to move '/downloads/Heat.1995'"
+    assert failed['level'] == 'ERROR'
+    assert 'ZeroDivisionError' in failed['exception']
+    assert 'exception' not in moved
+    assert (moved['operation'], moved['source'], moved['destination']) == ('move', '/a', '/b')
+
+
+def test_text_log_appends_the_traceback(root_logger, config_data, tmp_path):
+    text = read_log(config_data, tmp_path, 'text')
+    assert "ERROR - [Line:" in text and "Failed to move '/downloads/Heat.1995'\nTraceback" in text
+    assert text.rstrip().endswith('- Moved')
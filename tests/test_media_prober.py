@@ -0,0 +1,30 @@
+from media_prober import MediaInfo, MediaProber
+
+MBIT = 1000000
+
+
+def is_better(release, library):
+    return MediaProber().is_better(MediaInfo(*release), MediaInfo(*library))
+
+
+def test_higher_resolution_is_better():
+    assert is_better((1920, 1080, 'h264', 3600, 8 * MBIT), (1280, 720, 'h264', 3600, 6 * MBIT))
+    assert not is_better((1280, 720, 'hevc', 3600, 6 * MBIT), (1920, 1080, 'h264', 3600, 8 * MBIT))
+
+
+def test_cropped_widescreen_counts_by_its_width():
+    assert is_better((1920, 800, 'h264', 3600, 6 * MBIT), (1280, 720, 'h264', 3600, 6 * MBIT))
+
+
+def test_small_reencode_does_not_replace_a_remux():
+    assert not is_better((1920, 1080, 'hevc', 7200, 4 * MBIT), (1920, 1080, 'h264', 7200, 30 * MBIT))
+
+
+def test_same_resolution_needs_clearly_more_weighted_bitrate():
+    assert is_better((1920, 1080, 'hevc', 7200, 12 * MBIT), (1920, 1080, 'h264', 7200, 10 * MBIT))
+    assert not is_better((1920, 1080, 'h264', 7200, 10.5 * MBIT), (1920, 1080, 'h264', 7200, 10 * MBIT))
+
+
+def test_same_resolution_without_bitrate_is_not_better():
+    assert not is_better((1920, 1080, 'av1', None, None), (1920, 1080, 'h264', 7200, 10 * MBIT))
+    assert not is_better((1920, 1080, 'av1', 7200, 10 * MBIT), (1920, 1080, 'h264', None, None))
@@ -0,0 +1,142 @@
+import errno
+import os
+import threading
+import time
+import pytest
+from move_engine import MoveEngine
+
+
+@pytest.fixture
+def cross_device(monkeypatch):
+    """Make renames of the given sources fail with EXDEV, as if they were on another device."""
+    sources = set()
+    rename = os.rename
+
+    def fake_rename(source, destination):
+        if source in sources:
+            raise OSError(errno.EXDEV, 'Invalid cross-device link', source)
+        rename(source, destination)
+
+    monkeypatch.setattr(os, 'rename', fake_rename)
+    return sources
+
+
+@pytest.fixture
+def engine():
+    engine = MoveEngine(max_workers=4, max_concurrent_per_device=1)
+    yield engine
+    engine.shutdown()
+
+
+def make_release(path):
+    (path / 'Subs').mkdir(parents=True)
+    (path / 'movie.mkv').write_bytes(os.urandom(300000))
+    (path / 'Subs' / 'movie.srt').write_text('1\n00:00:01,000 --> 00:00:02,000\nHello\n')
+    (path / 'sample.mkv').symlink_to('movie.mkv')
+    return str(path)
+
+
+@pytest.mark.parametrize('kernel_copy', [(True, True), (False, True), (False, False)],
+                         ids=['copy_file_range', 'sendfile', 'buffered'])
+def test_cross_device_move_copies_then_removes_the_source(tmp_path, cross_device, engine, kernel_copy):
+    source = make_release(tmp_path / 'downloads' / 'Heat (1995)')
+    content = (tmp_path / 'downloads' / 'Heat (1995)' / 'movie.mkv').read_bytes()
+    (tmp_path / 'library').mkdir()
+    destination = str(tmp_path / 'library' / 'Heat (1995)')
+    cross_device.add(source)
+    engine.copy_file_range_supported, engine.sendfile_supported = kernel_copy
+    engine.chunk_size = 65536
+    assert engine.move(source, destination).result() == destination
+    assert engine.wait() == []
+    assert not os.path.exists(source)
+    assert (tmp_path / 'library' / 'Heat (1995)' / 'movie.mkv').read_bytes() == content
+    assert (tmp_path / 'library' / 'Heat (1995)' / 'Subs' / 'movie.srt').read_text().endswith('Hello\n')
+    assert os.readlink(os.path.join(destination, 'sample.mkv')) == 'movie.mkv'
+    assert os.listdir(tmp_path / 'library') == ['Heat (1995)']
+
+
+def test_failed_copy_leaves_no_partial_and_is_reported(tmp_path, cross_device, engine, monkeypatch):
+    source = make_release(tmp_path / 'Heat (1995)')
+    (tmp_path / 'library').mkdir()
+    destination = str(tmp_path / 'library' / 'Heat (1995)')
+    cross_device.add(source)
+    copy_file = engine._copy_file
+
+    def failing_copy_file(file_source, file_destination, progress):
+        if file_source.endswith('.srt'):
+            raise OSError(errno.ENOSPC, 'No space left on device', file_destination)
+        copy_file(file_source, file_destination, progress)
+
+    monkeypatch.setattr(engine, '_copy_file', failing_copy_file)
+    future = engine.move(source, destination)
+    failures = engine.wait()
+    assert [(failed_source, failed_destination) for failed_source, failed_destination, _ in failures] == \
+        [(source, destination)]
+    assert failures[0][2] is future.exception() and failures[0][2].errno == errno.ENOSPC
+    assert os.listdir(tmp_path / 'library') == []
+    assert os.path.isfile(os.path.join(source, 'movie.mkv'))
+
+
+def test_existing_destination_is_never_replaced(tmp_path, cross_device, engine):
+    source = make_release(tmp_path / 'Heat (1995)')
+    (tmp_path / 'library' / 'Heat (1995)').mkdir(parents=True)
+    cross_device.add(source)
+    engine.move(source, str(tmp_path / 'library' / 'Heat (1995)'))
+    [(_, _, exception)] = engine.wait()
+    assert isinstance(exception, FileExistsError)
+    assert os.path.isdir(source)
+
+
+def test_partial_copy_left_by_a_crash_is_replaced(tmp_path, cross_device, engine):
+    source = make_release(tmp_path / 'Heat (1995)')
+    (tmp_path / 'library' / 'Heat (1995).partial').mkdir(parents=True)
+    (tmp_path / 'library' / 'Heat (1995).partial' / 'movie.mkv').write_bytes(b'truncated')
+    cross_device.add(source)
+    engine.move(source, str(tmp_path / 'library' / 'Heat (1995)'))
+    assert engine.wait() == []
+    assert sorted(os.listdir(tmp_path / 'library')) == ['Heat (1995)']
+
+
+def test_copies_to_one_device_are_limited(tmp_path, cross_device, engine, monkeypatch):
+    (tmp_path / 'library').mkdir()
+    running, peak, lock = [0], [0], threading.Lock()
+    copy_file = engine._copy_file
+
+    def slow_copy_file(file_source, file_destination, progress):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        copy_file(file_source, file_destination, progress)
+        with lock:
+            running[0] -= 1
+
+    monkeypatch.setattr(engine, '_copy_file', slow_copy_file)
+    for number in range(4):
+        (tmp_path / f'movie{number}.mkv').write_bytes(b'x' * 1000)
+        cross_device.add(str(tmp_path / f'movie{number}.mkv'))
+        engine.move(str(tmp_path / f'movie{number}.mkv'), str(tmp_path / 'library' / f'movie{number}.mkv'))
+    assert engine.wait() == []
+    assert peak[0] == 1
+    assert len(os.listdir(tmp_path / 'library')) == 4
+
+
+def test_wait_for_futures_leaves_other_moves_pending(tmp_path, cross_device, engine):
+    (tmp_path / 'library').mkdir()
+    futures = []
+    for name in ('a.mkv', 'b.mkv'):
+        (tmp_path / name).write_bytes(b'x')
+        cross_device.add(str(tmp_path / name))
+        futures.append(engine.move(str(tmp_path / name), str(tmp_path / 'library' / name)))
+    engine.move(str(tmp_path / 'missing.mkv'), str(tmp_path / 'library' / 'missing.mkv'))
+    assert engine.wait(futures[:1]) == []
+    assert len(engine.pending) == 2
+    assert [destination for _, destination, _ in engine.wait()] == [str(tmp_path / 'library' / 'missing.mkv')]
+
+
+def test_same_device_move_is_a_rename(tmp_path, engine):
+    (tmp_path / 'library').mkdir()
+    source = make_release(tmp_path / 'Heat (1995)')
+    future = engine.move(source, str(tmp_path / 'library' / 'Heat (1995)'))
+    assert future.done() and future.result() == str(tmp_path / 'library' / 'Heat (1995)')
+    assert engine.pending == []
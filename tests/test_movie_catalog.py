@@ -0,0 +1,80 @@
+import os
+import pytest
+from movie_catalog import MovieCatalog
+
+FOLDERS = ['The Matrix (1999)', 'Heat (1995)', 'Alien', 'Dune (1984)', 'Dune (2021)', 'Solaris (1972)',
+           'Solaris (2002)', 'Casablanca (1942)']
+
+
+@pytest.fixture
+def library(tmp_path):
+    for folder in FOLDERS:
+        (tmp_path / 'movies' / folder).mkdir(parents=True)
+    return str(tmp_path / 'movies')
+
+
+@pytest.mark.parametrize('name, folder', [
+    ('Matrix, The (1999)', 'The Matrix (1999)'),
+    ('the matrix (1999)', 'The Matrix (1999)'),
+    ('Heat (1996)', 'Heat (1995)'),
+    ('Heat (1994)', 'Heat (1995)'),
+    ('Heat (1997)', None),
+    ('Heat', 'Heat (1995)'),
+    ('Alien (1979)', 'Alien'),
+    ('Dune (2021)', 'Dune (2021)'),
+    ('Dune', None),
+    ('Dune (2000)', None),
+    ('Casablanca (1943)', 'Casablanca (1942)'),
+    ('Solaris (1973)', 'Solaris (1972)'),
+    ('Blade Runner (1982)', None),
+])
+def test_find(library, name, folder):
+    assert MovieCatalog.load_or_build(library).find(name) == folder
+
+
+def test_year_off_by_one_matches_only_one_folder(tmp_path):
+    for folder in ('Halloween (2018)', 'Halloween (2020)'):
+        (tmp_path / folder).mkdir()
+    catalog = MovieCatalog.load_or_build(str(tmp_path))
+    assert catalog.find('Halloween (2019)') is None
+    assert catalog.find('Halloween (2021)') == 'Halloween (2020)'
+
+
+def test_failed_moves_are_dropped_by_sync(library):
+    catalog = MovieCatalog.load_or_build(library)
+    catalog.add('Blade Runner (1982)')
+    catalog.add('Arrival (2016)')
+    os.mkdir(os.path.join(library, 'Arrival (2016)'))
+    catalog.sync({os.path.join(library, 'Blade Runner (1982)')})
+    assert catalog.find('Blade Runner (1982)') is None
+    assert catalog.find('Arrival (2016)') == 'Arrival (2016)'
+    assert catalog.unconfirmed == set()
+
+
+def test_removed_folder_gives_way_to_another_with_the_same_key(library):
+    os.mkdir(os.path.join(library, 'Matrix, The (1999)'))
+    catalog = MovieCatalog.load_or_build(library)
+    assert catalog.find('The Matrix (1999)') == 'Matrix, The (1999)'
+    catalog.remove('Matrix, The (1999)')
+    assert catalog.find('The Matrix (1999)') == 'The Matrix (1999)'
+
+
+def test_synced_catalog_is_reused_from_the_cache(library, tmp_path, monkeypatch):
+    cache_path = str(tmp_path / 'catalog.json')
+    catalog = MovieCatalog.load_or_build(library, cache_path)
+    os.mkdir(os.path.join(library, 'Arrival (2016)'))
+    catalog.add('Arrival (2016)')
+    catalog.sync()
+    catalog.save()
+    monkeypatch.setattr(os, 'scandir', None)
+    assert MovieCatalog.load_or_build(library, cache_path).find('Arrival (2016)') == 'Arrival (2016)'
+
+
+def test_library_changed_elsewhere_is_listed_again(library, tmp_path):
+    cache_path = str(tmp_path / 'catalog.json')
+    catalog = MovieCatalog.load_or_build(library, cache_path)
+    catalog.sync()
+    catalog.save()
+    os.rename(os.path.join(library, 'Heat (1995)'), os.path.join(tmp_path, 'Heat (1995)'))
+    os.utime(library, (0, 0))
+    assert MovieCatalog.load_or_build(library, cache_path).find('Heat (1995)') is None
@@ -0,0 +1,87 @@
+import os
+from move_engine import MoveEngine
+from operation_plan import Operation, Plan, PlanExecutor
+from operations_journal import OperationsJournal
+
+
+def events(journal_path, event):
+    """Return (action, source) of the journal records of one event."""
+    return [(record['action'], record['source']) for record in OperationsJournal(journal_path).read_records()
+            if record.get('event') == event]
+
+
+def test_failed_operation_skips_the_operations_on_its_destination(tmp_path):
+    journal_path = str(tmp_path / 'journal.jsonl')
+    (tmp_path / 'Lost.S01E02').mkdir()
+    plan = Plan()
+    plan.add('rename', str(tmp_path / 'Missing.S01E01'), str(tmp_path / 'Missing S01E01'), 'clean name')
+    plan.add('rename_files', str(tmp_path / 'Missing S01E01'), 'Missing S01E01')
+    plan.add('move', str(tmp_path / 'Missing S01E01'), str(tmp_path / 'library' / 'Missing S01E01'), 'new episode')
+    plan.add('rename', str(tmp_path / 'Lost.S01E02'), str(tmp_path / 'Lost S01E02'), 'clean name')
+    failed_paths = PlanExecutor(journal=OperationsJournal(journal_path)).execute(plan)
+    assert failed_paths == {str(tmp_path / 'Missing S01E01'), str(tmp_path / 'library' / 'Missing S01E01')}
+    assert (tmp_path / 'Lost S01E02').is_dir()
+    assert events(journal_path, 'done') == [('rename', str(tmp_path / 'Lost.S01E02'))]
+    assert len(events(journal_path, 'failed')) == 3
+
+
+def test_operation_after_a_failed_move_is_skipped(tmp_path):
+    (tmp_path / 'library' / 'Heat (1995)').mkdir(parents=True)
+    (tmp_path / 'library' / 'Heat (1995)' / 'heat.avi').write_bytes(b'old')
+    (tmp_path / 'Heat.1995.1080p').mkdir()
+    (tmp_path / 'Heat.1995.1080p' / 'heat.mkv').write_bytes(b'new')
+    parked_path = str(tmp_path / 'duplicates' / 'heat.avi')
+    new_path = str(tmp_path / 'library' / 'Heat (1995)' / 'heat.mkv')
+    plan = Plan()
+    # The duplicates folder is missing, so the library copy cannot be parked.
+    plan.add('rename', str(tmp_path / 'library' / 'Heat (1995)' / 'heat.avi'), parked_path, 'replaced')
+    plan.add('rename', str(tmp_path / 'Heat.1995.1080p' / 'heat.mkv'), new_path, 'upgrade', {'after': [parked_path]})
+    plan.add('rename', str(tmp_path / 'Heat.1995.1080p'), str(tmp_path / 'Heat (1995)'), 'left over',
+             {'after': [new_path]})
+    engine = MoveEngine()
+    try:
+        failed_paths = PlanExecutor(engine).execute(plan)
+    finally:
+        engine.shutdown()
+    assert failed_paths == {parked_path, new_path, str(tmp_path / 'Heat (1995)')}
+    assert sorted(os.listdir(tmp_path / 'library' / 'Heat (1995)')) == ['heat.avi']
+    assert (tmp_path / 'Heat.1995.1080p' / 'heat.mkv').is_file()
+
+
+def test_operation_after_never_replaces_its_destination(tmp_path):
+    (tmp_path / 'library').mkdir()
+    (tmp_path / 'library' / 'heat.mkv').write_bytes(b'old')
+    (tmp_path / 'heat.mkv').write_bytes(b'new')
+    plan = Plan()
+    plan.add('rename', str(tmp_path / 'heat.mkv'), str(tmp_path / 'library' / 'heat.mkv'), 'upgrade',
+             {'after': [str(tmp_path / 'parked.mkv')]})
+    assert PlanExecutor().execute(plan) == {str(tmp_path / 'library' / 'heat.mkv')}
+    assert (tmp_path / 'library' / 'heat.mkv').read_bytes() == b'old'
+
+
+def test_resume_finishes_the_operations_of_an_interrupted_run(tmp_path):
+    journal_path = str(tmp_path / 'journal.jsonl')
+    for name in ('Alien.1979', 'Heat.1995', 'Both.2000', 'Both (2000)'):
+        (tmp_path / name).mkdir()
+    operations = [Operation('rename', str(tmp_path / 'Alien.1979'), str(tmp_path / 'Alien (1979)'), 'clean name'),
+                  Operation('rename', str(tmp_path / 'Heat.1995'), str(tmp_path / 'Heat (1995)'), 'clean name'),
+                  Operation('delete', str(tmp_path / 'Gone.2001'), reason='failed download'),
+                  Operation('rename', str(tmp_path / 'Both.2000'), str(tmp_path / 'Both (2000)'), 'clean name')]
+    # The intents were made durable, then the run died after applying the first operation.
+    journal = OperationsJournal(journal_path)
+    for operation in operations:
+        journal.record_intent(operation)
+    journal.flush()
+    os.rename(operations[0].source, operations[0].destination)
+
+    journal = OperationsJournal(journal_path)
+    assert len(journal.unfinished_operations()) == 4
+    assert PlanExecutor(journal=journal).resume() == set()
+    journal.end_run()
+    assert (tmp_path / 'Heat (1995)').is_dir() and not (tmp_path / 'Heat.1995').exists()
+    assert (tmp_path / 'Both.2000').is_dir()
+    journal = OperationsJournal(journal_path)
+    assert journal.unfinished_operations() == []
+    assert journal.is_processed(str(tmp_path / 'Alien (1979)'))
+    assert journal.is_processed(str(tmp_path / 'Heat (1995)'))
+    assert PlanExecutor(journal=journal).resume() == set()
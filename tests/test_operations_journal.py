@@ -0,0 +1,86 @@
+import os
+from operation_plan import Operation
+from operations_journal import OperationsJournal
+
+
+def run_rename(journal, source, destination):
+    """Rename source to destination as one journaled run."""
+    operation = Operation('rename', source, destination, 'clean name')
+    key = journal.record_intent(operation)
+    os.rename(source, destination)
+    journal.record_result(key, operation)
+    journal.end_run()
+
+
+def test_old_runs_are_folded_into_a_snapshot(tmp_path):
+    journal_path = str(tmp_path / 'journal.jsonl')
+    journal = OperationsJournal(journal_path, keep_runs=2)
+    folders = []
+    for number in range(5):
+        source = tmp_path / f'Show.S01E0{number}'
+        source.mkdir()
+        folders.append(str(tmp_path / f'Show S01E0{number}'))
+        run_rename(journal, str(source), folders[-1])
+    # Compacted when the fifth run ended, the last two runs are kept.
+    assert len(journal.runs()) == 2
+    os.rmdir(folders[0])
+    for number in range(5, 7):
+        source = tmp_path / f'Show.S01E0{number}'
+        source.mkdir()
+        folders.append(str(tmp_path / f'Show S01E0{number}'))
+        run_rename(journal, str(source), folders[-1])
+    # Folders gone from disk are pruned from the snapshot when the journal is compacted again.
+    journal.compact()
+    with open(journal_path, encoding='utf-8') as file:
+        assert sum(1 for _ in file) < 6 * 5
+    reloaded = OperationsJournal(journal_path, keep_runs=2)
+    assert not reloaded.is_processed(folders[0])
+    assert all(reloaded.is_processed(folder) for folder in folders[1:])
+    assert len(reloaded.runs()) == 2
+    assert reloaded.undo_run(reloaded.runs()[-1]) == 1
+
+
+def test_kept_runs_can_still_be_undone(tmp_path):
+    journal = OperationsJournal(str(tmp_path / 'journal.jsonl'), keep_runs=1)
+    for number in range(3):
+        (tmp_path / f'Movie.{number}').mkdir()
+        run_rename(journal, str(tmp_path / f'Movie.{number}'), str(tmp_path / f'Movie ({number})'))
+    assert journal.undo_run(journal.runs()[-1]) == 1
+    assert (tmp_path / 'Movie.2').is_dir()
+    assert not journal.is_processed(str(tmp_path / 'Movie (2)'))
+    assert journal.is_processed(str(tmp_path / 'Movie (1)'))
+
+
+def test_unfinished_operations_survive_compaction(tmp_path):
+    journal_path = str(tmp_path / 'journal.jsonl')
+    journal = OperationsJournal(journal_path, keep_runs=1)
+    journal.record_intent(Operation('rename', str(tmp_path / 'a'), str(tmp_path / 'b')))
+    journal.end_run()
+    for number in range(3):
+        (tmp_path / f'Movie.{number}').mkdir()
+        run_rename(journal, str(tmp_path / f'Movie.{number}'), str(tmp_path / f'Movie ({number})'))
+    unfinished = OperationsJournal(journal_path, keep_runs=1).unfinished_operations()
+    assert [record['source'] for record in unfinished] == [str(tmp_path / 'a')]
+
+
+def test_renamed_markers_are_migrated_once(tmp_path):
+    downloads = tmp_path / 'tv'
+    (downloads / 'Show S01E01').mkdir(parents=True)
+    (downloads / 'Show S01E01' / '.renamed').write_text('original name: a\n')
+    (downloads / 'Show.S01E02.720p').mkdir()
+    journal_path = str(tmp_path / 'journal.jsonl')
+    assert OperationsJournal(journal_path).migrate_markers(str(downloads)) == 1
+    reloaded = OperationsJournal(journal_path)
+    assert reloaded.is_processed(str(downloads / 'Show S01E01'))
+    assert not reloaded.is_processed(str(downloads / 'Show.S01E02.720p'))
+    assert reloaded.migrate_markers(str(downloads)) == 0
+
+
+def test_dry_run_migration_is_not_written(tmp_path):
+    (tmp_path / 'tv' / 'Show S01E01').mkdir(parents=True)
+    (tmp_path / 'tv' / 'Show S01E01' / '.renamed').write_text('')
+    journal_path = str(tmp_path / 'journal.jsonl')
+    journal = OperationsJournal(journal_path)
+    assert journal.migrate_markers(str(tmp_path / 'tv'), record=False) == 1
+    assert journal.is_processed(str(tmp_path / 'tv' / 'Show S01E01'))
+    assert not os.path.exists(journal_path)
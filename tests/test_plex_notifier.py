@@ -0,0 +1,108 @@
+import os
+from urllib.parse import parse_qs, urlsplit
+from operation_plan import Plan
+from plex_notifier import PlexNotifier
+
+SECTIONS = b"""<MediaContainer>
+  <Directory key="1" type="movie"><Location path="/data/movies" /></Directory>
+  <Directory key="2" type="show"><Location path="/data/tv" /><Location path="/data/kids" /></Directory>
+</MediaContainer>"""
+
+
+def make_notifier(fake_server, **kwargs):
+    fake_server.routes[('GET', '/library/sections')] = (200, SECTIONS)
+    for key in ('1', '2'):
+        fake_server.routes[('GET', f'/library/sections/{key}/refresh')] = (200, b'')
+    return PlexNotifier(fake_server.url, 'token', **kwargs)
+
+
+def refreshes(fake_server):
+    """Return sorted (section key, refreshed path) of the refresh requests the server got."""
+    sent = []
+    for _, path, _ in fake_server.requests:
+        parts = urlsplit(path)
+        if parts.path.endswith('/refresh'):
+            query = parse_qs(parts.query)
+            assert query['X-Plex-Token'] == ['token']
+            sent.append((parts.path.split('/')[3], query['path'][0]))
+    return sorted(sent)
+
+
+def test_refreshes_each_touched_folder_in_its_section(fake_server):
+    notifier = make_notifier(fake_server)
+    notifier.touch('/data/movies/Heat (1995)')
+    notifier.touch('/data/kids/Bluey/Season 2')
+    notifier.touch('/elsewhere/Unknown')
+    assert notifier.flush(force=True) == 2
+    assert refreshes(fake_server) == [('1', '/data/movies/Heat (1995)'), ('2', '/data/kids/Bluey/Season 2')]
+
+
+def test_nested_folders_are_coalesced(fake_server):
+    notifier = make_notifier(fake_server)
+    for path in ('/data/tv/Lost', '/data/tv/Lost/Season 1', '/data/tv/Lost/Season 2', '/data/tv/Lost'):
+        notifier.touch(path)
+    notifier.flush(force=True)
+    assert refreshes(fake_server) == [('2', '/data/tv/Lost')]
+
+
+def test_flush_waits_for_the_debounce_period(fake_server):
+    notifier = make_notifier(fake_server, debounce_seconds=60)
+    notifier.touch('/data/movies/Heat (1995)')
+    assert notifier.flush() == 0
+    assert fake_server.requests == []
+    assert notifier.flush(force=True) == 1
+
+
+def test_sections_are_listed_once(fake_server):
+    notifier = make_notifier(fake_server)
+    notifier.touch('/data/movies/Heat (1995)')
+    notifier.flush(force=True)
+    notifier.touch('/data/movies/Alien (1979)')
+    notifier.flush(force=True)
+    assert [path for _, path, _ in fake_server.requests].count('/library/sections?X-Plex-Token=token') == 1
+
+
+def test_local_paths_are_mapped_to_plex_paths(fake_server):
+    notifier = make_notifier(fake_server, path_mappings={'/mnt/media/movies': '/data/movies'})
+    notifier.touch('/mnt/media/movies/Heat (1995)')
+    notifier.flush(force=True)
+    assert refreshes(fake_server) == [('1', '/data/movies/Heat (1995)')]
+
+
+def test_failed_refresh_is_counted_but_does_not_raise(fake_server):
+    notifier = make_notifier(fake_server)
+    fake_server.routes[('GET', '/library/sections/1/refresh')] = (500, b'')
+    notifier.touch('/data/movies/Heat (1995)')
+    notifier.touch('/data/tv/Lost/Season 1')
+    assert notifier.flush(force=True) == 1
+
+
+def test_unreachable_sections_keep_nothing_pending(fake_server):
+    notifier = make_notifier(fake_server)
+    fake_server.routes[('GET', '/library/sections')] = (401, b'')
+    notifier.touch('/data/movies/Heat (1995)')
+    assert notifier.flush(force=True) == 0
+    assert refreshes(fake_server) == []
+
+
+def test_collect_touches_movie_and_season_folders_moved_into_a_library(tmp_path, fake_server):
+    movies, tv = str(tmp_path / 'movies'), str(tmp_path / 'tv')
+    plan = Plan()
+    plan.add('rename', str(tmp_path / 'dl' / 'Heat.1995'), os.path.join(movies, 'Heat (1995)'))
+    plan.add('move', str(tmp_path / 'dl' / 'Lost S01E01'), os.path.join(tv, 'Lost', 'Season 1', 'Lost S01E01'))
+    plan.add('rename', str(tmp_path / 'dl' / 'Other'), str(tmp_path / 'duplicates' / 'Other'))
+    plan.add('delete', os.path.join(movies, 'Old (1990)'))
+    notifier = make_notifier(fake_server)
+    notifier.collect(plan, [movies, tv])
+    assert notifier.pending == {os.path.join(movies, 'Heat (1995)'), os.path.join(tv, 'Lost', 'Season 1')}
+
+
+def test_collect_skips_moves_that_failed(tmp_path, fake_server):
+    movies, tv = str(tmp_path / 'movies'), str(tmp_path / 'tv')
+    failed = os.path.join(tv, 'Lost', 'Season 2', 'Lost S02E01')
+    plan = Plan()
+    plan.add('rename', str(tmp_path / 'dl' / 'Heat.1995'), os.path.join(movies, 'Heat (1995)'))
+    plan.add('move', str(tmp_path / 'dl' / 'Lost S02E01'), failed)
+    notifier = make_notifier(fake_server)
+    notifier.collect(plan, [movies, tv], {failed})
+    assert notifier.pending == {os.path.join(movies, 'Heat (1995)')}
@@ -0,0 +1,34 @@
+import os
+from purge_engine import TRASH_DIR_NAME, PurgeEngine
+
+
+def make_release(directory, name, files=3):
+    release = directory / name
+    (release / 'Subs').mkdir(parents=True)
+    for number in range(files):
+        (release / f'part{number}.mkv').write_bytes(b'x' * 1024)
+    return release
+
+
+def test_staged_trees_are_removed(tmp_path):
+    engine = PurgeEngine()
+    engine.stage(str(make_release(tmp_path, 'Old.Release')))
+    assert engine.wait() == 0
+    engine.shutdown()
+    assert os.listdir(tmp_path) == [TRASH_DIR_NAME]
+    assert os.listdir(tmp_path / TRASH_DIR_NAME) == []
+
+
+def test_shutdown_leaves_queued_trees_for_recover(tmp_path):
+    # Five unlinks or rmdirs a second, the first tree is still being removed at shutdown.
+    engine = PurgeEngine(max_workers=1, unlinks_per_second=5)
+    for number in range(3):
+        engine.stage(str(make_release(tmp_path, f'Release.{number}', files=20)))
+    engine.shutdown()
+    assert len(os.listdir(tmp_path / TRASH_DIR_NAME)) == 3
+
+    engine = PurgeEngine()
+    engine.recover([str(tmp_path)])
+    assert engine.wait() == 0
+    engine.shutdown()
+    assert os.listdir(tmp_path / TRASH_DIR_NAME) == []
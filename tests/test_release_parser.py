@@ -0,0 +1,75 @@
+import pytest
+from release_parser import RELEASE_PARSER, ReleaseParser, normalize_title, split_qualifiers
+
+
+@pytest.mark.parametrize('name, title, season, episodes, tag', [
+    ('Lost.S01E02.720p.HDTV.x264-LOL', 'Lost.', 1, (2,), 'S01E02'),
+    ('Lost.S01E01E02.720p.HDTV.x264-LOL', 'Lost.', 1, (1, 2), 'S01E01E02'),
+    ('Lost S01E01-E02 1080p WEB-DL', 'Lost ', 1, (1, 2), 'S01E01E02'),
+    ('the.office.us.s02e03e04e05.HDTV-RLS', 'the.office.us.', 2, (3, 4, 5), 'S02E03E04E05'),
+    ('Lost.S01.E05.720p', 'Lost.', 1, (5,), 'S01E05'),
+    ('Lost.1x02.HDTV-LOL', 'Lost.', 1, (2,), 'S01E02'),
+    ('Lost 1x02x03 720p', 'Lost ', 1, (2, 3), 'S01E02E03'),
+    ('Top.Gear.22x01.1080p', 'Top.Gear.', 22, (1,), 'S22E01'),
+])
+def test_episode_forms(name, title, season, episodes, tag):
+    release = RELEASE_PARSER.parse_episode(name)
+    assert (release.title, release.season, release.episodes, release.air_date) == (title, season, episodes, None)
+    assert RELEASE_PARSER.episode_tag(release) == tag
+
+
+@pytest.mark.parametrize('name, title, air_date', [
+    ('The.Daily.Show.2024.03.15.1080p.WEB.h264-EDITH', 'The.Daily.Show.', '2024-03-15'),
+    ('Jeopardy 2023-11-02 720p-GRP', 'Jeopardy ', '2023-11-02'),
+])
+def test_date_based_episodes(name, title, air_date):
+    release = RELEASE_PARSER.parse(name)
+    assert (release.title, release.season, release.episodes, release.air_date) == (title, None, (), air_date)
+    assert RELEASE_PARSER.episode_tag(release) == air_date
+    # A daily episode has no episode numbers to look up in a season folder.
+    assert RELEASE_PARSER.parse_episode(name) is None
+
+
+@pytest.mark.parametrize('name', ['Show.1920x1080.mkv', 'Heat.1995.1080p.BluRay.x264-GRP', 'Movie.2010.13.45'])
+def test_resolutions_and_years_are_not_episodes(name):
+    assert RELEASE_PARSER.parse_episode(name) is None
+
+
+@pytest.mark.parametrize('name, title, year, quality, group', [
+    ('Heat.1995.1080p.BluRay.x264-GRP', 'Heat', 1995, '1080p', 'GRP'),
+    ('Movie.2010.DTS-HD.MA', 'Movie', 2010, None, None),
+    ('Movie (2010) 2160p WEB-DL', 'Movie ', 2010, '2160p', None),
+])
+def test_movies(name, title, year, quality, group):
+    release = RELEASE_PARSER.parse(name)
+    assert (release.title, release.year, release.quality, release.group) == (title, year, quality, group)
+    assert release.episodes == ()
+
+
+def test_names_without_a_marker_are_not_releases():
+    assert RELEASE_PARSER.parse('Nothing Here') is None
+
+
+def test_results_are_cached():
+    parser = ReleaseParser(cache_size=8)
+    assert parser.parse_many(['Lost.S01E02', 'Lost.S01E02', 'x']) == [parser.parse('Lost.S01E02')] * 2 + [None]
+    assert parser.parse.cache_info().hits == 2
+
+
+@pytest.mark.parametrize('title, key', [
+    ('The Office (US)', 'officeus'), ('Office, The', 'office'), ('Law & Order', 'lawandorder'),
+    ('A.Quiet.Place', 'quietplace'),
+])
+def test_normalize_title(title, key):
+    assert normalize_title(title) == key
+
+
+@pytest.mark.parametrize('title, base, qualifiers', [
+    ('Shameless (US)', 'Shameless', {'us'}),
+    ('Doctor Who 2005', 'Doctor Who', {'2005'}),
+    ('The Office (UK) (2001)', 'The Office', {'uk', '2001'}),
+    ('1923', '1923', set()),
+    ('Taken US', 'Taken', {'us'}),
+])
+def test_split_qualifiers(title, base, qualifiers):
+    assert split_qualifiers(title) == (base, frozenset(qualifiers))
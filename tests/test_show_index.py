@@ -0,0 +1,69 @@
+import pytest
+from show_index import ShowIndex
+
+
+def make_index(*show_names):
+    index = ShowIndex(0.8)
+    for show_name in show_names:
+        index.add(show_name)
+    return index
+
+
+@pytest.mark.parametrize('library_show, show_name', [
+    ('Shameless (UK)', 'Shameless (US)'),
+    ('Being Human (UK)', 'Being Human (US)'),
+    ('Queer as Folk (UK)', 'Queer as Folk (US)'),
+    ('House of Cards (UK)', 'House of Cards (US)'),
+    ('House of Cards (UK)', 'House of Cards US'),
+    ('Doctor Who (1963)', 'Doctor Who 2005'),
+    ('Battlestar Galactica (1978)', 'Battlestar Galactica 2003'),
+    ('Battlestar Galactica (1978)', 'Battlestar Galactca 2003'),
+])
+def test_other_country_or_year_does_not_match(library_show, show_name):
+    assert make_index(library_show).find(show_name) is None
+
+
+@pytest.mark.parametrize('show_name, expected', [
+    ('Shameless (US)', 'Shameless (US)'),
+    ('Shameless US', 'Shameless (US)'),
+    ('shameless uk', 'Shameless (UK)'),
+    ('Doctor Who 2005', 'Doctor Who (2005)'),
+    ('Doctor Who (1963)', 'Doctor Who (1963)'),
+])
+def test_regional_and_remake_pairs_match_their_own_folder(show_name, expected):
+    index = make_index('Shameless (UK)', 'Shameless (US)', 'Doctor Who (1963)', 'Doctor Who (2005)')
+    assert index.find(show_name) == expected
+
+
+def test_name_shared_by_several_folders_does_not_match():
+    index = make_index('Shameless (UK)', 'Shameless (US)', 'Doctor Who (1963)', 'Doctor Who (2005)')
+    assert index.find('Shameless') is None
+    assert index.find('Doctor Who') is None
+    assert index.find('Shamless') is None
+
+
+def test_name_without_qualifier_matches_the_only_folder():
+    index = make_index('Battlestar Galactica (2003)', 'The Office')
+    assert index.find('Battlestar Galactica') == 'Battlestar Galactica (2003)'
+    assert index.find('Office 2005') == 'The Office'
+    assert index.find('Battlestar Galactica (2003)') == 'Battlestar Galactica (2003)'
+
+
+def test_country_must_be_the_same_on_both_sides():
+    assert make_index('Shameless').find('Shameless (US)') is None
+    assert make_index('Shameless (US)').find('Shameless') is None
+    assert make_index('House').find('House UK') is None
+
+
+def test_fuzzy_match_tolerates_spelling():
+    index = make_index('Brooklyn Nine-Nine', 'Battlestar Galactica (2003)')
+    assert index.find('Brooklyn Nine Nyne') == 'Brooklyn Nine-Nine'
+    assert index.find('Battlestar Galactca 2003') == 'Battlestar Galactica (2003)'
+    assert index.find('Battlestar Galactca 1978') is None
+
+
+def test_removed_folder_no_longer_shares_its_name():
+    index = make_index('Doctor Who (1963)', 'Doctor Who (2005)')
+    index.remove('Doctor Who (2005)')
+    assert index.find('Doctor Who') == 'Doctor Who (1963)'
+    assert index.find('Doctor Who (2005)') is None
@@ -0,0 +1,61 @@
+import pytest
+from sonarr import SonarrClient, SonarrError, SonarrSeriesIndex
+
+SERIES = [
+    {'title': 'Doctor Who (2005)', 'path': '/tv/Doctor Who (2005)', 'alternateTitles': [], 'seasons': [1, 2]},
+    {'title': 'Doctor Who', 'path': '/tv/Doctor Who (1963)', 'alternateTitles': [{'title': 'Dr Who'}]},
+    {'title': 'The Office (US)', 'path': 'D:\\TV\\The Office (US)', 'alternateTitles': []},
+    {'title': 'Battlestar Galactica (2003)', 'path': '/tv/Battlestar Galactica (2003)', 'alternateTitles': []},
+    {'title': 'Battlestar Galactica (1978)', 'path': '/tv/Battlestar Galactica (1978)', 'alternateTitles': []},
+    {'title': 'Brooklyn Nine-Nine (2013)', 'path': '/tv/Brooklyn Nine-Nine', 'alternateTitles': []},
+]
+
+
+def make_index(fake_server, series, tmp_path, ttl=3600):
+    fake_server.routes[('GET', '/api/v3/series')] = (200, series)
+    return SonarrSeriesIndex(SonarrClient(fake_server.url, 'secret'), str(tmp_path / 'sonarr.json'), ttl)
+
+
+def test_client_sends_the_api_key(fake_server):
+    fake_server.routes[('GET', '/api/v3/series')] = (200, SERIES)
+    assert SonarrClient(fake_server.url, 'secret').get_series() == SERIES
+    method, path, headers = fake_server.requests[0]
+    assert (method, path, headers['X-Api-Key']) == ('GET', '/api/v3/series', 'secret')
+
+
+def test_client_raises_on_http_errors(fake_server):
+    fake_server.routes[('GET', '/api/v3/series')] = (401, b'')
+    with pytest.raises(SonarrError):
+        SonarrClient(fake_server.url, 'wrong').get_series()
+
+
+@pytest.mark.parametrize('order', [SERIES, SERIES[::-1]])
+def test_exact_titles_win_over_titles_without_year(fake_server, tmp_path, order):
+    index = make_index(fake_server, order, tmp_path)
+    assert index.resolve('Doctor Who') == 'Doctor Who (1963)'
+    assert index.resolve('Doctor Who 2005') == 'Doctor Who (2005)'
+    assert index.resolve('Dr. Who') == 'Doctor Who (1963)'
+    assert index.resolve('the office us') == 'The Office (US)'
+
+
+@pytest.mark.parametrize('order', [SERIES, SERIES[::-1]])
+def test_title_without_year_of_several_series_is_dropped(fake_server, tmp_path, order):
+    index = make_index(fake_server, order, tmp_path)
+    assert index.resolve('Battlestar Galactica') is None
+    assert index.resolve('Battlestar Galactica 1978') == 'Battlestar Galactica (1978)'
+    assert index.resolve('Brooklyn Nine Nine') == 'Brooklyn Nine-Nine'
+
+
+def test_series_list_is_fetched_once_while_the_cache_is_fresh(fake_server, tmp_path):
+    make_index(fake_server, SERIES, tmp_path).load()
+    index = make_index(fake_server, SERIES, tmp_path)
+    assert index.resolve('Doctor Who') == 'Doctor Who (1963)'
+    assert len(fake_server.requests) == 1
+
+
+def test_expired_cache_is_used_when_sonarr_fails(fake_server, tmp_path):
+    make_index(fake_server, SERIES, tmp_path).load()
+    index = make_index(fake_server, SERIES, tmp_path, ttl=-1)
+    fake_server.routes[('GET', '/api/v3/series')] = (500, b'')
+    assert index.resolve('Doctor Who 2005') == 'Doctor Who (2005)'
+    assert len(fake_server.requests) == 2
@@ -0,0 +1,44 @@
+import errno
+import os
+from pathlib import Path
+import pytest
+from completed_downloads_manager import TVShowProcessor
+from config_handler import Config
+from operations_journal import OperationsJournal
+
+
+@pytest.fixture
+def tv_config(config_data, tmp_path):
+    config_data['settings']['tv_shows'].update(move_to_library=True,
+                                               library_index_cache=str(tmp_path / 'library_index.json'))
+    library = Path(config_data['media_libraries']['tv_shows']['adult'])
+    (library / 'Lost' / 'Season 1' / 'Lost S01E01').mkdir(parents=True)
+    release = Path(config_data['download_directories']['complete']['tv_shows']) / 'Lost.S01E02.720p.HDTV'
+    release.mkdir()
+    (release / 'lost.s01e02.720p.mkv').write_bytes(b'episode')
+    return Config.from_dict(config_data)
+
+
+def test_failed_library_move_is_not_recorded_in_the_library_index(tv_config):
+    processor = TVShowProcessor(tv_config, journal=OperationsJournal())
+    apply = processor.executor.apply
+
+    def failing_apply(operation):
+        if operation.action == 'move':
+            raise OSError(errno.EIO, 'Input/output error')
+        return apply(operation)
+
+    processor.executor.apply = failing_apply
+    processor.process_downloaded_tv_shows()
+    processor.move_engine.shutdown()
+    release_path = os.path.join(tv_config.download_directories.complete.tv_shows, 'Lost S01E02')
+    assert os.path.isdir(release_path)
+    assert not processor.library_index.has_episode('Lost', 1, 2)
+
+    # The next run moves the episode into the library instead of treating it as a duplicate.
+    processor = TVShowProcessor(tv_config, journal=OperationsJournal())
+    processor.process_downloaded_tv_shows()
+    processor.move_engine.shutdown()
+    assert os.path.isdir(os.path.join(tv_config.media_libraries.tv_shows.adult, 'Lost', 'Season 1', 'Lost S01E02'))
+    assert not os.path.exists(release_path)
+    assert os.listdir(tv_config.download_directories.duplicate.tv_shows) == []